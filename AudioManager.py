@@ -1,20 +1,174 @@
-import pygame
+from ChainMixer import ChainMixer, MIXER_OUTPUTS
+from ChainProfiler import ChainProfiler
+from EditLog import EditLog, ENABLE_PARAM
 from Effect import Effect
 from pedalboard import Pedalboard, Compressor, Chorus, Delay, Reverb, Gain, load_plugin
-from pedalboard.io import AudioFile, AudioStream
+from Hardware import PiHardware
 from IOManager import IOManager
+from NumpyEffects import Flanger, Echo, Phaser, Freeverb, makeBoard
+from ParamControl import ParamControl
+from LiveStream import LiveStream, LIVE_SAMPLERATE, LIVE_BUFFER_SIZE
+from Looper import Looper
+from Playback import PlaybackService, Take, TakeWriter
+from RenderCache import RenderCache, RENDER_CACHE_BYTES
+from SampleStore import SampleStore
+from WavFile import openWav, WAV_RELEASE_FRAMES
+from StreamNegotiator import StreamNegotiator
+from Tempo import TempoSync, TEMPO_PARAMS
+from Telemetry import metrics, RENDER_BUCKETS
+import logging
+import threading
 import time
 
-# from playsound import playsound
+log = logging.getLogger(__name__)
+
+# Processing rate until the StreamNegotiator has picked one
+SAMPLERATE = 44100.0
+
+# Smallest block applyEffects renders in; larger ones are used if the
+# chain can't keep up
+STREAM_BLOCK_SIZE = 8192
+
+# Plugin class for each Effect name: pedalboard's, or a NumPy processor
+PLUGIN_TYPES = {
+	"Chorus": Chorus,
+	"Delay": Delay,
+	"Phasor": Phaser,
+	"Reverb": Reverb,
+	"Compressor": Compressor,
+	"Flanger": Flanger,
+	"Echo": Echo,
+	"Freeverb": Freeverb,
+}
+
+def createPlugin(effect):
+	# A fresh plugin with all of the effect's current parameter values
+	plugin = PLUGIN_TYPES[effect.getName()]()
+	for param_i in range(len(effect.getParamNames())):
+		setattr(plugin, effect.getParamNameAt(param_i), effect.getParamValueAt(param_i))
+	return plugin
+
+def buildBoard(effects):
+	# Standalone board for a list of Effects (the batch renderer's workers)
+	plugins = [Gain(gain_db=0)]
+	for effect in effects:
+		if effect.getEnable() and effect.getName() in PLUGIN_TYPES:
+			plugins.append(createPlugin(effect))
+	return makeBoard(plugins)
+
+def effectsFromPreset(preset):
+	# Fresh Effects set up from a preset ({effect name: state}, as getPreset())
+	effects = []
+	for effect_name, state in preset.items():
+		effect = Effect(effect_name)
+		effect.setState(state)
+		effects.append(effect)
+	return effects
+
+class Chain:
+	# One instrument's own effect chain, run beside the main one: its Effects
+	# and board, the input device channels it takes and the output bus
+	# channels it feeds
+	def __init__(self, name, effects, in_channels, out_channels):
+		self.name = name
+		self.effects = effects
+		self.in_channels = list(in_channels)
+		self.out_channels = list(out_channels)
+		self.board = buildBoard(effects) if effects is not None else None
+	
+	def __str__(self):
+		return f"<Chain object>"
+	
+	def getEffect(self, effect_name):
+		return next(effect for effect in self.effects if effect.getName() == effect_name)
+	
+	def rebuild(self):
+		# Chains aren't tweaked from the pedal's menus, so a change rebuilds
+		# the board and publishes it with one assignment
+		board = buildBoard(self.effects)
+		board.reset()
+		self.board = board
+
+class Scene:
+	# A preset with its board already built: plugin objects configured and
+	# chained, so switching to it is an assignment rather than a rebuild
+	def __init__(self, preset):
+		self.preset = preset
+		self.plugin_map = {}
+		self.applied_params = {}
+		self.board = None
+		# Set when the scene's plugins were tweaked while it was active
+		self.dirty = False
+	
+	def __str__(self):
+		return f"<Scene object>"
+
 class AudioManager:
-	def __init__(self, effects_names):
+	def __init__(self, effects_names, render_cache_bytes=RENDER_CACHE_BYTES, hardware=None, save_renders=True):
+		if hardware is None:
+			hardware = PiHardware()
+		self.hardware = hardware
 		self.effects_array = [Effect(name) for name in effects_names]
-		self.effects_board = Pedalboard([])
+		# name -> Effect, kept in step with effects_array by addEffect/removeEffect
+		self.effects_index = {effect.getName(): effect for effect in self.effects_array}
+		# Undo/redo of the param and enable changes made from the menus
+		self.edit_log = EditLog()
+		self.render_cache = RenderCache(max_bytes=render_cache_bytes)
+		self.sample_store = SampleStore()
+		
+		# Previews are kept on disk (in the render cache) only if save_renders
+		self.save_renders = save_renders
+		self.saving = set()
+		
+		# Persistent plugin graph: one plugin object per enabled Effect, kept
+		# alive between updates so delay lines and reverb tails survive tweaks
+		self.gain_plugin = Gain(gain_db=0)
+		self.plugin_map = {}
+		self.applied_params = {}
+		self.effects_board = Pedalboard([self.gain_plugin])
+		self.active_scene = None
+		# A board for the audio thread to reset before its next block
+		self.pending_reset = None
+		self.live_stream = None
+		
+		# While streaming, param changes glide in on the audio thread
+		self.param_control = ParamControl()
+		
+		# Tapped tempo, and which effects' delay time / LFO rate follow it
+		self.tempo = TempoSync()
+		
+		# Extra instrument chains, run in parallel beside the main one (the
+		# menus' effects, from input channel 0 to every bus channel)
+		self.chains = []
+		self.main_chain = Chain("main", None, [0], range(MIXER_OUTPUTS))
+		self.mixer = ChainMixer()
+		
+		# Records, overdubs and plays back loops of the live stream
+		self.looper = Looper(sample_rate=LIVE_SAMPLERATE)
+		
+		# Board rebuild and preview render timings, for the MetricsExporter.
+		# updateBoard runs on the Controller's audio executor once the menu is
+		# up, and on the warm-up thread before that; an update made elsewhere
+		# at the same moment may go uncounted, which is accepted.
+		self.board_update_seconds = metrics.histogram("board_update_seconds", "Time to bring the effects board in line with the Effects")
+		self.render_seconds = metrics.histogram("render_seconds", "Time to render a preview", RENDER_BUCKETS)
+		self.render_realtime_factor = metrics.gauge("render_realtime_factor", "Seconds of audio rendered per second, last preview")
+		self.render_cache_hits = metrics.counter("render_cache_hits_total", "Previews played from the render cache")
 		
-		self.io_manager = IOManager()
+		# Per-plugin CPU timing, off unless asked for. The live stream and the
+		# previews run on different threads, so each has its own profiler.
+		self.profiler = ChainProfiler()
+		self.preview_profiler = ChainProfiler()
+		self.profiling = False
+		
+		self.io_manager = IOManager(hardware.audio)
+		
+		# Chooses processing rates and block sizes from the source, the
+		# devices and the chain's measured cost
+		self.negotiator = StreamNegotiator(self.io_manager)
+		self.render_config = None
+		self.stream_config = None
 		
-		input_device_name = self.io_manager.getCurrentIO("in")
-		output_device_name = self.io_manager.getCurrentIO("out")
 		# self.stream_obj = AudioStream(input_device_name=output_device_name, output_device_name=output_device_name)
 		
 		# input_devices
@@ -25,102 +179,556 @@ class AudioManager:
 		
 		self.audiostream_enabled = False
 		
-		print("Successfully initialized the AudioManager")
+		# Previews play from memory through one long-lived output stream. The
+		# device is looked up when it is first opened, not while booting.
+		self.playback = PlaybackService(hardware.audio, lambda: self.io_manager.getCurrentIO("out"), SAMPLERATE)
+		
+		log.info("Successfully initialized the AudioManager")
 		
 		
 	def __str__(self):
 		return f"<AudioManager object>"
 	
-	def isEffectParam(self, check_str, effect_index):
-		isParam = any(sub_str in check_str for sub_str in self.effects_array[effect_index].getParamNames())
-		return isParam
+	def isEffectParam(self, param_index, effect_index):
+		# Whether a row of the effect's modify screen (less the title and
+		# enable rows) is one of its parameters
+		return 0 <= param_index < len(self.effects_array[effect_index].getParamNames())
 	
 	def nextEffectParam(self, effect_index, param_index):
-		self.effects_array[effect_index].nextParamValue(param_index)
+		effect = self.effects_array[effect_index]
+		before = effect.param_indices[param_index]
+		effect.nextParamValue(param_index)
+		self.edit_log.record(effect_index, param_index, before, effect.param_indices[param_index])
 		
 	def getEffectsArray(self):
 		return self.effects_array
 		
 	def enableDisableEffect(self, effect_num, en_dis):
+		effect = self.effects_array[effect_num]
+		before = effect.getEnable()
 		match en_dis:
 			case "enable":
-				self.effects_array[effect_num].setEnable(True)
+				effect.setEnable(True)
 			case "disable":
-				self.effects_array[effect_num].setEnable(False)
+				effect.setEnable(False)
+		if effect.getEnable() != before:
+			self.edit_log.record(effect_num, ENABLE_PARAM, before, effect.getEnable())
+	
+	def undoEdits(self, steps=1):
+		# Put back the last steps param/enable changes, all at once; the
+		# caller updates the board once afterwards. Returns how many.
+		return self.replayEdits(self.edit_log.undo(steps))
+	
+	def redoEdits(self, steps=1):
+		return self.replayEdits(self.edit_log.redo(steps))
+	
+	def replayEdits(self, edits):
+		count = 0
+		for effect_index, param_index, value in edits:
+			effect = self.effects_array[effect_index]
+			if param_index == ENABLE_PARAM:
+				effect.setEnable(bool(value))
+			else:
+				effect.param_indices[param_index] = value
+			count = count + 1
+		return count
 		
-	def isEffect(self, effect_name):
-		i = 0
-		while i < len(self.effects_array) and self.effects_array[i].getName() != effect_name:
-			i = i + 1
+	def getPreset(self):
+		# Effect name -> enabled flag and param_indices, for every effect
+		return {effect.getName(): effect.getState() for effect in self.effects_array}
+	
+	def setPreset(self, preset):
+		# Checked in full first, so a bad state (ValueError) changes nothing
+		for effect_name, state in preset.items():
+			if effect_name in self.effects_index:
+				Effect(effect_name).setState(state)
+		# The history covers edits since the last preset change
+		self.edit_log.clear()
+		self.leaveScene()
+		for effect_name, state in preset.items():
+			if effect_name in self.effects_index:
+				self.effects_index[effect_name].setState(state)
+		self.updateBoard()
+	
+	def buildScene(self, preset):
+		# Prebuild the board for a preset without touching the live one
+		# ValueError for a malformed preset. Every state is checked, disabled
+		# ones too, since switchScene applies them all.
+		if not isinstance(preset, dict):
+			raise ValueError("a preset maps effect names to their states")
+		scene = Scene(preset)
+		plugins = [self.gain_plugin]
+		for effect in self.effects_array:
+			effect_name = effect.getName()
+			state = preset.get(effect_name)
+			if state is None:
+				continue
+			scene_effect = Effect(effect_name)
+			scene_effect.setState(state)
+			if not scene_effect.getEnable() or effect_name not in PLUGIN_TYPES:
+				continue
+			plugin = createPlugin(scene_effect)
+			scene.plugin_map[effect_name] = plugin
+			scene.applied_params[effect_name] = [scene_effect.getParamValueAt(i) for i in range(len(scene_effect.getParamNames()))]
+			plugins.append(plugin)
+		scene.board = makeBoard(plugins)
+		return scene
+	
+	def switchScene(self, scene):
+		# Make a prebuilt scene current. The board is published with a single
+		# assignment; nothing is constructed.
+		self.edit_log.clear()
+		for effect_name, state in scene.preset.items():
+			if effect_name in self.effects_index:
+				self.effects_index[effect_name].setState(state)
 		
-		if i >= len(self.effects_array):
-			return False
+		# Copies, so toggles made later don't change the scene itself
+		self.plugin_map = dict(scene.plugin_map)
+		self.applied_params = {name: list(applied) for name, applied in scene.applied_params.items()}
+		if scene.dirty:
+			# Tweaked while it was last active: put the preset's values back
+			for name in self.applied_params:
+				self.applied_params[name] = [None] * len(self.applied_params[name])
+		
+		# Glides still running belong to the old board's plugins. The stream
+		# may still be playing them, so it sets their final values itself.
+		self.param_control.settle(queue=self.audiostream_enabled)
+		
+		# Don't let audio from the last time this scene played leak out. The
+		# live stream may be running this board already (the same scene again),
+		# so it is reset there, before the block that picks it up.
+		if self.audiostream_enabled:
+			self.pending_reset = scene.board
 		else:
-			return True
+			scene.board.reset()
+		self.active_scene = scene
+		self.effects_board = scene.board
+		if scene.dirty:
+			# Putting the preset back marks it dirty again; it is clean after
+			self.updateBoard()
+			scene.dirty = False
+		self.applyTempo()
+	
+	def leaveScene(self):
+		# The plugins stay in use but will no longer match the scene's preset,
+		# so it is put back the next time it is switched to
+		if self.active_scene is not None:
+			self.active_scene.dirty = True
+			self.active_scene = None
+	
+	def isEffect(self, effect_name):
+		return effect_name in self.effects_index
 	
 	def getEffectObj(self, effect_name):
-		i = 0
-		while i < len(self.effects_array) and self.effects_array[i].getName() != effect_name:
-			print(self.effects_array[i].getName())
-			print(effect_name)
-			print(i)
-			i = i + 1
-		
-		return self.effects_array[i]
+		return self.effects_index[effect_name]
+	
+	def addEffect(self, effect_name):
+		effect = Effect(effect_name)
+		self.effects_array.append(effect)
+		self.effects_index[effect_name] = effect
+		return effect
+	
+	def removeEffect(self, effect_name):
+		effect = self.effects_index.pop(effect_name)
+		# Drop its plugin from the board before it leaves effects_array
+		effect.setEnable(False)
+		self.updateBoard()
+		self.effects_array.remove(effect)
 		
 	def updateBoard(self):
-		self.effects_board = Pedalboard([
-		Gain(gain_db=0),
-		])
+		# Bring the board in line with the Effect objects, touching only what
+		# changed: toggles insert/remove a single plugin, tweaks set one attribute
+		start = time.perf_counter()
+		topology_changed = False
 		
-		effect_num = 1
-		
-		for effect in self.effects_array:
-			if effect.getEnable():
-				match effect.getName():
-					case "Chorus":
-						self.effects_board.append(Chorus())
-					case "Delay":
-						self.effects_board.append(Delay())
-					case "Phasor":
-						self.effects_board.append(Phasor())
-					case "Reverb":
-						self.effects_board.append(Reverb())
-					case "Compressor":
-						self.effects_board.append(Compressor())
+		try:
+			for effect in self.effects_array:
+				effect_name = effect.getName()
+				plugin = self.plugin_map.get(effect_name)
 				
-				for param_i in range(len(effect.getParamNames())):
-					param_name = effect.getParamNameAt(param_i)
-					param_val = effect.getParamValueAt(param_i)
-					self.effects_board[effect_num]
-					exec("self.effects_board[effect_num]." + param_name + " = " + str(param_val))
-				effect_num = effect_num + 1
-
-	def applyEffects(self, audio_file):
-		samplerate = 44100.0
-		with AudioFile(audio_file).resampled_to(samplerate) as f:
-			audio_in = f.read(f.frames)
+				if effect.getEnable():
+					if plugin is None:
+						if effect_name not in PLUGIN_TYPES:
+							continue
+						plugin = PLUGIN_TYPES[effect_name]()
+						self.plugin_map[effect_name] = plugin
+						self.applied_params[effect_name] = [None] * len(effect.getParamNames())
+						try:
+							self.applyEffectParams(effect, plugin)
+						except ValueError:
+							# A value the plugin rejects: it isn't added, so
+							# the next update tries the effect afresh
+							del self.plugin_map[effect_name]
+							del self.applied_params[effect_name]
+							raise
+						topology_changed = True
+					else:
+						self.applyEffectParams(effect, plugin)
+				elif plugin is not None:
+					self.param_control.release(plugin)
+					del self.plugin_map[effect_name]
+					del self.applied_params[effect_name]
+					topology_changed = True
+		finally:
+			# Changes made before a rejected value still reach the board
+			if topology_changed:
+				self.swapBoard()
+			self.board_update_seconds.observe(time.perf_counter() - start)
+	
+	def applyEffectParams(self, effect, plugin):
+		applied = self.applied_params[effect.getName()]
+		synced_param = self.tempo.getSyncedParam(effect.getName())
+		for param_i in range(len(effect.getParamNames())):
+			param_val = effect.getParamValueAt(param_i)
+			if effect.getParamNameAt(param_i) == synced_param:
+				# The tempo sets this one; a new plugin starts on the beat
+				if applied[param_i] is None:
+					setattr(plugin, synced_param, self.tempo.getValue(effect.getName()))
+				applied[param_i] = param_val
+				continue
+			if applied[param_i] != param_val:
+				if self.audiostream_enabled and applied[param_i] is not None:
+					# Live: the audio thread ramps to it instead of jumping
+					self.param_control.setTarget(plugin, effect.getParamNameAt(param_i), param_val)
+				else:
+					setattr(plugin, effect.getParamNameAt(param_i), param_val)
+				applied[param_i] = param_val
+				# The active scene's plugins no longer match its preset
+				if self.active_scene is not None:
+					self.active_scene.dirty = True
+	
+	def swapBoard(self):
+		# Build the new chain from the existing plugin objects (in effects_array
+		# order) and publish it with a single assignment, so the live stream
+		# (which picks up self.effects_board every block) never sees a
+		# half-edited board
+		plugins = [self.gain_plugin]
+		for effect in self.effects_array:
+			plugin = self.plugin_map.get(effect.getName())
+			if plugin is not None:
+				plugins.append(plugin)
 		
-		audio_out = self.effects_board(audio_in, samplerate)
-		audio_out_file = audio_file[:audio_file.find('.')] + 'processed-output' + str(time.time()) + '.wav'
+		self.effects_board = makeBoard(plugins)
 
-		with AudioFile(audio_out_file, 'w', samplerate, audio_out.shape[0]) as f:
-			f.write(audio_out)
-			
-		# for playing note.wav file
-		pygame.mixer.init()
-		pygame.mixer.music.load(audio_out_file)
-		pygame.mixer.music.play()
-		# print('playing sound using  playsound')
-		# playsound(audio_out_file)
-		
-		return audio_out
-						
-	def startAudioStream(self, input_dev, output_dev):
-		self.stream_obj = AudioStream(input_dev, output_dev)
-		self.stream.plugins = self.effects_board
-		self.stream_obj.run()
+	def applyEffects(self, audio_file, block_size=STREAM_BLOCK_SIZE, save=None):
+		# Render and play a preview. Returns the take straight away: it renders
+		# on a thread of its own, no more than a ring ahead of playback, and
+		# saving to the render cache follows it on another.
+		requested_at = time.perf_counter()
+		# The file's own rate if the output plays it, so matching files aren't
+		# resampled; larger blocks or a lower rate if the chain is too slow
+		# The preview's own board is probed, never the one the live stream
+		# is running
+		source_rate = self.sample_store.getSourceRate(audio_file)
+		board = self.buildPreviewBoard()
+		self.render_config = self.negotiator.negotiateRender(board, self.negotiator.getChainKey(self.effects_array),
+			source_rate, block_size=block_size)
+		samplerate = self.render_config["sample_rate"]
+		block_size = self.render_config["block_size"]
+		self.playback.setSampleRate(samplerate)
+		if save is None:
+			save = self.save_renders
+		
+		# Repeat previews of the same file and settings play straight from the cache
+		cache_key = self.render_cache.getKey(audio_file, samplerate, self.effects_array, self.tempo)
+		cached_file = self.render_cache.lookup(cache_key)
+		if cached_file is not None:
+			cached = openWav(cached_file)
+			take = Take(cached.num_channels, cached.frames, requested_at)
+			self.playback.play(take)
+			self.render_cache_hits.inc()
+			threading.Thread(target=self.readTake, args=(cached, take, block_size),
+				name="PreviewRender", daemon=True).start()
+			return take
+		
+		samples = self.sample_store.getSamples(audio_file, samplerate)
+		take = Take(samples.shape[0], samples.shape[1], requested_at)
+		self.playback.play(take)
+		if save and cache_key not in self.saving:
+			self.saving.add(cache_key)
+			writer = TakeWriter(take, self.render_cache.getPartialPath(cache_key), samplerate, block_size,
+				lambda saved: self.finishSave(cache_key, saved))
+			writer.start()
+		threading.Thread(target=self.renderTake, args=(samples, take, samplerate, block_size, board),
+			name="PreviewRender", daemon=True).start()
+		return take
+	
+	def finishSave(self, cache_key, saved):
+		if saved:
+			self.render_cache.store(cache_key)
+		self.saving.discard(cache_key)
+	
+	def renderTake(self, samples, take, samplerate, block_size, board):
+		# Block by block into the take, so playback can follow right behind.
+		# The board is reset once and then run with reset=False, so effect
+		# state carries across blocks. Stops early if nothing is reading.
+		render_seconds = 0.0
+		try:
+			board = self.getProcessingBoard(board)
+			board.reset()
+			for start in range(0, samples.shape[1], block_size):
+				block_start = time.perf_counter()
+				audio_out = board(samples[:, start:start + block_size], samplerate, reset=False)
+				render_seconds = render_seconds + time.perf_counter() - block_start
+				if not take.write(audio_out):
+					return
+		except Exception as e:
+			log.error("Couldn't render the preview: %s", e)
+			return
+		finally:
+			take.finish()
+		# Time spent in the board, not waiting on playback
+		self.render_seconds.observe(render_seconds)
+		if render_seconds > 0:
+			self.render_realtime_factor.set(samples.shape[1] / samplerate / render_seconds)
+	
+	def readTake(self, cached, take, block_size):
+		# A cached render into the take, released from memory as it goes
+		released = 0
+		try:
+			with cached:
+				for start in range(0, cached.frames, block_size):
+					if not take.write(cached.read(start, block_size)):
+						return
+					if start - released >= WAV_RELEASE_FRAMES:
+						cached.release(released, start)
+						released = start
+		except Exception as e:
+			log.error("Couldn't read the cached preview: %s", e)
+		finally:
+			take.finish()
+	
+	def preloadSamples(self, audio_files):
+		# Decode the demo/backing files (resampled only if the output can't play
+		# their rate) before they are first previewed
+		for audio_file in audio_files:
+			source_rate = self.sample_store.getSourceRate(audio_file)
+			self.sample_store.getSamples(audio_file, self.negotiator.pickRenderRate(source_rate))
+	
+	def buildPreviewBoard(self):
+		# A board of the preview's own, set up like the live one. Renders
+		# reset the board and run it from another thread, so they never touch
+		# the plugins the live stream is playing through.
+		plugins = [Gain(gain_db=0)]
+		for effect in self.effects_array:
+			if effect.getEnable() and effect.getName() in PLUGIN_TYPES:
+				plugin = createPlugin(effect)
+				synced_param = self.tempo.getSyncedParam(effect.getName())
+				if synced_param is not None:
+					setattr(plugin, synced_param, self.tempo.getValue(effect.getName()))
+				plugins.append(plugin)
+		return makeBoard(plugins)
+	
+	def startAudioStream(self, input_dev=None, output_dev=None, sample_rate=None, buffer_size=None):
+		# Non-blocking: the stream runs on its own thread. Settings not given
+		# come from the device registry's lowest-latency configuration, with
+		# the buffer grown (or the rate lowered) until the chain keeps up.
+		if input_dev is None:
+			input_dev = self.io_manager.getCurrentIO("in")
+		if output_dev is None:
+			output_dev = self.io_manager.getCurrentIO("out")
+		
+		# Stopped first, so the chain can be measured while nothing else runs it
+		self.stopAudioStream()
+		self.stream_config = None
+		num_input_channels = 1 + max(max(chain.in_channels) for chain in [self.main_chain] + self.chains)
+		if sample_rate is None or buffer_size is None:
+			self.stream_config = self.negotiator.negotiateStream(self.getStreamBoard(), self.getStreamChainKey(),
+				sample_rate or LIVE_SAMPLERATE, num_input_channels)
+			sample_rate = self.stream_config["sample_rate"]
+			if buffer_size is None:
+				buffer_size = self.stream_config["buffer_size"]
+		
+		self.param_control.clear()
+		self.looper.prepare(sample_rate, buffer_size, num_input_channels)
+		self.looper.startSaver()
+		self.live_stream = LiveStream(self, self.hardware.audio, input_dev, output_dev, sample_rate, buffer_size,
+			num_input_channels)
+		# Set first: a stream that fails straight away clears it again
+		self.audiostream_enabled = True
+		self.live_stream.start()
 		
 	def stopAudioStream(self):
-		stream_obj.close()
+		if self.live_stream is not None:
+			self.live_stream.stop()
+			log.info("Live stream stats: %s", self.live_stream.getStats())
+			self.live_stream = None
+		self.looper.close()
+		self.audiostream_enabled = False
+		self.param_control.settle()
+		self.takePendingReset()
+	
+	def takePendingReset(self):
+		# Audio thread at the start of a block, or once it has stopped
+		board = self.pending_reset
+		if board is not None:
+			self.pending_reset = None
+			board.reset()
+	
+	def streamFailed(self):
+		# On the stream thread once LiveStream.run has died: nothing runs the
+		# glides any more, so edits go straight to the plugins again and the
+		# ones in flight land now. A target set just before the flag drops
+		# lands at the next stopAudioStream.
+		self.audiostream_enabled = False
+		self.param_control.settle()
+		self.takePendingReset()
+	
+	def pressLooper(self):
+		# Record, play, overdub, play, ...; the looper runs on the live
+		# stream, so that is started first if it isn't running
+		if not self.audiostream_enabled:
+			self.startAudioStream()
+		return self.looper.press()
+	
+	def stopLooper(self):
+		return self.looper.stop()
+	
+	def clearLooper(self):
+		return self.looper.clear()
+	
+	def setLiveParam(self, plugin, param_name, value):
+		# Set straight away; while streaming, on the audio thread at the
+		# start of the next block. Either way nothing is rebuilt or reset.
+		if self.audiostream_enabled:
+			self.param_control.setTarget(plugin, param_name, value, glide_seconds=0)
+		else:
+			setattr(plugin, param_name, value)
+	
+	def applyTempo(self):
+		# Put every synced parameter on the beat, from the tempo tables
+		for effect_name in self.tempo.synced:
+			plugin = self.plugin_map.get(effect_name)
+			if plugin is not None:
+				self.setLiveParam(plugin, self.tempo.getSyncedParam(effect_name), self.tempo.getValue(effect_name))
+	
+	def tapTempo(self, tapped_at=None):
+		# A tap on the tempo button; returns the BPM once it is known
+		bpm = self.tempo.tap(tapped_at)
+		if bpm is not None:
+			self.applyTempo()
+		return bpm
+	
+	def setTempo(self, bpm):
+		self.tempo.setBpm(bpm)
+		self.applyTempo()
+	
+	def nextTempoDivision(self):
+		division = self.tempo.nextDivision()
+		self.applyTempo()
+		return division
+	
+	def setTempoSync(self, effect_name, synced):
+		# Follow the tempo, or go back to the effect's own setting
+		self.tempo.setSynced(effect_name, synced)
+		plugin = self.plugin_map.get(effect_name)
+		if synced:
+			self.applyTempo()
+		elif plugin is not None:
+			effect = self.effects_index[effect_name]
+			param_i = effect.getParamNames().index(TEMPO_PARAMS[effect_name][0])
+			self.setLiveParam(plugin, effect.getParamNameAt(param_i), effect.getParamValueAt(param_i))
+	
+	def automateParam(self, effect_name, param_name, rate_hz, depth):
+		# LFO on a live plugin parameter (depth either side of its value);
+		# rate_hz 0 stops it. Only runs while the audio stream is on.
+		plugin = self.plugin_map.get(effect_name)
+		if plugin is None:
+			return False
+		self.param_control.setLfo(plugin, param_name, rate_hz, depth)
+		# The LFO moves the scene's plugin off its preset value
+		if self.active_scene is not None:
+			self.active_scene.dirty = True
+		return True
+	
+	def addChain(self, chain_name, preset, in_channels, out_channels=None):
+		# A chain with its own effects (a preset, as getPreset() returns)
+		# from in_channels of the input device, summed into out_channels of
+		# the output bus (all of them by default)
+		if out_channels is None:
+			out_channels = range(MIXER_OUTPUTS)
+		chain = Chain(chain_name, effectsFromPreset(preset), in_channels, out_channels)
+		self.chains.append(chain)
+		self.mixer.setChains([self.main_chain] + self.chains)
+		return chain
+	
+	def getChain(self, chain_name):
+		return next(chain for chain in self.chains if chain.name == chain_name)
+	
+	def updateChain(self, chain_name):
+		# Apply changes made to a chain's Effects
+		self.getChain(chain_name).rebuild()
+	
+	def removeChain(self, chain_name):
+		self.chains.remove(self.getChain(chain_name))
+		self.mixer.setChains([self.main_chain] + self.chains)
+	
+	def getStreamBoard(self):
+		# What the live stream runs each block: the main board alone, or with
+		# extra chains, the mixer running them all
+		board = self.getProcessingBoard()
+		if not self.chains:
+			return board
+		self.main_chain.board = board
+		return self.mixer
+	
+	def getStreamChainKey(self):
+		# What the stream's measured load is cached on: the main chain's
+		# effects and every extra chain's
+		return (self.negotiator.getChainKey(self.effects_array),) + tuple(
+			(chain.name, self.negotiator.getChainKey(chain.effects)) for chain in self.chains)
+	
+	def getChainStats(self):
+		# Per-chain load and worker, or None without extra chains
+		if not self.chains:
+			return None
+		return self.mixer.getStats()
+	
+	def setProfiling(self, enabled):
+		# Time each plugin of the board from now on (or stop); numbers from
+		# an earlier run are dropped when it starts again
+		if enabled and not self.profiling:
+			self.profiler.clear()
+			self.preview_profiler.clear()
+		self.profiling = enabled
+	
+	def getProcessingBoard(self, board=None):
+		# The board to run a block through: the live one, or a preview board
+		# if given. While profiling, the live profiler or the preview one,
+		# pointed at it.
+		profiler = self.profiler
+		if board is None:
+			board = self.effects_board
+		else:
+			profiler = self.preview_profiler
+		if self.profiling:
+			return profiler.profile(board)
+		return board
+	
+	def getPluginStats(self, preview=False):
+		# plugin type name -> CPU% percentiles of the live stream (or the
+		# previews), or None when not profiling
+		if not self.profiling:
+			return None
+		if preview:
+			return self.preview_profiler.getStats()
+		return self.profiler.getStats()
+	
+	def getCpuSummary(self):
+		# The LCD's CPU% line: the live stream's heaviest plugins while it
+		# runs, the previews' otherwise
+		if self.audiostream_enabled:
+			return self.profiler.getCpuSummary()
+		return self.preview_profiler.getCpuSummary()
 	
+	def getStreamStats(self):
+		# Latency, block timing percentiles and xrun counts of the live stream
+		if self.live_stream is None:
+			return None
+		stats = self.live_stream.getStats()
+		stats["params"] = self.param_control.getStats()
+		stats["negotiated"] = self.stream_config
+		stats["plugins"] = self.getPluginStats()
+		stats["chains"] = self.getChainStats()
+		stats["looper"] = self.looper.getStats()
+		return stats
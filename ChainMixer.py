@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Number of recent blocks each chain's load percentiles are taken over
+MIXER_WINDOW = 1024
+
+# Output bus channels
+MIXER_OUTPUTS = 2
+
+class ChainMixer:
+	# Runs several independent chains on the same block in parallel and sums
+	# them into one output bus. Each chain has a name, a board, the input
+	# channels it takes (in order) and the bus channels it feeds; a mono chain
+	# feeds all of its bus channels. Chains are spread over a fixed set of
+	# worker threads, heaviest first; pedalboard and NumPy release the GIL
+	# while processing, so the chains use separate cores. Called like a board,
+	# mixer(audio, sample_rate, reset=False), it returns a view of its bus.
+	def __init__(self, num_outputs=MIXER_OUTPUTS, workers=None, window=MIXER_WINDOW):
+		if workers is None:
+			workers = os.cpu_count() or 1
+		self.num_outputs = num_outputs
+		self.num_workers = workers
+		self.window = window
+
+		self.bus = np.zeros((num_outputs, 0), dtype=np.float32)
+		# (chains, worker -> chain indices, per-chain input buffers, per-chain
+		# outputs of the block in flight, loads)
+		self.state = ([], [], [], [], np.zeros((0, window)))
+		self.blocks = 0
+		self.walls = np.zeros(window)
+
+		# Handed to the workers for the block in flight
+		self.block = None
+		self.threads = []
+		self.start_barrier = threading.Barrier(workers + 1)
+		self.done_barrier = threading.Barrier(workers + 1)
+
+		log.info("Successfully initialized the ChainMixer")
+
+	def __str__(self):
+		return f"<ChainMixer object>"
+
+	def setChains(self, chains, max_frames=0):
+		# Publish a new set of chains with a single assignment, so a block in
+		# flight finishes with the old set. Chains go to the least loaded
+		# worker, heaviest first, using the loads measured so far.
+		old_chains, old_assignment, old_inputs, old_outputs, old_loads = self.state
+		previous = {chain.name: old_loads[i] for i, chain in enumerate(old_chains)}
+		loads = np.zeros((len(chains), self.window))
+		for i, chain in enumerate(chains):
+			if chain.name in previous:
+				loads[i] = previous[chain.name]
+
+		blocks = min(self.blocks, self.window)
+		expected = [float(np.median(loads[i, :blocks])) if blocks else 0.0 for i in range(len(chains))]
+		assignment = [[] for worker in range(self.num_workers)]
+		worker_loads = [0.0] * self.num_workers
+		for i in sorted(range(len(chains)), key=lambda i: expected[i], reverse=True):
+			worker = worker_loads.index(min(worker_loads))
+			assignment[worker].append(i)
+			# Nothing measured yet: spread them round robin
+			worker_loads[worker] = worker_loads[worker] + max(expected[i], 1e-9)
+
+		inputs = [np.zeros((len(chain.in_channels), max_frames), dtype=np.float32) for chain in chains]
+		self.state = (list(chains), assignment, inputs, [None] * len(chains), loads)
+
+	def start(self):
+		if self.threads:
+			return
+		for worker in range(self.num_workers):
+			thread = threading.Thread(target=self.runWorker, args=(worker,), name="ChainWorker-" + str(worker), daemon=True)
+			thread.start()
+			self.threads.append(thread)
+
+	def close(self):
+		# Wake the workers out of their barrier so they exit
+		self.start_barrier.abort()
+		self.done_barrier.abort()
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
+		self.start_barrier = threading.Barrier(self.num_workers + 1)
+		self.done_barrier = threading.Barrier(self.num_workers + 1)
+
+	def runWorker(self, worker):
+		while True:
+			try:
+				self.start_barrier.wait()
+			except threading.BrokenBarrierError:
+				return
+			state, audio, sample_rate = self.block
+			for i in state[1][worker]:
+				self.processChain(state, i, audio, sample_rate)
+			try:
+				self.done_barrier.wait()
+			except threading.BrokenBarrierError:
+				return
+
+	def processChain(self, state, i, audio, sample_rate):
+		chains, assignment, inputs, outputs, loads = state
+		chain = chains[i]
+		frames = audio.shape[1]
+		if inputs[i].shape[1] < frames:
+			inputs[i] = np.zeros((len(chain.in_channels), frames), dtype=np.float32)
+		chain_in = inputs[i][:, :frames]
+		# Channels the device doesn't have are silent
+		for j, channel in enumerate(chain.in_channels):
+			if channel < audio.shape[0]:
+				np.copyto(chain_in[j], audio[channel])
+			else:
+				chain_in[j].fill(0.0)
+
+		start = time.perf_counter()
+		outputs[i] = chain.board(chain_in, sample_rate, reset=False)
+		loads[i, self.blocks % self.window] = (time.perf_counter() - start) * sample_rate / frames
+
+	def __iter__(self):
+		# Every chain's plugins, so the mixer can be measured like a board
+		return iter([plugin for chain in self.state[0] for plugin in chain.board])
+
+	def reset(self):
+		for chain in self.state[0]:
+			chain.board.reset()
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.reset()
+		state = self.state
+		frames = audio.shape[1]
+		start = time.perf_counter()
+		if self.num_workers == 1 or len(state[0]) == 1:
+			for i in range(len(state[0])):
+				self.processChain(state, i, audio, sample_rate)
+		else:
+			self.start()
+			self.block = (state, audio, sample_rate)
+			self.start_barrier.wait()
+			self.done_barrier.wait()
+
+		if self.bus.shape[1] < frames:
+			self.bus = np.zeros((self.num_outputs, frames), dtype=np.float32)
+		bus = self.bus[:, :frames]
+		bus.fill(0.0)
+		for i, chain in enumerate(state[0]):
+			chain_out = state[3][i]
+			if chain_out.shape[0] == 1:
+				for channel in chain.out_channels:
+					np.add(bus[channel], chain_out[0], out=bus[channel])
+			else:
+				for j, channel in enumerate(chain.out_channels[:chain_out.shape[0]]):
+					np.add(bus[channel], chain_out[j], out=bus[channel])
+		self.walls[self.blocks % self.window] = (time.perf_counter() - start) * sample_rate / frames
+		self.blocks = self.blocks + 1
+		return bus
+
+	def getStats(self):
+		# Per-chain and whole-block load (time as a fraction of the audio's
+		# duration), and which worker runs each chain
+		chains, assignment, inputs, outputs, loads = self.state
+		blocks = min(self.blocks, self.window)
+		if blocks == 0:
+			return {"blocks": 0, "workers": self.num_workers, "chains": {}}
+		stats = {"blocks": self.blocks, "workers": self.num_workers, "chains": {}}
+		for worker, chain_indices in enumerate(assignment):
+			for i in chain_indices:
+				p50, p95 = (float(p) for p in np.percentile(loads[i, :blocks], [50, 95]))
+				stats["chains"][chains[i].name] = {"worker": worker, "load_p50": p50, "load_p95": p95}
+		stats["load_p50"], stats["load_p95"] = (float(p) for p in np.percentile(self.walls[:blocks], [50, 95]))
+		return stats
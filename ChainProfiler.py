@@ -0,0 +1,100 @@
+import logging
+import time
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Number of recent blocks the per-plugin percentiles are taken over
+PROFILE_WINDOW = 1024
+
+# Short names for the LCD's CPU% line
+PLUGIN_ABBREVIATIONS = {
+	"Gain": "Gn",
+	"Chorus": "Ch",
+	"Delay": "Dl",
+	"Reverb": "Rv",
+	"Compressor": "Cp",
+	"Phaser": "Ph",
+	"Flanger": "Fl",
+	"Echo": "Ec",
+	"Freeverb": "Fv",
+}
+
+class ChainProfiler:
+	# Opt-in per-plugin timing of the effects board. profile(board) points the
+	# profiler at the current board and returns it; calling it then runs the
+	# board's plugins one at a time (the same result as running the board) and
+	# stores each plugin's load, its time as a fraction of the audio's
+	# duration, in a preallocated ring per plugin type. Only the audio thread
+	# writes; getStats() may read from any thread. When profiling is off the
+	# board is called directly and none of this runs.
+	def __init__(self, plugin_names=PLUGIN_ABBREVIATIONS, window=PROFILE_WINDOW):
+		self.window = window
+		# plugin type name -> [ring of loads, blocks seen]
+		self.loads = {name: [np.zeros(window), 0] for name in plugin_names}
+		self.board = None
+
+		log.info("Successfully initialized the ChainProfiler")
+
+	def __str__(self):
+		return f"<ChainProfiler object>"
+
+	def profile(self, board):
+		self.board = board
+		return self
+
+	def __iter__(self):
+		return iter(self.board)
+
+	def reset(self):
+		self.board.reset()
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.board.reset()
+		seconds = audio.shape[1] / sample_rate
+		for plugin in self.board:
+			start = time.perf_counter()
+			audio = plugin(audio, sample_rate, reset=False)
+			duration = time.perf_counter() - start
+
+			entry = self.loads.get(type(plugin).__name__)
+			if entry is None:
+				# A plugin type not seen before; its ring is made once
+				entry = self.loads[type(plugin).__name__] = [np.zeros(self.window), 0]
+			entry[0][entry[1] % self.window] = duration / seconds
+			entry[1] = entry[1] + 1
+		return audio
+
+	def clear(self):
+		for entry in self.loads.values():
+			entry[1] = 0
+
+	def getStats(self):
+		# plugin type name -> blocks and CPU% percentiles, for the plugins
+		# that have run
+		stats = {}
+		for name, (ring, blocks) in list(self.loads.items()):
+			if blocks == 0:
+				continue
+			filled = ring[:min(blocks, self.window)]
+			p50, p95, p99 = (100.0 * float(p) for p in np.percentile(filled, [50, 95, 99]))
+			stats[name] = {
+				"blocks": blocks,
+				"cpu_p50": p50,
+				"cpu_p95": p95,
+				"cpu_p99": p99,
+				"cpu_max": 100.0 * float(filled.max()),
+			}
+		return stats
+
+	def getCpuSummary(self, max_plugins=2):
+		# The heaviest plugins by median CPU%, e.g. "Rv31 Ch4.5"
+		stats = self.getStats()
+		heaviest = sorted(stats, key=lambda name: stats[name]["cpu_p50"], reverse=True)[:max_plugins]
+		parts = []
+		for name in heaviest:
+			cpu = stats[name]["cpu_p50"]
+			parts.append(PLUGIN_ABBREVIATIONS.get(name, name[:2]) + (f"{cpu:.0f}" if cpu >= 10 else f"{cpu:.1f}"))
+		return " ".join(parts)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Telemetry import metrics
+
+log = logging.getLogger(__name__)
+
+# Presses of the same button closer together than this are contact bounce
+DEBOUNCE_SECONDS = 0.05
+
+# Number of recent presses the latency percentiles are taken over
+LATENCY_WINDOW = 1024
+
+class Controller:
+	# asyncio front end for the StateManager. Button callbacks (on gpiozero's
+	# thread) only timestamp the press and queue it; state transitions run on
+	# the event loop, one at a time. The slow work they trigger is handed to
+	# worker threads and coalesced, so input is never blocked behind it:
+	#   - LCD writes: only the newest frame is drawn once the bus is free
+	#   - board updates: one updateBoard() covers every change made meanwhile
+	#   - previews: rendered after any pending board update
+	def __init__(self, state_manager, debounce=DEBOUNCE_SECONDS):
+		self.state_manager = state_manager
+		self.lcd_manager = state_manager.lcd_manager
+		self.audio_manager = state_manager.audio_manager
+		self.debounce = debounce
+
+		self.loop = None
+		self.queue = None
+		self.last_press = {}
+		self.latencies = deque(maxlen=LATENCY_WINDOW)
+		self.presses = 0
+		self.bounces = 0
+		self.press_latency = metrics.histogram("press_to_display_seconds", "Time from a button press to its frame on the LCD")
+		self.press_count = metrics.counter("presses_total", "Button presses handled")
+		self.bounce_count = metrics.counter("bounces_total", "Button presses dropped as contact bounce")
+
+		# One thread owns the LCD bus, one the board/renders, so each stays ordered
+		self.display_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="display")
+		self.audio_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio")
+
+		# The press being handled, and presses whose frame is waiting to be drawn
+		self.current_press = None
+		self.pending_frame = None
+		self.pending_presses = []
+		self.display_task = None
+		self.board_dirty = False
+		self.board_task = None
+		self.background = set()
+
+		log.info("Successfully initialized the Controller")
+
+	def __str__(self):
+		return f"<Controller object>"
+
+	def attach(self, next_button, select_button):
+		next_button.when_pressed = lambda: self.post("next")
+		select_button.when_pressed = lambda: self.post("select")
+
+	def start(self):
+		# Call from inside the running event loop
+		self.loop = asyncio.get_running_loop()
+		self.queue = asyncio.Queue()
+		self.state_manager.scheduler = self
+		return self.loop.create_task(self.run())
+
+	def post(self, event, pressed_at=None):
+		# Safe from any thread. Debouncing is a timestamp check, not a sleep.
+		# pressed_at lets presses recorded earlier keep their own time.
+		now = time.perf_counter() if pressed_at is None else pressed_at
+		if now - self.last_press.get(event, float("-inf")) < self.debounce:
+			self.bounces = self.bounces + 1
+			self.bounce_count.inc()
+			return
+		self.last_press[event] = now
+		self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, now))
+
+	async def run(self):
+		while True:
+			event, pressed_at = await self.queue.get()
+			self.presses = self.presses + 1
+			self.press_count.inc()
+			self.current_press = pressed_at
+			try:
+				await self.handle(event)
+			except Exception as e:
+				log.exception("Error handling %s: %r", event, e)
+			self.current_press = None
+			self.queue.task_done()
+
+	async def handle(self, event):
+		match event:
+			case "next":
+				self.state_manager.nextItemState()
+			case "select":
+				self.state_manager.selectItemState()
+
+	def spawn(self, coro):
+		task = self.loop.create_task(coro)
+		self.background.add(task)
+		task.add_done_callback(self.background.discard)
+		return task
+
+	def scheduleDisplay(self, lines_array, line_num):
+		self.pending_frame = (list(lines_array), line_num)
+		if self.current_press is not None:
+			self.pending_presses.append(self.current_press)
+		if self.display_task is None:
+			self.display_task = self.spawn(self.drawFrames())
+
+	async def drawFrames(self):
+		while self.pending_frame is not None:
+			lines_array, line_num = self.pending_frame
+			presses = self.pending_presses
+			self.pending_frame = None
+			self.pending_presses = []
+			await self.loop.run_in_executor(self.display_executor,
+				self.lcd_manager.writeLCDLine, lines_array, line_num, self.audio_manager)
+			drawn_at = time.perf_counter()
+			for pressed_at in presses:
+				self.latencies.append(drawn_at - pressed_at)
+				self.press_latency.observe(drawn_at - pressed_at)
+		self.display_task = None
+
+	def scheduleBoardUpdate(self):
+		self.board_dirty = True
+		if self.board_task is None:
+			self.board_task = self.spawn(self.updateBoards())
+
+	async def updateBoards(self):
+		while self.board_dirty:
+			self.board_dirty = False
+			try:
+				await self.loop.run_in_executor(self.audio_executor, self.audio_manager.updateBoard)
+			except ValueError as e:
+				log.warning("Board update failed: %s", e)
+		self.board_task = None
+
+	def schedulePresetSwitch(self, preset_name):
+		# On the audio thread so it is ordered with board updates
+		self.spawn(self.switchPreset(preset_name))
+	
+	async def switchPreset(self, preset_name):
+		if self.board_task is not None:
+			await self.board_task
+		await self.loop.run_in_executor(self.audio_executor,
+			self.state_manager.preset_manager.switchPreset, preset_name)
+	
+	def schedulePreview(self, audio_file):
+		self.spawn(self.renderPreview(audio_file))
+
+	async def renderPreview(self, audio_file):
+		if self.board_task is not None:
+			await self.board_task
+		await self.loop.run_in_executor(self.audio_executor, self.audio_manager.applyEffects, audio_file)
+
+	async def idle(self):
+		# Wait until every queued press and the work it scheduled has finished.
+		# Yield first so presses posted from this thread reach the queue.
+		await asyncio.sleep(0)
+		await self.queue.join()
+		while self.background:
+			await asyncio.gather(*list(self.background), return_exceptions=True)
+
+	def getStats(self):
+		# Press-to-display latency over the recent presses
+		latencies = np.array(self.latencies)
+		if len(latencies):
+			p50, p95, p99 = (1000.0 * float(p) for p in np.percentile(latencies, [50, 95, 99]))
+			worst = 1000.0 * float(latencies.max())
+		else:
+			p50 = p95 = p99 = worst = 0.0
+		return {
+			"presses": self.presses,
+			"bounces": self.bounces,
+			"latency_p50_ms": p50,
+			"latency_p95_ms": p95,
+			"latency_p99_ms": p99,
+			"latency_max_ms": worst,
+		}
+
+	def close(self):
+		self.state_manager.scheduler = None
+		self.display_executor.shutdown()
+		self.audio_executor.shutdown()
@@ -0,0 +1,63 @@
+import numpy as np
+
+# Most edits that can be undone; older ones fall off the front
+EDIT_LOG_SIZE = 256
+
+# param_index recorded for an enable/disable
+ENABLE_PARAM = -1
+
+class EditLog:
+	# Undo/redo history of parameter and enable changes, as four preallocated
+	# integer arrays used as a ring: which effect, which parameter (or
+	# ENABLE_PARAM), and the index (or enabled flag) before and after. Undo
+	# and redo only move the cursor, so any number of steps can be handed back
+	# at once and applied with a single board update.
+	def __init__(self, size=EDIT_LOG_SIZE):
+		self.size = size
+		self.effects = np.zeros(size, dtype=np.int16)
+		self.params = np.zeros(size, dtype=np.int8)
+		self.befores = np.zeros(size, dtype=np.int16)
+		self.afters = np.zeros(size, dtype=np.int16)
+		# Edits [first, cursor) can be undone, [cursor, last) redone
+		self.first = 0
+		self.cursor = 0
+		self.last = 0
+
+	def __str__(self):
+		return f"<EditLog object>"
+
+	def record(self, effect_index, param_index, before, after):
+		# A new edit drops anything that could have been redone
+		slot = self.cursor % self.size
+		self.effects[slot] = effect_index
+		self.params[slot] = param_index
+		self.befores[slot] = before
+		self.afters[slot] = after
+		self.cursor = self.cursor + 1
+		self.last = self.cursor
+		self.first = max(self.first, self.cursor - self.size)
+
+	def canUndo(self):
+		return self.cursor > self.first
+
+	def canRedo(self):
+		return self.cursor < self.last
+
+	def undo(self, steps=1):
+		# (effect, param, value) to set for up to steps edits, newest first
+		steps = min(steps, self.cursor - self.first)
+		slots = np.arange(self.cursor - 1, self.cursor - 1 - steps, -1) % self.size
+		self.cursor = self.cursor - steps
+		return zip(self.effects[slots].tolist(), self.params[slots].tolist(), self.befores[slots].tolist())
+
+	def redo(self, steps=1):
+		# (effect, param, value) to set for up to steps edits, oldest first
+		steps = min(steps, self.last - self.cursor)
+		slots = np.arange(self.cursor, self.cursor + steps) % self.size
+		self.cursor = self.cursor + steps
+		return zip(self.effects[slots].tolist(), self.params[slots].tolist(), self.afters[slots].tolist())
+
+	def clear(self):
+		self.first = 0
+		self.cursor = 0
+		self.last = 0
@@ -1,3 +1,20 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# Short names for the LCD, so a parameter and its value fit on one 16-column
+# row; parameters not listed show their own name
+PARAM_LABELS = {
+	"rate_hz": "rate",
+	"centre_delay_ms": "delay ms",
+	"delay_seconds": "delay s",
+	"room_size": "room",
+	"wet_level": "wet",
+	"dry_level": "dry",
+	"threshold_db": "thresh dB",
+	"centre_frequency_hz": "centre Hz",
+}
+
 class Effect:
 	def __init__(self, name):
 		self.name = name
@@ -8,6 +25,12 @@ class Effect:
 		fed_arr = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
 		sec_arr = [0.1, 0.3, 0.5, 0.7, 1.0, 3.0, 5.0, 7.0, 9.0, 10.0, 15.0]
 		dbn_arr = [-24, -12, -9, -6, -3, -2, -1, -0.5]
+		fla_arr = [0.0005, 0.001, 0.002, 0.003, 0.005, 0.007, 0.01]
+		dep_arr = [0, 5, 10, 15, 20, 30, 40, 50]
+		lfo_arr = [0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5]
+		ech_arr = [0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0]
+		frq_arr = [200, 400, 800, 1300, 2000, 3000]
+		rat_arr = [1.0, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0, 20.0]
 		
 		match name:
 			case "Chorus":
@@ -20,16 +43,50 @@ class Effect:
 				self.param_indices = [2, 0, 5]
 			case "Reverb":
 				self.param_names = ["room_size", "damping", "wet_level", "dry_level", "width"]
-				self.param_values = [sec_arr, mix_arr, mix_arr, mix_arr, mix_arr]
-				self.param_indices = [2, 5, 4, 4, 0]
+				self.param_values = [mix_arr, mix_arr, mix_arr, mix_arr, mix_arr]
+				self.param_indices = [5, 5, 4, 4, 0]
 			case "Compressor":
 				self.param_names = ["threshold_db", "ratio"]
-				self.param_values = [dbn_arr, sec_arr]
-				self.param_indices = [4, 5]
+				self.param_values = [dbn_arr, rat_arr]
+				self.param_indices = [4, 4]
+			case "Flanger":
+				self.param_names = ["delay_seconds", "depth", "rate_hz", "feedback", "mix"]
+				self.param_values = [fla_arr, dep_arr, lfo_arr, fed_arr, mix_arr]
+				self.param_indices = [1, 5, 4, 4, 5]
+			case "Echo":
+				self.param_names = ["delay_seconds", "gain", "feedback", "mix"]
+				self.param_values = [ech_arr, mix_arr, fed_arr[:6], mix_arr]
+				self.param_indices = [5, 5, 3, 5]
+			case "Phasor":
+				self.param_names = ["rate_hz", "depth", "centre_frequency_hz", "mix"]
+				self.param_values = [sec_arr, mix_arr, frq_arr, mix_arr]
+				self.param_indices = [2, 5, 3, 5]
+			case "Freeverb":
+				self.param_names = ["room_size", "width", "mix", "balance", "volume"]
+				self.param_values = [mix_arr, mix_arr, mix_arr, mix_arr, mix_arr]
+				self.param_indices = [6, 10, 5, 5, 10]
 		
 	def __str__(self):
 		return f"{self.name}"
 	
+	def getState(self):
+		# Everything needed to recreate this effect's settings (presets, batch jobs)
+		return {"enabled": self.enabled, "param_indices": list(self.param_indices)}
+	
+	def setState(self, state):
+		# ValueError if the state doesn't fit this effect's tables; nothing is
+		# changed then
+		if not isinstance(state, dict) or not isinstance(state.get("enabled"), bool):
+			raise ValueError(f"{self.name} needs an enabled flag")
+		param_indices = state.get("param_indices")
+		if not isinstance(param_indices, list) or len(param_indices) != len(self.param_values):
+			raise ValueError(f"{self.name} needs {len(self.param_values)} param_indices")
+		for param_index, value_index in enumerate(param_indices):
+			if type(value_index) is not int or not 0 <= value_index < len(self.param_values[param_index]):
+				raise ValueError(f"{self.name} {self.param_names[param_index]} has no value {value_index!r}")
+		self.enabled = state["enabled"]
+		self.param_indices = list(param_indices)
+	
 	def setEnable(self, new_enable):
 		self.enabled = new_enable
 		
@@ -45,13 +102,11 @@ class Effect:
 	def getParamNameAt(self, i):
 		return self.param_names[i]
 
-	def nextParamValue(self, i):		
-		print('parameter: ')
-		print(self.param_names[i])
-		print('parameter: ')
-		print(self.param_values[i])
-		print('parameter index: ')
-		print(self.param_indices[i])
+	def getParamLabelAt(self, i):
+		return PARAM_LABELS.get(self.param_names[i], self.param_names[i])
+
+	def nextParamValue(self, i):
+		log.debug("parameter: %s %s index %s", self.param_names[i], self.param_values[i], self.param_indices[i])
 		val_arr = self.param_values[i]
 		val_idx = self.param_indices[i]
 		
@@ -61,18 +116,11 @@ class Effect:
 			val_idx = 0
 			
 		self.param_indices[i] = val_idx
-		print('parameter: ')
-		print(self.param_values[i])
-		print('parameter index: ')
-		print(self.param_indices[i])
+		log.debug("parameter: %s index %s", self.param_names[i], self.param_indices[i])
 		
 
 	def getParamValueAt(self, i):
 		val_arr = self.param_values[i]
 		val_idx = self.param_indices[i]
-		print(f'val_arr: {val_arr}')
-		print(f'val_idx: {val_idx}')
-		print(f'i: {i}')
-		print(f'val_arr[val_idx]: {val_arr[val_idx]}')
 		return val_arr[val_idx]
 		
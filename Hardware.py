@@ -0,0 +1,300 @@
+import os
+import time
+
+# Sample rates probed when asking a device what it supports
+COMMON_SAMPLE_RATES = [22050.0, 32000.0, 44100.0, 48000.0, 88200.0, 96000.0]
+
+# Hardware backends. PiHardware talks to the real LCD, buttons and sound
+# devices; HeadlessHardware swaps in in-memory fakes so the whole stack can be
+# imported, driven and profiled on an ordinary Linux box. Hardware libraries
+# (and numpy) are only imported when a backend actually needs them, so the
+# LCD can come up before anything heavy has loaded.
+
+class PedalboardAudio:
+	# Sound devices through pedalboard's AudioStream
+	def __str__(self):
+		return f"<PedalboardAudio object>"
+
+	def getInputDeviceNames(self):
+		from pedalboard.io import AudioStream
+		return AudioStream.input_device_names
+
+	def getOutputDeviceNames(self):
+		from pedalboard.io import AudioStream
+		return AudioStream.output_device_names
+
+	def getDeviceInfo(self, in_or_out, device_name):
+		# pedalboard only lists names; sounddevice (already used by pyusb.py)
+		# knows the rest. Without it every capability is unknown (None).
+		info = {"name": device_name, "max_channels": None, "default_sample_rate": None,
+			"sample_rates": None, "low_latency": None, "high_latency": None}
+		try:
+			import sounddevice as sd
+		except ImportError:
+			return info
+		kind = "input" if in_or_out == "in" else "output"
+		for device in sd.query_devices():
+			if device["name"] != device_name or device["max_" + kind + "_channels"] == 0:
+				continue
+			check = sd.check_input_settings if kind == "input" else sd.check_output_settings
+			rates = []
+			for rate in COMMON_SAMPLE_RATES:
+				try:
+					check(device=device["index"], samplerate=rate)
+					rates.append(rate)
+				except Exception:
+					pass
+			info.update({
+				"max_channels": device["max_" + kind + "_channels"],
+				"default_sample_rate": device["default_samplerate"],
+				"sample_rates": rates,
+				"low_latency": device["default_low_" + kind + "_latency"],
+				"high_latency": device["default_high_" + kind + "_latency"],
+			})
+			break
+		return info
+
+	def getDeviceSignature(self):
+		# Cheap fingerprint of the attached sound hardware for hot-plug checks:
+		# the ALSA card list, or failing that the USB bus. None if neither exists.
+		try:
+			with open("/proc/asound/cards") as f:
+				return f.read()
+		except OSError:
+			pass
+		try:
+			return tuple(sorted(os.listdir("/sys/bus/usb/devices")))
+		except OSError:
+			return None
+
+	def openInputStream(self, device_name, sample_rate, buffer_size, num_channels):
+		from pedalboard.io import AudioStream
+		return AudioStream(input_device_name=device_name, sample_rate=sample_rate,
+			buffer_size=buffer_size, num_input_channels=num_channels)
+
+	def openOutputStream(self, device_name, sample_rate, buffer_size, num_channels):
+		from pedalboard.io import AudioStream
+		return AudioStream(output_device_name=device_name, sample_rate=sample_rate,
+			buffer_size=buffer_size, num_output_channels=num_channels)
+
+class FileInputStream:
+	# Input device that loops the samples of a file (or silence), paced like a
+	# real device unless realtime is False
+	def __init__(self, samples, sample_rate, num_channels, realtime=True):
+		import numpy as np
+		if samples is None:
+			samples = np.zeros((num_channels, int(sample_rate)), dtype=np.float32)
+		self.samples = samples
+		self.sample_rate = sample_rate
+		self.realtime = realtime
+		self.position = 0
+		self.next_due = None
+		self.ignore_dropped_input = False
+		self.dropped_input_frame_count = 0
+		self.buffered_input_sample_count = 0
+
+	def __enter__(self):
+		self.next_due = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		pass
+
+	def read(self, num_samples):
+		import numpy as np
+		if self.realtime:
+			self.next_due = self.next_due + num_samples / self.sample_rate
+			delay = self.next_due - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+
+		frames = self.samples.shape[1]
+		indices = np.arange(self.position, self.position + num_samples) % frames
+		self.position = (self.position + num_samples) % frames
+		return self.samples[:, indices]
+
+class NullOutputStream:
+	# Output device that counts what it is given and optionally keeps it in a file.
+	# When realtime, it plays out at the sample rate a block behind the first
+	# write, like a double-buffered device, and counts each time a write comes
+	# after everything queued has already played (an underrun).
+	def __init__(self, sample_rate, num_channels, audio_file=None, buffer_size=0, realtime=False):
+		self.sample_rate = sample_rate
+		self.num_channels = num_channels
+		self.audio_file = audio_file
+		self.buffer_size = buffer_size
+		self.realtime = realtime
+		self.writer = None
+		self.frames_written = 0
+		self.output_underrun_count = 0
+		self.play_start = None
+		self.frames_queued = 0
+
+	def __enter__(self):
+		if self.audio_file is not None:
+			from pedalboard.io import AudioFile
+			self.writer = AudioFile(self.audio_file, "w", self.sample_rate, self.num_channels)
+		return self
+
+	def __exit__(self, *args):
+		if self.writer is not None:
+			self.writer.close()
+			self.writer = None
+
+	def write(self, audio, sample_rate):
+		if self.realtime:
+			now = time.perf_counter()
+			if self.play_start is not None and (now - self.play_start) * self.sample_rate > self.frames_queued:
+				# Ran dry: the device plays silence and starts over from this write
+				self.output_underrun_count = self.output_underrun_count + 1
+				self.play_start = None
+			if self.play_start is None:
+				self.play_start = now + self.buffer_size / self.sample_rate
+				self.frames_queued = 0
+			self.frames_queued = self.frames_queued + audio.shape[1]
+		self.frames_written = self.frames_written + audio.shape[1]
+		if self.writer is not None:
+			self.writer.write(audio)
+
+class NullAudio:
+	# One fake input and one fake output device. The input plays back
+	# input_samples ((channels, frames) float32) on a loop, or silence; the
+	# output discards audio unless output_file is set.
+	# Devices can be "plugged in" by adding to input_names/output_names.
+	def __init__(self, input_samples=None, output_file=None, realtime=True):
+		self.input_samples = input_samples
+		self.output_file = output_file
+		self.realtime = realtime
+		self.input_names = ["Null input"]
+		self.output_names = ["Null output"]
+
+	def __str__(self):
+		return f"<NullAudio object>"
+
+	def getInputDeviceNames(self):
+		return list(self.input_names)
+
+	def getOutputDeviceNames(self):
+		return list(self.output_names)
+
+	def getDeviceInfo(self, in_or_out, device_name):
+		return {"name": device_name, "max_channels": 2, "default_sample_rate": 44100.0,
+			"sample_rates": [44100.0, 48000.0], "low_latency": 0.005, "high_latency": 0.02}
+
+	def getDeviceSignature(self):
+		return (tuple(self.input_names), tuple(self.output_names))
+
+	def openInputStream(self, device_name, sample_rate, buffer_size, num_channels):
+		return FileInputStream(self.input_samples, sample_rate, num_channels, self.realtime)
+
+	def openOutputStream(self, device_name, sample_rate, buffer_size, num_channels):
+		return NullOutputStream(sample_rate, num_channels, self.output_file, buffer_size, self.realtime)
+
+class VirtualLCD:
+	# In-memory stand-in for RPLCD's CharLCD: the same cursor_pos/write_string/
+	# clear surface over a rows x cols framebuffer. byte_seconds > 0 makes each
+	# byte sent take that long, to mimic the Pi's slow 4-bit bus.
+	def __init__(self, cols=16, rows=2, byte_seconds=0):
+		self.cols = cols
+		self.rows = rows
+		self.byte_seconds = byte_seconds
+		self.cursor_mode = "hide"
+		self.framebuffer = [[" "] * cols for i in range(rows)]
+		self.row = 0
+		self.col = 0
+
+	def __str__(self):
+		return "\n".join(self.getLines())
+
+	@property
+	def cursor_pos(self):
+		return (self.row, self.col)
+
+	@cursor_pos.setter
+	def cursor_pos(self, pos):
+		self.busDelay(1)
+		self.row, self.col = pos
+
+	def busDelay(self, num_bytes):
+		if self.byte_seconds:
+			time.sleep(num_bytes * self.byte_seconds)
+
+	def clear(self):
+		self.busDelay(10)
+		self.framebuffer = [[" "] * self.cols for i in range(self.rows)]
+		self.row = 0
+		self.col = 0
+
+	def write_string(self, value):
+		# Wraps onto the next row like CharLCD's auto line breaks
+		self.busDelay(len(value))
+		for char in value:
+			self.framebuffer[self.row][self.col] = char
+			self.col = self.col + 1
+			if self.col >= self.cols:
+				self.col = 0
+				self.row = (self.row + 1) % self.rows
+
+	def getLines(self):
+		return ["".join(row) for row in self.framebuffer]
+
+class ScriptedButton:
+	# Stand-in for a gpiozero Button: press() runs the when_pressed callback
+	def __init__(self, pin):
+		self.pin = pin
+		self.when_pressed = None
+
+	def __str__(self):
+		return f"<ScriptedButton pin {self.pin}>"
+
+	def press(self):
+		if self.when_pressed is not None:
+			self.when_pressed()
+
+class PiHardware:
+	def __init__(self):
+		self.audio = PedalboardAudio()
+
+	def __str__(self):
+		return f"<PiHardware object>"
+
+	def openDisplay(self, rs_pin, en_pin, data_pins):
+		import RPi.GPIO as GPIO
+		from RPLCD.gpio import CharLCD  # Ensure you're using the GPIO version of CharLCD
+
+		# Set GPIO numbering mode to BOARD or BCM
+		GPIO.setmode(GPIO.BOARD)  # Use GPIO.BCM if you are using BCM numbering
+
+		# Initialize the LCD (using 4-bit mode) and specify the numbering_mode
+		return CharLCD(cols=16, rows=2, pin_rs=rs_pin, pin_e=en_pin, pins_data=data_pins, numbering_mode=GPIO.BOARD)
+
+	def openButton(self, pin):
+		from gpiozero import Button
+		return Button(pin)
+
+	def cleanup(self):
+		import RPi.GPIO as GPIO
+		GPIO.cleanup()
+
+class HeadlessHardware:
+	def __init__(self, audio=None, lcd_byte_seconds=0):
+		if audio is None:
+			audio = NullAudio()
+		self.audio = audio
+		self.lcd_byte_seconds = lcd_byte_seconds
+		self.display = None
+		self.buttons = {}
+
+	def __str__(self):
+		return f"<HeadlessHardware object>"
+
+	def openDisplay(self, rs_pin, en_pin, data_pins):
+		self.display = VirtualLCD(byte_seconds=self.lcd_byte_seconds)
+		return self.display
+
+	def openButton(self, pin):
+		self.buttons[pin] = ScriptedButton(pin)
+		return self.buttons[pin]
+
+	def cleanup(self):
+		pass
@@ -1,58 +1,213 @@
-from pedalboard.io import AudioFile, AudioStream
+import logging
+import threading
+import time
+
+from Hardware import PedalboardAudio
+
+log = logging.getLogger(__name__)
+
+# Device lists younger than this are served from the cache
+DEVICE_CACHE_SECONDS = 30.0
+
+# How often the watcher checks for hot-plugged devices
+DEVICE_POLL_SECONDS = 2.0
+
+# Buffer sizes a stream may be opened with, smallest first
+STREAM_BUFFER_SIZES = [64, 128, 256, 512, 1024, 2048]
+
+# Used when a device can't report its own latency
+DEFAULT_BUFFER_SIZE = 512
+
 class IOManager:
-	def __init__(self):
-		self.input_devices = AudioStream.input_device_names
-		self.output_devices = AudioStream.output_device_names
+	# Registry of the audio devices and what they can do. Enumeration is
+	# cached: lists younger than DEVICE_CACHE_SECONDS are returned as they are,
+	# older ones are returned straight away while a background rescan runs. A
+	# watcher thread checks the backend's cheap device signature (the ALSA card
+	# list or the USB bus on the Pi) and rescans only when it changes, so
+	# plugging in an interface shows up without anyone paying for a scan.
+	def __init__(self, audio_backend=None, cache_seconds=DEVICE_CACHE_SECONDS, poll_seconds=DEVICE_POLL_SECONDS):
+		if audio_backend is None:
+			audio_backend = PedalboardAudio()
+		self.audio_backend = audio_backend
+		self.cache_seconds = cache_seconds
+		self.poll_seconds = poll_seconds
+		self.input_devices = []
+		self.output_devices = []
+		# name -> capabilities, per direction
+		self.device_info = {"in": {}, "out": {}}
 		self.input_i = 0
 		self.output_i = 0
-		
-		print("\n" + "-" * 100)
-		print("Input Devices:")
-		for device in self.input_devices:
-			print(device)
-			
-		print("\nOutput Devices:")
-		for device in self.output_devices:
-			print(device)
-		print("-" * 100 + "\n")
-				
-		print("Successfully initialized the IOManager")
-		
+		self.scanned_at = None
+		self.signature = None
+		self.scans = 0
+		self.listeners = []
+
+		# Enumerating devices is slow on the Pi; it runs in the background and
+		# anything that needs the lists waits for the first scan
+		self.lock = threading.Lock()
+		self.scanned = threading.Event()
+		self.scan_thread = None
+		self.startScan()
+
+		self.watching = True
+		self.watch_thread = threading.Thread(target=self.watchDevices, name="DeviceWatch", daemon=True)
+		self.watch_thread.start()
+
+		log.info("Successfully initialized the IOManager")
+
 	def __str__(self):
 		return f"<IOManager object>"
-	
+
+	def startScan(self):
+		# Rescan in the background unless one is already running
+		with self.lock:
+			if self.scan_thread is not None and self.scan_thread.is_alive():
+				return
+			self.scan_thread = threading.Thread(target=self.scanDevices, name="DeviceScan", daemon=True)
+			self.scan_thread.start()
+
+	def scanDevices(self):
+		try:
+			signature = self.audio_backend.getDeviceSignature()
+			input_devices = list(self.audio_backend.getInputDeviceNames())
+			output_devices = list(self.audio_backend.getOutputDeviceNames())
+			device_info = {
+				"in": {name: self.audio_backend.getDeviceInfo("in", name) for name in input_devices},
+				"out": {name: self.audio_backend.getDeviceInfo("out", name) for name in output_devices},
+			}
+		except Exception as e:
+			log.warning("Device scan failed: %s", e)
+			self.scanned.set()
+			return
+
+		# Keep the selected devices selected if they are still there
+		current_in = self.getIOName("in", self.input_i, wait=False)
+		current_out = self.getIOName("out", self.output_i, wait=False)
+		changed = input_devices != self.input_devices or output_devices != self.output_devices
+		self.input_devices = input_devices
+		self.output_devices = output_devices
+		self.device_info = device_info
+		self.input_i = input_devices.index(current_in) if current_in in input_devices else 0
+		self.output_i = output_devices.index(current_out) if current_out in output_devices else 0
+		self.signature = signature
+		self.scanned_at = time.monotonic()
+		self.scans = self.scans + 1
+		self.scanned.set()
+
+		if changed:
+			# One message, so the list isn't interleaved with other threads' output
+			lines = ["Input Devices:"] + input_devices + ["", "Output Devices:"] + output_devices
+			log.info("\n".join(lines))
+			for listener in self.listeners:
+				listener()
+
+	def watchDevices(self):
+		self.scanned.wait()
+		while self.watching:
+			time.sleep(self.poll_seconds)
+			try:
+				signature = self.audio_backend.getDeviceSignature()
+			except Exception:
+				signature = None
+			if signature is not None and signature != self.signature:
+				self.startScan()
+
+	def addListener(self, listener):
+		# listener() is called (from the scan thread) when the device lists change
+		self.listeners.append(listener)
+
+	def waitForDevices(self):
+		self.scanned.wait()
+
+	def isStale(self):
+		return self.scanned_at is None or time.monotonic() - self.scanned_at > self.cache_seconds
+
+	def close(self):
+		self.watching = False
+
 	def refreshIODevices(self, in_or_out):
-		match in_or_out:
-			case "in":
-				input_devices = sd.query_devices(kind = "input")
-				input_devices = input_devices.get("name")
-				print("Input Devices")
-				print(input_devices)
-				return input_devices
-			case "out":
-				output_devices = sd.query_devices(kind = "output")
-				output_devices = output_devices.get("name")
-				print("Output Devices")
-				print(output_devices)
-				return output_devices
-				
+		# Rescan now and return the fresh list
+		self.startScan()
+		self.scan_thread.join()
+		return self.getIODevices(in_or_out)
+
 	def getIODevices(self, in_or_out):
+		self.waitForDevices()
+		if self.isStale():
+			self.startScan()
 		match in_or_out:
 			case "in":
 				return self.input_devices
 			case "out":
 				return self.output_devices
-	
+
 	def getCurrentIO(self, in_or_out):
 		match in_or_out:
 			case "in":
 				return self.getIOName(in_or_out, self.input_i)
 			case "out":
 				return self.getIOName(in_or_out, self.output_i)
-	
-	def getIOName(self, in_or_out, index):
+
+	def nextIO(self, in_or_out):
+		# Select the next device, wrapping around; returns its name
+		devices = self.getIODevices(in_or_out)
+		if not devices:
+			return None
+		match in_or_out:
+			case "in":
+				self.input_i = (self.input_i + 1) % len(devices)
+			case "out":
+				self.output_i = (self.output_i + 1) % len(devices)
+		return self.getCurrentIO(in_or_out)
+
+	def getIOName(self, in_or_out, index, wait=True):
+		if wait:
+			self.waitForDevices()
 		match in_or_out:
 			case "in":
-				return self.input_devices[index]
+				devices = self.input_devices
 			case "out":
-				return self.output_devices[index]
+				devices = self.output_devices
+
+		# No audio hardware attached (e.g. benchmarking off the Pi)
+		if index >= len(devices):
+			return None
+		return devices[index]
+
+	def getCapabilities(self, in_or_out, device_name=None):
+		# Channels, sample rates and default latencies of a device (the
+		# selected one by default), from the cache. None if unknown.
+		self.waitForDevices()
+		if device_name is None:
+			device_name = self.getCurrentIO(in_or_out)
+		return self.device_info[in_or_out].get(device_name)
+
+	def pickStreamConfig(self, sample_rate=None):
+		# Lowest-latency settings the selected input and output both support:
+		# the requested rate if they can run it (else the highest rate they
+		# share), and the smallest buffer that covers both devices' low latency
+		caps = [cap for cap in (self.getCapabilities("in"), self.getCapabilities("out")) if cap is not None]
+
+		rates = None
+		for cap in caps:
+			if cap["sample_rates"]:
+				cap_rates = set(cap["sample_rates"])
+				rates = cap_rates if rates is None else rates & cap_rates
+		if rates and sample_rate not in rates:
+			sample_rate = max(rates)
+		if sample_rate is None:
+			defaults = [cap["default_sample_rate"] for cap in caps if cap["default_sample_rate"]]
+			sample_rate = defaults[0] if defaults else 44100.0
+
+		latencies = [cap["low_latency"] for cap in caps if cap["low_latency"]]
+		if latencies:
+			frames = max(latencies) * sample_rate
+			buffer_size = next((size for size in STREAM_BUFFER_SIZES if size >= frames), STREAM_BUFFER_SIZES[-1])
+		else:
+			buffer_size = DEFAULT_BUFFER_SIZE
+
+		return {
+			"sample_rate": float(sample_rate),
+			"buffer_size": buffer_size,
+			"latency_ms": 1000.0 * buffer_size / sample_rate,
+		}
@@ -1,30 +1,52 @@
-import RPi.GPIO as GPIO
-from RPLCD.gpio import CharLCD  # Ensure you're using the GPIO version of CharLCD
+import logging
+import time
+
 from Effect import Effect
-from AudioManager import AudioManager
-class LCDManager:
-	def __init__(self, next_b_pin, select_b_pin, rs_pin, en_pin, data_1_pin, data_2_pin, data_3_pin, data_4_pin):
-		# Set GPIO numbering mode to BOARD or BCM
-		GPIO.setmode(GPIO.BOARD)  # Use GPIO.BCM if you are using BCM numbering
+from Hardware import PiHardware
+from Telemetry import metrics
+
+log = logging.getLogger(__name__)
+
+LCD_COLS = 16
+LCD_ROWS = 2
 
-		# Initialize the LCD (using 4-bit mode) and specify the numbering_mode
-		self.lcd = CharLCD(cols=16, rows=2, pin_rs=37, pin_e=35, pins_data=[33, 31, 29, 23], numbering_mode=GPIO.BOARD)
+# Rough bus cost on the Pi: RPLCD sends each byte as two 4-bit nibbles with a
+# settle delay after each, and a clear needs ~2 ms on top
+LCD_BYTE_SECONDS = 200e-6
+LCD_CLEAR_SECONDS = 2e-3
+
+class LCDManager:
+	def __init__(self, next_b_pin, select_b_pin, rs_pin, en_pin, data_1_pin, data_2_pin, data_3_pin, data_4_pin, hardware=None):
+		# Real GPIO LCD by default; HeadlessHardware gives a virtual 16x2 display
+		if hardware is None:
+			hardware = PiHardware()
+		self.hardware = hardware
+		self.lcd = hardware.openDisplay(rs_pin, en_pin, [data_1_pin, data_2_pin, data_3_pin, data_4_pin])
 		self.lcd.cursor_mode = 'blink'
 		
-		print("Successfully initialized the LCDManager")
+		# Shadow of what is on the glass, so redraws only send the changes.
+		# Start from a known blank screen.
+		self.bus_bytes = 0
+		self.bus_clears = 0
+		self.frames = 0
+		self.lcd.clear()
+		self.bus_clears = self.bus_clears + 1
+		self.shadow = [' ' * LCD_COLS for i in range(LCD_ROWS)]
+		self.write_seconds = metrics.histogram("lcd_write_seconds", "Time to draw a frame on the LCD")
+		
+		log.info("Successfully initialized the LCDManager")
 		
 	def __str__(self):
 		return f"<LCDManager object>"
 	
 	def writeLCDLine(self, lines_array, line_num, audio_manager):
+		start = time.perf_counter()
 		top_line = line_num
 		if line_num % 2 == 1:
 			top_line = line_num - 1
 		
-		# Redraw array
-		self.lcd.clear()
+		frame = []
 		for i in range(2):
-			self.lcd.cursor_pos = (i,0)
 			effect = lines_array[top_line + i]
 			if audio_manager.isEffect(effect):
 				effect_obj = audio_manager.getEffectObj(effect)
@@ -34,16 +56,53 @@ class LCDManager:
 					line = self.neatLine(effect, 'off')
 			else:
 				line = effect
-			self.lcd.write_string(line)
+			frame.append(line)
 		
-		self.lcd.cursor_pos = ((line_num % 2),0)
+		self.drawFrame(frame)
+		self.moveCursor(line_num % 2, 0)
+		self.write_seconds.observe(time.perf_counter() - start)
+	
+	def drawFrame(self, frame):
+		# Diff the new frame against the shadow and write only the changed runs
+		# of characters. Runs separated by a single unchanged character are
+		# merged, since rewriting it costs the same byte as a cursor move.
+		self.frames = self.frames + 1
+		for row in range(LCD_ROWS):
+			new_line = frame[row][:LCD_COLS].ljust(LCD_COLS)
+			old_line = self.shadow[row]
+			col = 0
+			while col < LCD_COLS:
+				if new_line[col] == old_line[col]:
+					col = col + 1
+					continue
+				end = col + 1
+				while end < LCD_COLS and (new_line[end] != old_line[end] or (end + 1 < LCD_COLS and new_line[end + 1] != old_line[end + 1])):
+					end = end + 1
+				self.moveCursor(row, col)
+				self.writeChars(new_line[col:end])
+				col = end
+			self.shadow[row] = new_line
+	
+	def moveCursor(self, row, col):
+		self.lcd.cursor_pos = (row, col)
+		self.bus_bytes = self.bus_bytes + 1
+	
+	def writeChars(self, chars):
+		self.lcd.write_string(chars)
+		self.bus_bytes = self.bus_bytes + len(chars)
+	
+	def getBusBytes(self):
+		return self.bus_bytes
+	
+	def getFrames(self):
+		return self.frames
+	
+	def getBusTime(self):
+		# Estimated seconds spent on the LCD bus so far
+		return self.bus_bytes * LCD_BYTE_SECONDS + self.bus_clears * LCD_CLEAR_SECONDS
 	
 	def setHello(self):
-		# Write "Hello world!" to the second row, fourth column
-		self.lcd.cursor_pos = (0,0)  # Row 1 (second row), column 3 (fourth character position)
-		self.lcd.write_string(u'Welcome to SOUL!')
-		self.lcd.cursor_pos = (1,0)  # Row 1 (second row), column 3 (fourth character position)
-		self.lcd.write_string(u'hi :)')
+		self.drawFrame([u'Welcome to SOUL!', u'hi :)'])
 	
 	def neatLine(self, item1, item2):
 		char_nums = 16
@@ -51,4 +110,4 @@ class LCDManager:
 		return neat_line[:char_nums]
 	
 	def cleanGPIO(self):
-		GPIO.cleanup()
+		self.hardware.cleanup()
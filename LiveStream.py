@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from Telemetry import metrics
+
+log = logging.getLogger(__name__)
+
+# Live pass-through defaults
+LIVE_SAMPLERATE = 44100.0
+LIVE_BUFFER_SIZE = 512
+
+# Number of recent blocks the timing percentiles are taken over
+STATS_WINDOW = 4096
+
+class LiveStreamStats:
+	# Counters and a preallocated ring of per-block processing times. Only the
+	# audio thread writes; getStats() may read from any thread.
+	def __init__(self, sample_rate, buffer_size, window=STATS_WINDOW):
+		self.sample_rate = sample_rate
+		self.buffer_size = buffer_size
+		self.durations = np.zeros(window, dtype=np.float64)
+		self.blocks = 0
+		self.underruns = 0
+		self.overruns = 0
+		self.dropped_frames = 0
+		self.buffered_input = 0
+
+	def addBlock(self, duration):
+		self.durations[self.blocks % len(self.durations)] = duration
+		self.blocks = self.blocks + 1
+
+	def getStats(self):
+		filled = self.durations[:min(self.blocks, len(self.durations))]
+		if len(filled):
+			p50, p95, p99 = (float(p) for p in np.percentile(filled, [50, 95, 99]))
+			worst = float(filled.max())
+		else:
+			p50 = p95 = p99 = worst = 0.0
+
+		# Input block + queued input + output block, plus the typical processing time
+		block_ms = 1000.0 * self.buffer_size / self.sample_rate
+		queued_ms = 1000.0 * self.buffered_input / self.sample_rate
+		return {
+			"sample_rate": self.sample_rate,
+			"buffer_size": self.buffer_size,
+			"blocks": self.blocks,
+			"block_ms": block_ms,
+			"latency_ms": 2 * block_ms + queued_ms + 1000.0 * p50,
+			"callback_p50_ms": 1000.0 * p50,
+			"callback_p95_ms": 1000.0 * p95,
+			"callback_p99_ms": 1000.0 * p99,
+			"callback_max_ms": 1000.0 * worst,
+			"load": p50 * self.sample_rate / self.buffer_size,
+			"underruns": self.underruns,
+			"overruns": self.overruns,
+			"dropped_frames": self.dropped_frames,
+		}
+
+class LiveStream:
+	# Live pass-through on a background thread: read a block from the input
+	# device (opened through the hardware audio backend), run it through the
+	# AudioManager's current board, write it to the output device. The board
+	# is looked up every block, so updateBoard() swaps take effect on the
+	# next block without touching the stream.
+	def __init__(self, audio_manager, audio_backend, input_device_name, output_device_name,
+			sample_rate=LIVE_SAMPLERATE, buffer_size=LIVE_BUFFER_SIZE,
+			num_input_channels=1, num_output_channels=2):
+		self.audio_manager = audio_manager
+		self.audio_backend = audio_backend
+		self.input_device_name = input_device_name
+		self.output_device_name = output_device_name
+		self.sample_rate = sample_rate
+		self.buffer_size = buffer_size
+		self.num_input_channels = num_input_channels
+		self.num_output_channels = num_output_channels
+
+		self.stats = LiveStreamStats(sample_rate, buffer_size)
+		# The same xruns, kept across streams for the MetricsExporter
+		self.underruns = metrics.counter("stream_underruns_total", "Live stream output underruns")
+		self.overruns = metrics.counter("stream_overruns_total", "Live stream input overruns")
+		self.dropped_frames = metrics.counter("stream_dropped_frames_total", "Input frames dropped by the live stream")
+		self.out_buffer = np.zeros((num_output_channels, buffer_size), dtype=np.float32)
+		self.running = False
+		self.error = None
+		self.thread = None
+
+	def __str__(self):
+		return f"<LiveStream object>"
+
+	def start(self):
+		# Returns straight away; devices are opened on the stream thread so a
+		# GPIO callback never waits on the audio hardware
+		if self.running:
+			return
+		self.running = True
+		self.error = None
+		self.thread = threading.Thread(target=self.run, name="LiveStream", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	def isRunning(self):
+		return self.running
+
+	def getStats(self):
+		return self.stats.getStats()
+
+	def run(self):
+		try:
+			with self.audio_backend.openInputStream(self.input_device_name, self.sample_rate,
+					self.buffer_size, self.num_input_channels) as in_stream:
+				with self.audio_backend.openOutputStream(self.output_device_name, self.sample_rate,
+						self.buffer_size, self.num_output_channels) as out_stream:
+					in_stream.ignore_dropped_input = True
+					self.processBlocks(in_stream, out_stream)
+		except Exception as e:
+			self.error = e
+			log.error("Live stream stopped: %s", e)
+			self.running = False
+			self.audio_manager.streamFailed()
+		finally:
+			self.running = False
+
+	def processBlocks(self, in_stream, out_stream):
+		stats = self.stats
+		# Underruns are whatever the output device reports; pedalboard's
+		# AudioStream has no output counter, so there they stay at 0
+		underruns_before = getattr(out_stream, "output_underrun_count", 0)
+
+		param_control = self.audio_manager.param_control
+		looper = self.audio_manager.looper
+		# Board state carries from block to block
+		self.audio_manager.getStreamBoard().reset()
+		while self.running:
+			audio_in = in_stream.read(self.buffer_size)
+
+			dropped = in_stream.dropped_input_frame_count
+			if dropped:
+				stats.overruns = stats.overruns + 1
+				stats.dropped_frames = stats.dropped_frames + dropped
+				self.overruns.inc()
+				self.dropped_frames.inc(dropped)
+			stats.buffered_input = in_stream.buffered_input_sample_count or 0
+
+			start = time.perf_counter()
+			self.audio_manager.takePendingReset()
+			# Parameter glides are applied between segments of the block; mono
+			# chains fan out across the output channels without allocating.
+			# The looper plays into the board's input or onto its output.
+			board_in = looper.processInput(audio_in)
+			frames = param_control.process(self.audio_manager.getStreamBoard(), board_in, self.sample_rate, self.out_buffer)
+			looper.processOutput(self.out_buffer, frames)
+			stats.addBlock(time.perf_counter() - start)
+
+			out_stream.write(self.out_buffer[:, :frames], self.sample_rate)
+			underruns = getattr(out_stream, "output_underrun_count", 0)
+			if underruns != underruns_before:
+				stats.underruns = stats.underruns + underruns - underruns_before
+				self.underruns.inc(underruns - underruns_before)
+				underruns_before = underruns
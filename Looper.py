@@ -0,0 +1,266 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+from WavFile import createWav, WAV_BLOCK_FRAMES
+
+log = logging.getLogger(__name__)
+
+# Longest loop, and the channels a loop can hold
+LOOPER_SECONDS = 60.0
+LOOPER_CHANNELS = 2
+
+# Where finished passes are saved, and how often the saver looks for one
+LOOPER_DIR = "loops"
+LOOPER_FILE = "loop.wav"
+LOOPER_FLUSH_SECONDS = 0.25
+
+# What press() moves each state on to
+LOOPER_NEXT = {
+	"empty": "recording",
+	"recording": "playing",
+	"playing": "overdubbing",
+	"overdubbing": "playing",
+	"stopped": "playing",
+}
+
+class Looper:
+	# Records the live stream into a preallocated float32 ring and plays it
+	# back in a loop, with overdubs added on top. With source "input" the dry
+	# input is looped and played back into the board with the live input, so
+	# the loop follows the current effects; with "output" the processed audio
+	# is looped and added after the board.
+	#
+	# The control side only asks for a state (request); the audio thread
+	# takes it up at the start of its next block and is the only writer of
+	# the ring and positions, working on views of preallocated buffers. Each
+	# finished recording or overdub pass is saved to a WAV by a background
+	# thread, which starts again if a new pass began while it was writing.
+	def __init__(self, seconds=LOOPER_SECONDS, sample_rate=44100.0, num_channels=LOOPER_CHANNELS,
+			loop_dir=LOOPER_DIR, flush_seconds=LOOPER_FLUSH_SECONDS):
+		self.seconds = seconds
+		self.max_channels = num_channels
+		self.loop_file = os.path.join(loop_dir, LOOPER_FILE)
+		self.flush_seconds = flush_seconds
+
+		self.source = "input"
+		self.request = "empty"
+		self.state = "empty"
+		self.mix_buffer = np.zeros((1, 0), dtype=np.float32)
+		self.setSampleRate(sample_rate)
+
+		# Passes finished by the audio thread, and the last one saved
+		self.passes = 0
+		self.flushed = 0
+		self.flushes = 0
+		self.thread = None
+		self.stopping = threading.Event()
+
+		log.info("Successfully initialized the Looper")
+
+	def __str__(self):
+		return f"<Looper object>"
+
+	def setSampleRate(self, sample_rate):
+		# The ring holds seconds of audio at this rate. Changing the rate
+		# drops the loop; call while the audio thread isn't running.
+		self.sample_rate = sample_rate
+		self.capacity = int(self.seconds * sample_rate)
+		self.ring = np.zeros((self.max_channels, self.capacity), dtype=np.float32)
+		self.clearLoop()
+
+	def prepare(self, sample_rate, max_frames, num_input_channels):
+		# Size the buffers for a stream before it starts
+		if sample_rate != self.sample_rate:
+			self.setSampleRate(sample_rate)
+		if self.mix_buffer.shape[0] != num_input_channels or self.mix_buffer.shape[1] < max_frames:
+			self.mix_buffer = np.zeros((num_input_channels, max_frames), dtype=np.float32)
+
+	def clearLoop(self):
+		self.request = "empty"
+		self.state = "empty"
+		self.num_channels = 0
+		self.write_pos = 0
+		self.recorded = 0
+		self.start = 0
+		self.length = 0
+		self.position = 0
+		self.writing = False
+
+	def getState(self):
+		return self.request
+
+	def getSource(self):
+		return self.source
+
+	def setSource(self, source):
+		# Only an empty looper can change what it records
+		if self.request == "empty":
+			self.source = source
+		return self.source
+
+	def press(self):
+		# Record, play, overdub, play, ... Returns the state asked for.
+		self.request = LOOPER_NEXT[self.request]
+		return self.request
+
+	def stop(self):
+		if self.request != "empty":
+			self.request = "stopped"
+		return self.request
+
+	def clear(self):
+		self.request = "empty"
+		return self.request
+
+	def getLoopSeconds(self):
+		return self.length / self.sample_rate
+
+	def takeRequest(self):
+		request = self.request
+		state = self.state
+		if request == state:
+			return
+		if state == "recording":
+			# Close the loop: the last capacity frames if it ran past the end
+			self.length = min(self.recorded, self.capacity)
+			self.start = (self.write_pos - self.length) % self.capacity
+			self.position = 0
+			self.passes = self.passes + 1
+		elif state == "overdubbing":
+			self.passes = self.passes + 1
+		if request == "recording":
+			self.write_pos = 0
+			self.recorded = 0
+		elif request == "stopped":
+			self.position = 0
+		elif request == "empty" or self.length == 0:
+			# Nothing recorded: back to empty
+			if request != "empty":
+				self.request = "empty"
+			request = "empty"
+			self.length = 0
+		self.writing = request in ("recording", "overdubbing")
+		self.state = request
+
+	def processInput(self, audio_in):
+		# Before the board: the block for the board to run, with the loop
+		# played in when looping the input
+		self.takeRequest()
+		if self.source != "input" or self.state in ("empty", "stopped"):
+			return audio_in
+		frames = audio_in.shape[1]
+		if self.mix_buffer.shape[0] != audio_in.shape[0] or self.mix_buffer.shape[1] < frames:
+			# A bigger block than prepared for
+			self.mix_buffer = np.zeros((audio_in.shape[0], frames), dtype=np.float32)
+		mixed = self.mix_buffer[:, :frames]
+		channels = min(audio_in.shape[0], self.max_channels)
+		if channels < audio_in.shape[0]:
+			np.copyto(mixed[channels:], audio_in[channels:])
+		self.run(audio_in[:channels], mixed[:channels])
+		return mixed
+
+	def processOutput(self, out, frames):
+		# After the board: loop the processed block in out[:, :frames] in place
+		if self.source != "output" or self.state in ("empty", "stopped"):
+			return
+		block = out[:min(out.shape[0], self.max_channels), :frames]
+		self.run(block, block)
+
+	def run(self, live, mixed):
+		# Record, overdub or play one block, in runs that don't cross the end
+		# of the ring or the loop. mixed may be live itself.
+		frames = live.shape[1]
+		state = self.state
+		if state == "recording":
+			self.num_channels = live.shape[0]
+		ring = self.ring[:live.shape[0]]
+		done = 0
+		while done < frames:
+			if state == "recording":
+				index = self.write_pos % self.capacity
+				count = min(frames - done, self.capacity - index)
+			else:
+				index = (self.start + self.position) % self.capacity
+				count = min(frames - done, self.length - self.position, self.capacity - index)
+			live_run = live[:, done:done + count]
+			ring_run = ring[:, index:index + count]
+			mixed_run = mixed[:, done:done + count]
+			if state == "recording":
+				np.copyto(ring_run, live_run)
+				if mixed is not live:
+					np.copyto(mixed_run, live_run)
+				self.write_pos = self.write_pos + count
+				self.recorded = self.recorded + count
+			else:
+				if state == "overdubbing":
+					np.add(ring_run, live_run, out=ring_run)
+					np.copyto(mixed_run, ring_run)
+				else:
+					np.add(live_run, ring_run, out=mixed_run)
+				self.position = (self.position + count) % self.length
+			done = done + count
+
+	def startSaver(self):
+		# Runs alongside the live stream
+		if self.thread is not None:
+			return
+		self.stopping.clear()
+		self.thread = threading.Thread(target=self.runSaver, name="LooperSaver", daemon=True)
+		self.thread.start()
+
+	def close(self):
+		# Stop the saver, saving a pass it hasn't got to yet. Call once the
+		# audio thread has stopped: a recording or overdub still going is
+		# ended here as a press would, so the pass isn't lost.
+		self.stopping.set()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		if self.request in ("recording", "overdubbing"):
+			self.request = "playing"
+		self.takeRequest()
+		self.flush()
+
+	def runSaver(self):
+		# Polls rather than being woken, so the audio thread never takes a
+		# lock; only close() wakes it early
+		while not self.stopping.wait(self.flush_seconds):
+			self.flush()
+
+	def flush(self):
+		# Save the loop if a pass has finished since the last save. Returns
+		# True once the file holds it.
+		passes = self.passes
+		if passes == self.flushed or self.writing or self.length == 0:
+			return False
+		partial_file = self.loop_file[:-len(".wav")] + ".partial.wav"
+		os.makedirs(os.path.dirname(partial_file) or ".", exist_ok=True)
+		start, length, channels = self.start, self.length, self.num_channels
+		with createWav(partial_file, self.sample_rate, channels, length) as f:
+			position = 0
+			while position < length:
+				index = (start + position) % self.capacity
+				count = min(WAV_BLOCK_FRAMES, length - position, self.capacity - index)
+				f.write(position, self.ring[:channels, index:index + count])
+				position = position + count
+		if self.passes != passes or self.writing:
+			# A new pass started while writing; the next poll saves that one
+			os.remove(partial_file)
+			return False
+		os.replace(partial_file, self.loop_file)
+		self.flushed = passes
+		self.flushes = self.flushes + 1
+		return True
+
+	def getStats(self):
+		return {
+			"state": self.state,
+			"source": self.source,
+			"loop_seconds": self.getLoopSeconds(),
+			"capacity_seconds": self.capacity / self.sample_rate,
+			"passes": self.passes,
+			"flushes": self.flushes,
+		}
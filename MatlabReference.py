@@ -0,0 +1,162 @@
+import numpy as np
+
+from NumpyEffects import (FREEVERB_COMB_LENGTHS, FREEVERB_ALLPASS_LENGTHS, FREEVERB_STEREO_SPREAD,
+	FREEVERB_COMB_DAMPING, FREEVERB_ALLPASS_FEEDBACK, FREEVERB_INPUT_GAIN, FREEVERB_MINOR_FRAME)
+
+# Sample-by-sample ports of the MATLAB/Audio Examples designs, kept as close
+# to the .m code as Python allows (the loops of DelayFilter.m's codegen
+# branch, the step methods of Echo.m, Flanger.m and FreeverbReverberator.m).
+# Too slow for the pedal; they are the reference the block-based NumPy
+# processors are checked against. Audio is (channels, frames) like the
+# processors, not MATLAB's (frames, channels).
+
+# DelayFilter.m's MaxSampleRate: the length of each channel's delay line
+MATLAB_MAX_DELAY = 192000
+
+class MatlabDelayFilter:
+	# DelayFilter.m: one circular line per channel, written then read at
+	# floor(delay) back, interpolated with the sample before it
+	def __init__(self, feedback=0.0):
+		self.feedback = feedback
+		self.line = None
+
+	def __str__(self):
+		return f"<MatlabDelayFilter object>"
+
+	def step(self, delays, audio):
+		num_channels, num_frames = audio.shape
+		if self.line is None:
+			self.line = np.zeros((num_channels, MATLAB_MAX_DELAY))
+			self.write_index = 0
+			self.feedback_value = np.zeros(num_channels)
+		delays = np.broadcast_to(np.asarray(delays, dtype=np.float64), (num_frames,))
+		out = np.zeros((num_channels, num_frames))
+		for j in range(num_channels):
+			line = self.line[j]
+			write_index = self.write_index
+			for i in range(num_frames):
+				line[write_index] = audio[j, i] + self.feedback * self.feedback_value[j]
+				if delays[i] > 0:
+					int_offset = int(np.floor(delays[i]))
+					float_offset = delays[i] - int_offset
+				else:
+					int_offset = 0
+					float_offset = 0.0
+				read_index = (write_index - int_offset) % MATLAB_MAX_DELAY
+				out[j, i] = float_offset * line[read_index - 1] + (1 - float_offset) * line[read_index]
+				self.feedback_value[j] = out[j, i]
+				write_index = (write_index + 1) % MATLAB_MAX_DELAY
+		self.write_index = (self.write_index + num_frames) % MATLAB_MAX_DELAY
+		return out
+
+class MatlabEcho:
+	# Echo.m
+	def __init__(self, delay_seconds=0.5, gain=0.5, feedback=0.35, mix=0.5):
+		self.delay_seconds = delay_seconds
+		self.gain = gain
+		self.mix = mix
+		self.delay = MatlabDelayFilter(feedback)
+
+	def __str__(self):
+		return f"<MatlabEcho object>"
+
+	def step(self, audio, sample_rate):
+		out = self.delay.step(self.delay_seconds * sample_rate, audio)
+		return (1 - self.mix) * audio + self.mix * (self.gain * out)
+
+class MatlabFlanger:
+	# Flanger.m, with its dsp.SineWave (phase 0) counted in samples
+	def __init__(self, delay_seconds=0.001, depth=30.0, rate_hz=0.25, feedback=0.4, mix=0.5):
+		self.delay_seconds = delay_seconds
+		self.depth = depth
+		self.rate_hz = rate_hz
+		self.mix = mix
+		self.delay = MatlabDelayFilter(feedback)
+		self.sample = 0
+
+	def __str__(self):
+		return f"<MatlabFlanger object>"
+
+	def step(self, audio, sample_rate):
+		num_frames = audio.shape[1]
+		n = self.sample + np.arange(num_frames)
+		self.sample = self.sample + num_frames
+		delays = self.delay_seconds * sample_rate + self.depth * np.sin(2 * np.pi * self.rate_hz * n / sample_rate)
+		out = self.delay.step(delays, audio)
+		return (1 - self.mix) * audio + self.mix * out
+
+class MatlabFreeverb:
+	# FreeverbReverberator.m: 16 dsp.Delay combs fed through one dsp.IIRFilter
+	# lowpass, then four dsp.IIRFilter allpasses per side, a minor frame at
+	# a time
+	def __init__(self, room_size=0.6, width=1.0, mix=0.5, balance=0.5, volume=1.0):
+		self.room_size = room_size
+		self.width = width
+		self.mix = mix
+		self.balance = balance
+		self.volume = volume
+		spread = FREEVERB_STEREO_SPREAD
+		self.comb_lengths = FREEVERB_COMB_LENGTHS + [l + spread for l in FREEVERB_COMB_LENGTHS]
+		self.combs = [np.zeros(l) for l in self.comb_lengths]
+		self.lowpass = np.zeros(16)
+		self.allpass_lengths = [FREEVERB_ALLPASS_LENGTHS, [l + spread for l in FREEVERB_ALLPASS_LENGTHS]]
+		self.allpass_in = [[np.zeros(l) for l in side] for side in self.allpass_lengths]
+		self.allpass_out = [[np.zeros(l) for l in side] for side in self.allpass_lengths]
+		self.comb_position = 0
+		self.allpass_position = 0
+
+	def __str__(self):
+		return f"<MatlabFreeverb object>"
+
+	def parallelComb(self, dry):
+		# output() the whole frame before update(): the combs are never
+		# shorter than a minor frame
+		t = FREEVERB_INPUT_GAIN * dry.sum(axis=0)
+		scaling = np.log2(7 * self.room_size + 1) / np.log2(8)
+		damping = FREEVERB_COMB_DAMPING
+		size = t.shape[0]
+		o = np.zeros((16, size))
+		for k, comb in enumerate(self.combs):
+			for i in range(size):
+				o[k, i] = comb[(self.comb_position + i) % len(comb)]
+		for k, comb in enumerate(self.combs):
+			for i in range(size):
+				self.lowpass[k] = (1 - damping) * o[k, i] + damping * self.lowpass[k]
+				comb[(self.comb_position + i) % len(comb)] = t[i] + scaling * self.lowpass[k]
+		self.comb_position = self.comb_position + size
+		return np.stack([o[:8].sum(axis=0), o[8:].sum(axis=0)])
+
+	def seriesAllPass(self, signal):
+		gain = FREEVERB_ALLPASS_FEEDBACK
+		out = np.zeros(signal.shape)
+		for side in range(2):
+			x = signal[side]
+			for stage, length in enumerate(self.allpass_lengths[side]):
+				ins = self.allpass_in[side][stage]
+				outs = self.allpass_out[side][stage]
+				y = np.zeros(x.shape[0])
+				for i in range(x.shape[0]):
+					# y[n] = -g*x[n] + x[n-L] + g*y[n-L]
+					index = (self.allpass_position + i) % length
+					y[i] = -gain * x[i] + ins[index] + gain * outs[index]
+					ins[index] = x[i]
+					outs[index] = y[i]
+				x = y
+			out[side] = x
+		self.allpass_position = self.allpass_position + signal.shape[1]
+		return out
+
+	def mixer(self, dry, wet):
+		width = self.width
+		spread = np.array([[0.5 + width / 2, 0.5 - width / 2], [0.5 - width / 2, 0.5 + width / 2]])
+		reverb = (spread.T @ wet) * min(0.5, self.mix) + dry * min(0.5, 1 - self.mix)
+		return np.stack([reverb[0] * 2 * (1 - self.balance), reverb[1] * 2 * self.balance]) * self.volume
+
+	def step(self, audio, sample_rate):
+		# Blocks of whole minor frames: the .m code zero-pads a short last
+		# frame and runs the padding through the filters too
+		wet = np.zeros(audio.shape)
+		for start in range(0, audio.shape[1], FREEVERB_MINOR_FRAME):
+			end = min(start + FREEVERB_MINOR_FRAME, audio.shape[1])
+			wet[:, start:end] = self.seriesAllPass(self.parallelComb(audio[:, start:end]))
+		return self.mixer(audio, wet)
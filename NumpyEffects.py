@@ -0,0 +1,396 @@
+import numpy as np
+from pedalboard import Pedalboard, Plugin
+
+# Block-based NumPy ports of the MATLAB/Audio Examples designs. Each processor
+# takes and returns (channels, frames) float32 audio and is called like a
+# pedalboard plugin, processor(audio, sample_rate, reset=False), so it can sit
+# in an EffectChain between pedalboard plugins.
+#
+# None of them loop per sample in Python. Recursive parts are computed a chunk
+# at a time, where a chunk is never longer than the shortest feedback path, so
+# every sample a chunk reads was already computed by an earlier one.
+
+# Longest modulated delay the DelayFilter is sized for, in seconds
+MAX_DELAY_SECONDS = 1.0
+
+# The Phaser's sweep is updated once per this many samples
+PHASER_CONTROL_SIZE = 32
+
+# Freeverb tuning, as in FreeverbReverberator.m
+FREEVERB_COMB_LENGTHS = [1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617]
+FREEVERB_ALLPASS_LENGTHS = [556, 441, 341, 225]
+FREEVERB_STEREO_SPREAD = 23
+FREEVERB_COMB_DAMPING = 0.25
+FREEVERB_ALLPASS_FEEDBACK = 0.5
+FREEVERB_INPUT_GAIN = 0.015
+FREEVERB_MINOR_FRAME = 128
+
+def onePoleMatrix(pole, size):
+	# Lower-triangular Toeplitz matrix of pole^(n-k), so that for the filter
+	# y[n] = u[n] + pole*y[n-1], a chunk from rest is y = matrix @ u
+	diff = np.subtract.outer(np.arange(size), np.arange(size))
+	return np.where(diff >= 0, np.power(pole, np.maximum(diff, 0)), 0).astype(np.float32)
+
+class DelayFilter:
+	# Port of DelayFilter.m: a feedback delay line read at a fractional,
+	# per-sample delay (in samples) with linear interpolation:
+	#   d[n] = x[n] + feedback*y[n-1]
+	#   y[n] = (1-frac)*d[n-int] + frac*d[n-int-1]
+	def __init__(self, feedback=0.0, max_delay_seconds=MAX_DELAY_SECONDS):
+		self.feedback = feedback
+		self.max_delay_seconds = max_delay_seconds
+		self.history_size = None
+		self.line = None
+		self.last_out = None
+
+	def __str__(self):
+		return f"<DelayFilter object>"
+
+	def reset(self):
+		self.line = None
+		self.last_out = None
+
+	def setup(self, num_channels, num_frames, sample_rate):
+		# The line holds the last history_size samples followed by room for
+		# one block; it is only reallocated when the block size changes
+		self.history_size = int(self.max_delay_seconds * sample_rate) + 2
+		self.line = np.zeros((num_channels, self.history_size + num_frames), dtype=np.float32)
+		self.last_out = np.zeros(num_channels, dtype=np.float32)
+
+	def process(self, audio, delays, sample_rate):
+		num_channels, num_frames = audio.shape
+		if self.line is None or self.line.shape[0] != num_channels:
+			self.setup(num_channels, num_frames, sample_rate)
+		elif self.line.shape[1] != self.history_size + num_frames:
+			# New block size: keep the history, resize the room after it
+			history = self.line[:, :self.history_size].copy()
+			self.line = np.zeros((num_channels, self.history_size + num_frames), dtype=np.float32)
+			self.line[:, :self.history_size] = history
+
+		delays = np.clip(np.broadcast_to(delays, (num_frames,)), 0, self.history_size - 2)
+		ints = np.floor(delays).astype(np.int64)
+		fracs = (delays - ints).astype(np.float32)
+		line = self.line
+		start = self.history_size
+		out = np.empty((num_channels, num_frames), dtype=np.float32)
+
+		n = 0
+		while n < num_frames:
+			# Longest chunk whose reads all land before the chunk
+			size = min(int(ints[n]), num_frames - n)
+			while size > 0:
+				shortest = int(ints[n:n + size].min())
+				if shortest >= size:
+					break
+				size = shortest
+			if size == 0:
+				# Delays under one sample read the sample being written, so
+				# the whole run of them is solved as one recursion
+				zeros = ints[n:] != 0
+				end = n + int(zeros.argmax()) if zeros.any() else num_frames
+				self.processShortRun(audio, fracs, n, end)
+				out[:, n:end] = (1 - fracs[n:end]) * line[:, start + n:start + end] + fracs[n:end] * line[:, start + n - 1:start + end - 1]
+				self.last_out = out[:, end - 1]
+				n = end
+				continue
+
+			chunk = slice(n, n + size)
+			reads = start + np.arange(n, n + size) - ints[chunk]
+			out[:, chunk] = (1 - fracs[chunk]) * line[:, reads] + fracs[chunk] * line[:, reads - 1]
+			line[:, start + n] = audio[:, n] + self.feedback * self.last_out
+			line[:, start + n + 1:start + n + size] = audio[:, n + 1:n + size] + self.feedback * out[:, n:n + size - 1]
+			self.last_out = out[:, n + size - 1]
+			n = n + size
+
+		# Keep the newest history_size samples at the front for the next block
+		line[:, :start] = line[:, num_frames:num_frames + start]
+		return out
+
+	def processShortRun(self, audio, fracs, n, end):
+		# Writes the line for samples n..end-1, all with delays under one
+		# sample. Each line sample then depends on the two before it:
+		#   d[i] = x[i] + feedback*((1-frac[i-1])*d[i-1] + frac[i-1]*d[i-2])
+		# so the run is a prefix product of 3x3 affine steps on
+		# (d[i], d[i-1], 1), taken in log2(run) batched matmuls.
+		line = self.line
+		pos = self.history_size + n
+		size = end - n
+		line[:, pos] = audio[:, n] + self.feedback * self.last_out
+		if size == 1:
+			return
+		num_channels = audio.shape[0]
+		steps = np.zeros((num_channels, size - 1, 3, 3))
+		steps[:, :, 0, 0] = self.feedback * (1 - fracs[n:end - 1])
+		steps[:, :, 0, 1] = self.feedback * fracs[n:end - 1]
+		steps[:, :, 0, 2] = audio[:, n + 1:end]
+		steps[:, :, 1, 0] = 1
+		steps[:, :, 2, 2] = 1
+		shift = 1
+		while shift < size - 1:
+			steps[:, shift:] = steps[:, shift:] @ steps[:, :-shift]
+			shift = shift * 2
+		state = np.stack([line[:, pos], line[:, pos - 1], np.ones(num_channels)], axis=1).astype(np.float64)
+		line[:, pos + 1:pos + size] = (steps[:, :, 0] @ state[:, :, None])[..., 0]
+
+class Flanger:
+	# Port of Flanger.m: a DelayFilter swept by a sine LFO of depth samples
+	# around delay_seconds
+	def __init__(self, delay_seconds=0.001, depth=30.0, rate_hz=0.25, feedback=0.4, mix=0.5):
+		self.delay_seconds = delay_seconds
+		self.depth = depth
+		self.rate_hz = rate_hz
+		self.feedback = feedback
+		self.mix = mix
+		self.delay_filter = DelayFilter(max_delay_seconds=0.1 + 64 / 44100.0)
+		self.phase = 0.0
+
+	def __str__(self):
+		return f"<Flanger object>"
+
+	def reset(self):
+		self.delay_filter.reset()
+		self.phase = 0.0
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.reset()
+		num_frames = audio.shape[1]
+		step = 2 * np.pi * self.rate_hz / sample_rate
+		lfo = self.depth * np.sin(self.phase + step * np.arange(num_frames))
+		self.phase = (self.phase + step * num_frames) % (2 * np.pi)
+
+		self.delay_filter.feedback = self.feedback
+		wet = self.delay_filter.process(audio, self.delay_seconds * sample_rate + lfo, sample_rate)
+		return ((1 - self.mix) * audio + self.mix * wet).astype(np.float32)
+
+class Echo:
+	# Port of Echo.m: a fixed DelayFilter with feedback, the wet signal scaled by gain
+	def __init__(self, delay_seconds=0.5, gain=0.5, feedback=0.35, mix=0.5):
+		self.delay_seconds = delay_seconds
+		self.gain = gain
+		self.feedback = feedback
+		self.mix = mix
+		self.delay_filter = DelayFilter(max_delay_seconds=MAX_DELAY_SECONDS)
+
+	def __str__(self):
+		return f"<Echo object>"
+
+	def reset(self):
+		self.delay_filter.reset()
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.reset()
+		self.delay_filter.feedback = self.feedback
+		wet = self.delay_filter.process(audio, self.delay_seconds * sample_rate, sample_rate)
+		return ((1 - self.mix) * audio + self.mix * self.gain * wet).astype(np.float32)
+
+class Phaser:
+	# Four first-order allpass stages whose break frequency is swept by a sine
+	# LFO, depth octaves*2 either side of centre_frequency_hz, and mixed back
+	# with the dry signal to make the notches. The coefficient is updated every
+	# PHASER_CONTROL_SIZE samples; each stage then runs a whole block as a
+	# batch of small matrix products.
+	def __init__(self, rate_hz=0.5, depth=0.5, centre_frequency_hz=1300.0, mix=0.5, stages=4):
+		self.rate_hz = rate_hz
+		self.depth = depth
+		self.centre_frequency_hz = centre_frequency_hz
+		self.mix = mix
+		self.stages = stages
+		self.phase = 0.0
+		self.last_in = None
+		self.last_out = None
+
+		size = PHASER_CONTROL_SIZE
+		self.lag = np.maximum(np.subtract.outer(np.arange(size), np.arange(size)), 0)
+		self.causal = np.tri(size, dtype=bool)
+
+	def __str__(self):
+		return f"<Phaser object>"
+
+	def reset(self):
+		self.phase = 0.0
+		self.last_in = None
+		self.last_out = None
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.reset()
+		num_channels, num_frames = audio.shape
+		if self.last_in is None or self.last_in.shape[1] != num_channels:
+			self.last_in = np.zeros((self.stages, num_channels), dtype=np.float32)
+			self.last_out = np.zeros((self.stages, num_channels), dtype=np.float32)
+
+		size = PHASER_CONTROL_SIZE
+		num_chunks = -(-num_frames // size)
+		padded = num_chunks * size
+
+		# One allpass coefficient per chunk, a = (tan(w/2) - 1)/(tan(w/2) + 1)
+		step = 2 * np.pi * self.rate_hz / sample_rate
+		lfo = np.sin(self.phase + step * size * np.arange(num_chunks))
+		self.phase = (self.phase + step * num_frames) % (2 * np.pi)
+		freqs = np.clip(self.centre_frequency_hz * 2.0 ** (2 * self.depth * lfo), 20.0, 0.45 * sample_rate)
+		t = np.tan(np.pi * freqs / sample_rate)
+		coeffs = ((t - 1) / (t + 1)).astype(np.float32)
+
+		# Powers of the pole (-a) per chunk: matrices for the zero-state
+		# response and the decay of each chunk's starting state
+		powers = np.power.outer(-coeffs, np.arange(size + 1)).astype(np.float32)
+		matrices = np.where(self.causal, powers[:, self.lag], 0)
+
+		# Padded to whole chunks; the state is taken at the block's real end
+		x = np.zeros((num_channels, padded), dtype=np.float32)
+		x[:, :num_frames] = audio
+		for stage in range(self.stages):
+			# y[n] = a*x[n] + x[n-1] - a*y[n-1]
+			prev = np.concatenate([self.last_in[stage][:, None], x[:, :-1]], axis=1)
+			drive = coeffs.repeat(size) * x + prev
+			zero_state = np.matmul(matrices[:, None], drive.reshape(num_channels, num_chunks, size, 1).transpose(1, 0, 2, 3))[..., 0]
+
+			# Carry each chunk's last output into the next
+			carries = np.empty((num_chunks, num_channels), dtype=np.float32)
+			carry = self.last_out[stage]
+			for chunk in range(num_chunks):
+				carries[chunk] = carry
+				carry = zero_state[chunk, :, size - 1] + powers[chunk, size] * carry
+			y = zero_state + powers[:, None, 1:] * carries[:, :, None]
+			y = y.transpose(1, 0, 2).reshape(num_channels, padded)
+
+			self.last_in[stage] = x[:, num_frames - 1]
+			self.last_out[stage] = y[:, num_frames - 1]
+			x = y
+			x[:, num_frames:] = 0
+
+		wet = x[:, :num_frames]
+		return ((1 - self.mix) * audio + self.mix * wet).astype(np.float32)
+
+class Freeverb:
+	# Port of FreeverbReverberator.m: eight damped feedback combs and four
+	# allpasses per side, the right side spread by FREEVERB_STEREO_SPREAD
+	# samples. All sixteen combs run as one batch per minor frame, the damping
+	# lowpass as a matrix product. Mono input gets the average of the two
+	# reverb channels back, so a chain keeps its channel count.
+	def __init__(self, room_size=0.6, width=1.0, mix=0.5, balance=0.5, volume=1.0):
+		self.room_size = room_size
+		self.width = width
+		self.mix = mix
+		self.balance = balance
+		self.volume = volume
+
+		spread = FREEVERB_STEREO_SPREAD
+		frame = FREEVERB_MINOR_FRAME
+		comb_lengths = np.array(FREEVERB_COMB_LENGTHS + [l + spread for l in FREEVERB_COMB_LENGTHS])
+		self.comb_history = int(comb_lengths.max())
+		self.comb_reads = self.comb_history - comb_lengths[:, None] + np.arange(frame)
+		self.comb_rows = np.arange(len(comb_lengths))[:, None]
+
+		allpass_lengths = np.array([FREEVERB_ALLPASS_LENGTHS, [l + spread for l in FREEVERB_ALLPASS_LENGTHS]])
+		self.allpass_history = int(allpass_lengths.max())
+		self.allpass_reads = [self.allpass_history - allpass_lengths[:, stage, None] + np.arange(frame)
+			for stage in range(allpass_lengths.shape[1])]
+		self.allpass_rows = np.arange(2)[:, None]
+
+		damping = FREEVERB_COMB_DAMPING
+		self.damping_matrix = (1 - damping) * onePoleMatrix(damping, frame)
+		self.damping_decay = np.power(damping, np.arange(1, frame + 1)).astype(np.float32)
+		self.reset()
+
+	def __str__(self):
+		return f"<Freeverb object>"
+
+	def reset(self):
+		frame = FREEVERB_MINOR_FRAME
+		self.combs = np.zeros((len(self.comb_rows), self.comb_history + frame), dtype=np.float32)
+		self.damped = np.zeros(len(self.comb_rows), dtype=np.float32)
+		stages = len(self.allpass_reads)
+		self.allpass_in = np.zeros((stages, 2, self.allpass_history + frame), dtype=np.float32)
+		self.allpass_out = np.zeros((stages, 2, self.allpass_history + frame), dtype=np.float32)
+
+	def processFrame(self, mono, wet):
+		# One minor frame (no longer than FREEVERB_MINOR_FRAME) of the wet path
+		size = mono.shape[0]
+		combs = self.combs
+		comb_start = self.comb_history
+		scaling = np.log2(7 * self.room_size + 1) / 3
+
+		# o[n] = s[n-L]; s[n] = 0.015*x[n] + scaling*lowpass(o)[n]
+		delayed = combs[self.comb_rows, self.comb_reads[:, :size]]
+		damped = delayed @ self.damping_matrix[:size, :size].T + self.damping_decay[:size] * self.damped[:, None]
+		combs[:, comb_start:comb_start + size] = FREEVERB_INPUT_GAIN * mono + scaling * damped
+		self.damped = damped[:, size - 1].copy()
+		combs[:, :comb_start] = combs[:, size:size + comb_start]
+		signal = np.stack([delayed[:8].sum(axis=0), delayed[8:].sum(axis=0)])
+
+		# y[n] = -g*x[n] + x[n-L] + g*y[n-L], both sides at once
+		gain = FREEVERB_ALLPASS_FEEDBACK
+		start = self.allpass_history
+		for stage, reads in enumerate(self.allpass_reads):
+			ins = self.allpass_in[stage]
+			outs = self.allpass_out[stage]
+			ins[:, start:start + size] = signal
+			outs[:, start:start + size] = (-gain * signal + ins[self.allpass_rows, reads[:, :size]]
+				+ gain * outs[self.allpass_rows, reads[:, :size]])
+			signal = outs[:, start:start + size].copy()
+			ins[:, :start] = ins[:, size:size + start]
+			outs[:, :start] = outs[:, size:size + start]
+		wet[:] = signal
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.reset()
+		num_channels, num_frames = audio.shape
+		mono = audio.sum(axis=0)
+		wet = np.empty((2, num_frames), dtype=np.float32)
+		for start in range(0, num_frames, FREEVERB_MINOR_FRAME):
+			end = min(start + FREEVERB_MINOR_FRAME, num_frames)
+			self.processFrame(mono[start:end], wet[:, start:end])
+
+		width = self.width
+		spread = np.array([[0.5 + width / 2, 0.5 - width / 2], [0.5 - width / 2, 0.5 + width / 2]], dtype=np.float32)
+		reverb = (spread.T @ wet) * min(0.5, self.mix) + audio * min(0.5, 1 - self.mix)
+		out = reverb * (np.array([[2 * (1 - self.balance)], [2 * self.balance]], dtype=np.float32) * self.volume)
+		if num_channels == 1:
+			return out.mean(axis=0, keepdims=True).astype(np.float32)
+		return out[:num_channels].astype(np.float32)
+
+class EffectChain:
+	# A board that can hold these processors as well as pedalboard plugins.
+	# Runs of pedalboard plugins are grouped into one Pedalboard each, so a
+	# chain of only pedalboard plugins costs the same as a plain Pedalboard.
+	def __init__(self, plugins):
+		self.plugins = list(plugins)
+		self.stages = []
+		for plugin in self.plugins:
+			if isinstance(plugin, Plugin):
+				if self.stages and isinstance(self.stages[-1], Pedalboard):
+					self.stages[-1].append(plugin)
+				else:
+					self.stages.append(Pedalboard([plugin]))
+			else:
+				self.stages.append(plugin)
+
+	def __str__(self):
+		return f"<EffectChain with {len(self.plugins)} plugins>"
+
+	def __len__(self):
+		return len(self.plugins)
+
+	def __iter__(self):
+		return iter(self.plugins)
+
+	def reset(self):
+		for stage in self.stages:
+			stage.reset()
+
+	def __call__(self, audio, sample_rate, reset=True):
+		if reset:
+			self.reset()
+		for stage in self.stages:
+			audio = stage(audio, sample_rate, reset=False)
+		return audio
+
+def makeBoard(plugins):
+	# A plain Pedalboard unless the chain holds one of the NumPy processors
+	if all(isinstance(plugin, Plugin) for plugin in plugins):
+		return Pedalboard(plugins)
+	return EffectChain(plugins)
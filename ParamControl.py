@@ -0,0 +1,209 @@
+from collections import deque
+
+import numpy as np
+
+# Most plugin parameters that can be automated at once
+PARAM_SLOTS = 64
+
+# How long a parameter takes to glide to a new value by default
+PARAM_GLIDE_SECONDS = 0.03
+
+# While a parameter is moving, each block is processed in this many segments
+# with the value stepped between them
+PARAM_SEGMENTS = 4
+
+class ParamControl:
+	# Smoothed, lock-free parameter changes for the live stream. The control
+	# side (StateManager -> AudioManager) only stores numbers into preallocated
+	# arrays; the audio thread reads them once per block, glides each value
+	# toward its target at a fixed rate, adds any LFO, and sets the plugins
+	# between block segments. A slot's (plugin, name) pair is stored with one
+	# assignment after its numbers are in place, so the audio thread never
+	# sees a half-registered parameter.
+	def __init__(self, max_params=PARAM_SLOTS, glide_seconds=PARAM_GLIDE_SECONDS, segments=PARAM_SEGMENTS):
+		self.max_params = max_params
+		self.glide_seconds = glide_seconds
+		self.segments = segments
+
+		self.params = [None] * max_params
+		self.slots = {}
+		self.free = []
+		self.num_slots = 0
+
+		# Written by the control side
+		self.targets = np.zeros(max_params)
+		self.glides = np.zeros(max_params)
+		self.lfo_rates = np.zeros(max_params)
+		self.lfo_depths = np.zeros(max_params)
+
+		# Owned by the audio thread
+		self.current = np.zeros(max_params)
+		self.applied = np.zeros(max_params)
+		self.lfo_phases = np.zeros(max_params)
+		self.values = np.zeros(max_params)
+		self.scratch = np.zeros(max_params)
+		self.moving = np.zeros(max_params, dtype=bool)
+
+		# Final values from settle() for the audio thread to set, oldest first
+		self.settled = deque()
+
+		self.updates = 0
+		self.rejected = 0
+
+	def __str__(self):
+		return f"<ParamControl object>"
+
+	def getSlot(self, plugin, param_name):
+		# Slot for a plugin parameter, registered on first use from the
+		# plugin's present value
+		key = (id(plugin), param_name)
+		slot = self.slots.get(key)
+		if slot is not None:
+			return slot
+		if self.free:
+			slot = self.free.pop()
+		elif self.num_slots < self.max_params:
+			slot = self.num_slots
+		else:
+			raise ValueError("Out of parameter slots")
+		value = float(getattr(plugin, param_name))
+		self.targets[slot] = value
+		self.current[slot] = value
+		self.applied[slot] = value
+		self.glides[slot] = 0.0
+		self.lfo_rates[slot] = 0.0
+		self.lfo_depths[slot] = 0.0
+		self.lfo_phases[slot] = 0.0
+		self.slots[key] = slot
+		self.params[slot] = (plugin, param_name)
+		if slot == self.num_slots:
+			self.num_slots = slot + 1
+		return slot
+
+	def release(self, plugin):
+		# Free the slots of a plugin that has left the board
+		for key in [key for key in self.slots if key[0] == id(plugin)]:
+			slot = self.slots.pop(key)
+			self.params[slot] = None
+			self.targets[slot] = self.current[slot]
+			self.lfo_depths[slot] = 0.0
+			self.free.append(slot)
+
+	def setTarget(self, plugin, param_name, value, glide_seconds=None):
+		# Glide to value over glide_seconds (the default glide otherwise)
+		slot = self.getSlot(plugin, param_name)
+		if glide_seconds is None:
+			glide_seconds = self.glide_seconds
+		distance = abs(float(value) - self.current[slot])
+		self.glides[slot] = distance / glide_seconds if glide_seconds > 0 else np.inf
+		self.targets[slot] = value
+		self.updates = self.updates + 1
+
+	def setLfo(self, plugin, param_name, rate_hz, depth):
+		# Sine modulation of depth around the target; rate_hz 0 stops it
+		slot = self.getSlot(plugin, param_name)
+		self.lfo_depths[slot] = depth if rate_hz else 0.0
+		self.lfo_rates[slot] = 2 * np.pi * rate_hz
+		self.updates = self.updates + 1
+
+	def clear(self):
+		# Forget every slot. Call while the audio thread isn't using them
+		# (stream stopped, or before it starts).
+		self.num_slots = 0
+		self.slots = {}
+		self.free = []
+		for slot in range(self.max_params):
+			self.params[slot] = None
+
+	def settle(self, queue=False):
+		# Jump every parameter to its target and forget the slots. With queue
+		# (the stream running) the values are handed to the audio thread to
+		# set at the start of its next block, like glides; otherwise they are
+		# set here, after any still queued.
+		final = [(self.params[slot][0], self.params[slot][1], float(self.targets[slot]))
+			for slot in range(self.num_slots) if self.params[slot] is not None]
+		self.clear()
+		if queue:
+			self.settled.append(final)
+		else:
+			self.applySettled()
+			self.setValues(final)
+
+	def applySettled(self):
+		# Audio thread at the start of a block, or anyone once it has stopped
+		while self.settled:
+			self.setValues(self.settled.popleft())
+
+	def setValues(self, values):
+		for plugin, param_name, value in values:
+			try:
+				setattr(plugin, param_name, value)
+			except ValueError:
+				pass
+
+	def advance(self, seconds):
+		# Audio thread: move every slot on by one block. Returns True if any
+		# plugin needs new values. Works in place on the preallocated arrays.
+		n = self.num_slots
+		if n == 0:
+			return False
+		current = self.current[:n]
+		values = self.values[:n]
+		scratch = self.scratch[:n]
+
+		np.subtract(self.targets[:n], current, out=values)
+		np.multiply(self.glides[:n], seconds, out=scratch)
+		np.clip(values, -scratch, scratch, out=values)
+		np.add(current, values, out=current)
+
+		np.multiply(self.lfo_rates[:n], seconds, out=scratch)
+		np.add(self.lfo_phases[:n], scratch, out=self.lfo_phases[:n])
+		np.mod(self.lfo_phases[:n], 2 * np.pi, out=self.lfo_phases[:n])
+		np.sin(self.lfo_phases[:n], out=values)
+		np.multiply(values, self.lfo_depths[:n], out=values)
+		np.add(values, current, out=values)
+
+		np.not_equal(values, self.applied[:n], out=self.moving[:n])
+		return bool(self.moving[:n].any())
+
+	def process(self, board, audio, sample_rate, out):
+		# Audio thread: run one block through board into out[:, :frames] with
+		# the parameters ramped across it. Returns the number of frames.
+		if self.settled:
+			self.applySettled()
+		frames = audio.shape[1]
+		n = self.num_slots
+		if not self.advance(frames / sample_rate):
+			audio_out = board(audio, sample_rate, reset=False)
+			np.copyto(out[:, :audio_out.shape[1]], audio_out)
+			return audio_out.shape[1]
+
+		applied = self.applied
+		values = self.values
+		moving = self.moving
+		params = self.params
+		segments = self.segments
+		start = 0
+		for segment in range(1, segments + 1):
+			for slot in range(n):
+				param = params[slot]
+				if moving[slot] and param is not None:
+					value = applied[slot] + (values[slot] - applied[slot]) * segment / segments
+					try:
+						setattr(param[0], param[1], float(value))
+					except ValueError:
+						# Outside what the plugin accepts: stay where it was
+						self.rejected = self.rejected + 1
+						values[slot] = applied[slot]
+						self.current[slot] = applied[slot]
+						self.targets[slot] = applied[slot]
+						moving[slot] = False
+			end = frames * segment // segments
+			audio_out = board(audio[:, start:end], sample_rate, reset=False)
+			np.copyto(out[:, start:end], audio_out)
+			start = end
+		np.copyto(applied[:n], values[:n])
+		return frames
+
+	def getStats(self):
+		return {"slots": self.num_slots, "updates": self.updates, "rejected": self.rejected}
@@ -0,0 +1,289 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from WavFile import createWav, WAV_RELEASE_FRAMES
+
+log = logging.getLogger(__name__)
+
+# Output stream settings for previews
+PLAYBACK_BUFFER_SIZE = 1024
+PLAYBACK_CHANNELS = 2
+
+# Number of recent previews the time-to-first-sound figures are taken over
+TTFS_WINDOW = 64
+
+# Frames a take holds between its renderer and its slowest reader
+TAKE_RING_FRAMES = 1 << 17
+
+class Take:
+	# One preview's audio, passed from the renderer to its readers (playback,
+	# saving) through a bounded ring of frames, so memory doesn't grow with
+	# the file. The renderer waits while the slowest reader is a full ring
+	# behind; readers wait for the renderer. Readers hold a view into the
+	# ring until they release() past it.
+	def __init__(self, num_channels, frames, requested_at=None, ring_frames=TAKE_RING_FRAMES):
+		if requested_at is None:
+			requested_at = time.perf_counter()
+		self.num_channels = num_channels
+		self.frames = frames
+		self.ring = np.empty((num_channels, max(1, min(frames, ring_frames))), dtype=np.float32)
+		self.requested_at = requested_at
+		self.frames_ready = 0
+		# reader -> frames it has released; cancel() drops the ones in cancellable
+		self.readers = {}
+		self.cancellable = set()
+		self.done = False
+		self.cancelled = False
+		self.first_sound_at = None
+		self.condition = threading.Condition()
+
+	def __str__(self):
+		return f"<Take object>"
+
+	def addReader(self, reader, stop_on_cancel=True):
+		# Readers have to be added before the renderer starts
+		with self.condition:
+			self.readers[reader] = 0
+			if stop_on_cancel:
+				self.cancellable.add(reader)
+
+	def removeReader(self, reader):
+		with self.condition:
+			self.readers.pop(reader, None)
+			self.cancellable.discard(reader)
+			self.condition.notify_all()
+
+	def write(self, audio):
+		# Append (channels, frames) audio, waiting for room. False once no
+		# reader is left, so the renderer can stop.
+		ring_frames = self.ring.shape[1]
+		position = 0
+		while position < audio.shape[1]:
+			with self.condition:
+				while self.readers and self.frames_ready - min(self.readers.values()) >= ring_frames:
+					self.condition.wait()
+				if not self.readers:
+					return False
+				free = ring_frames - (self.frames_ready - min(self.readers.values()))
+				start = self.frames_ready % ring_frames
+			frames = min(audio.shape[1] - position, free, ring_frames - start)
+			self.ring[:, start:start + frames] = audio[:, position:position + frames]
+			self.commit(frames)
+			position = position + frames
+		return True
+
+	def commit(self, frames):
+		with self.condition:
+			self.frames_ready = self.frames_ready + frames
+			self.condition.notify_all()
+
+	def finish(self):
+		with self.condition:
+			self.done = True
+			self.condition.notify_all()
+
+	def cancel(self):
+		# Stops playback of this take; rendering and saving carry on
+		with self.condition:
+			self.cancelled = True
+			for reader in self.cancellable:
+				self.readers.pop(reader, None)
+			self.cancellable.clear()
+			self.condition.notify_all()
+
+	def read(self, reader, position, frames):
+		# A view of up to `frames` frames from position, waiting for the
+		# renderer if needed. Shorter where the ring wraps; empty once the
+		# take is finished or the reader has been dropped.
+		ring_frames = self.ring.shape[1]
+		with self.condition:
+			while self.frames_ready <= position and not self.done and reader in self.readers:
+				self.condition.wait()
+			if reader not in self.readers:
+				return self.ring[:, :0]
+			start = position % ring_frames
+			frames = min(frames, self.frames_ready - position, ring_frames - start)
+		return self.ring[:, start:start + max(frames, 0)]
+
+	def release(self, reader, position):
+		# The reader is done with everything before position
+		with self.condition:
+			if reader in self.readers:
+				self.readers[reader] = position
+				self.condition.notify_all()
+
+class PlaybackService:
+	# Keeps one output stream open on its own thread and plays takes straight
+	# from memory. Starting a take stops the one before it. The device name
+	# may be a function, called when the stream is opened.
+	def __init__(self, audio_backend, output_device_name, sample_rate,
+			buffer_size=PLAYBACK_BUFFER_SIZE, num_channels=PLAYBACK_CHANNELS):
+		self.audio_backend = audio_backend
+		self.output_device_name = output_device_name
+		self.sample_rate = sample_rate
+		self.buffer_size = buffer_size
+		self.num_channels = num_channels
+
+		self.out_buffer = np.zeros((num_channels, buffer_size), dtype=np.float32)
+		self.take = None
+		self.condition = threading.Condition()
+		self.thread = None
+		self.running = False
+		self.error = None
+		self.first_sound = deque(maxlen=TTFS_WINDOW)
+
+	def __str__(self):
+		return f"<PlaybackService object>"
+
+	def play(self, take):
+		take.addReader(self)
+		with self.condition:
+			if self.take is not None:
+				self.take.cancel()
+			self.take = take
+			self.condition.notify_all()
+		# The output device is opened once, on first use
+		if self.thread is None:
+			self.running = True
+			self.thread = threading.Thread(target=self.run, name="Playback", daemon=True)
+			self.thread.start()
+
+	def stop(self):
+		with self.condition:
+			if self.take is not None:
+				self.take.cancel()
+			self.take = None
+
+	def setSampleRate(self, sample_rate):
+		# Takes at a new rate need the output stream reopened at that rate;
+		# the next play() opens it
+		if sample_rate == self.sample_rate:
+			return
+		self.close()
+		self.sample_rate = sample_rate
+
+	def close(self):
+		self.running = False
+		self.stop()
+		with self.condition:
+			self.condition.notify_all()
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+
+	def run(self):
+		try:
+			output_device_name = self.output_device_name
+			if callable(output_device_name):
+				output_device_name = output_device_name()
+			with self.audio_backend.openOutputStream(output_device_name, self.sample_rate,
+					self.buffer_size, self.num_channels) as out_stream:
+				while self.running:
+					with self.condition:
+						while self.running and self.take is None:
+							self.condition.wait()
+						take = self.take
+					if take is not None:
+						self.playTake(take, out_stream)
+		except Exception as e:
+			self.error = e
+			log.error("Playback stopped: %s", e)
+		finally:
+			# A take left waiting on this reader would hold up its renderer
+			self.running = False
+			self.stop()
+			self.thread = None
+
+	def playTake(self, take, out_stream):
+		position = 0
+		try:
+			while True:
+				block = take.read(self, position, self.buffer_size)
+				frames = block.shape[1]
+				if frames == 0:
+					break
+				# Mono takes fan out across the output channels without allocating
+				np.copyto(self.out_buffer[:, :frames], block)
+				position = position + frames
+				take.release(self, position)
+				if take.first_sound_at is None:
+					take.first_sound_at = time.perf_counter()
+					self.first_sound.append(take.first_sound_at - take.requested_at)
+				out_stream.write(self.out_buffer[:, :frames], self.sample_rate)
+		finally:
+			take.removeReader(self)
+
+		with self.condition:
+			if self.take is take:
+				self.take = None
+
+	def getStats(self):
+		# Time from the preview request to its first block reaching the device
+		first_sound = np.array(self.first_sound)
+		if len(first_sound) == 0:
+			return {"previews": 0}
+		return {
+			"previews": len(first_sound),
+			"first_sound_last_ms": 1000.0 * float(first_sound[-1]),
+			"first_sound_p50_ms": 1000.0 * float(np.percentile(first_sound, 50)),
+			"first_sound_max_ms": 1000.0 * float(first_sound.max()),
+		}
+
+class TakeWriter:
+	# Saves a take to a WAV file on a background thread as it is rendered, then
+	# calls on_done(saved). A render that stopped short isn't saved. The file is allocated at the take's length up front
+	# and memory-mapped, so each block is converted straight into it. If the
+	# save fails the partial file is removed and on_done(False) still called.
+	def __init__(self, take, audio_file, sample_rate, block_size, on_done=None):
+		self.take = take
+		self.audio_file = audio_file
+		self.sample_rate = sample_rate
+		self.block_size = block_size
+		self.on_done = on_done
+		take.addReader(self, stop_on_cancel=False)
+		self.thread = threading.Thread(target=self.run, name="TakeWriter", daemon=True)
+
+	def __str__(self):
+		return f"<TakeWriter object>"
+
+	def start(self):
+		self.thread.start()
+
+	def join(self):
+		self.thread.join()
+
+	def run(self):
+		take = self.take
+		position = 0
+		released = 0
+		saved = False
+		try:
+			with createWav(self.audio_file, self.sample_rate, take.num_channels, take.frames) as f:
+				while True:
+					block = take.read(self, position, self.block_size)
+					if block.shape[1] == 0:
+						break
+					f.write(position, block)
+					position = position + block.shape[1]
+					take.release(self, position)
+					if position - released >= WAV_RELEASE_FRAMES:
+						f.release(released, position)
+						released = position
+				if position < take.frames:
+					raise ValueError(f"the render stopped after {position} of {take.frames} frames")
+			saved = True
+		except Exception as e:
+			log.error("Couldn't save the take to %s: %s", self.audio_file, e)
+			try:
+				os.remove(self.audio_file)
+			except OSError:
+				pass
+		finally:
+			take.removeReader(self)
+			if self.on_done is not None:
+				self.on_done(saved)
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+# Where named presets are kept, one JSON file each
+PRESETS_DIR = "presets"
+
+class PresetManager:
+	# Named snapshots of every effect's settings. Each loaded preset keeps a
+	# prebuilt board (an AudioManager Scene), so switching between them is a
+	# single board swap instead of creating and configuring plugins.
+	def __init__(self, audio_manager, presets_dir=PRESETS_DIR):
+		self.audio_manager = audio_manager
+		self.presets_dir = presets_dir
+		os.makedirs(self.presets_dir, exist_ok=True)
+
+		# preset name -> Scene
+		self.scenes = {}
+		self.current = None
+		self.last_switch_seconds = None
+		for file_name in sorted(os.listdir(self.presets_dir)):
+			if file_name.endswith(".json"):
+				self.loadPreset(file_name[:-len(".json")])
+
+		log.info("Successfully initialized the PresetManager")
+
+	def __str__(self):
+		return f"<PresetManager object>"
+
+	def getPath(self, preset_name):
+		return os.path.join(self.presets_dir, preset_name + ".json")
+
+	def getPresetNames(self):
+		return sorted(self.scenes)
+
+	def getCurrent(self):
+		return self.current
+
+	def newPresetName(self):
+		# First free "preset N", for saving from the pedal's two buttons
+		num = 1
+		while "preset " + str(num) in self.scenes:
+			num = num + 1
+		return "preset " + str(num)
+
+	def loadPreset(self, preset_name):
+		# A bad file is skipped with a warning rather than stopping startup
+		try:
+			with open(self.getPath(preset_name)) as f:
+				preset = json.load(f)
+			self.scenes[preset_name] = self.audio_manager.buildScene(preset)
+		except (OSError, ValueError) as e:
+			log.warning("Couldn't build preset %s: %s", preset_name, e)
+
+	def savePreset(self, preset_name=None):
+		# Snapshot the current settings of every effect
+		if preset_name is None:
+			preset_name = self.newPresetName()
+		preset = self.audio_manager.getPreset()
+		with open(self.getPath(preset_name), "w") as f:
+			json.dump(preset, f, indent=1)
+		self.scenes[preset_name] = self.audio_manager.buildScene(preset)
+		self.current = preset_name
+		return preset_name
+
+	def removePreset(self, preset_name):
+		self.scenes.pop(preset_name, None)
+		if self.current == preset_name:
+			self.current = None
+		try:
+			os.remove(self.getPath(preset_name))
+		except FileNotFoundError:
+			pass
+
+	def switchPreset(self, preset_name):
+		start = time.perf_counter()
+		self.audio_manager.switchScene(self.scenes[preset_name])
+		self.last_switch_seconds = time.perf_counter() - start
+		self.current = preset_name
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# Defaults for the preview render cache
+RENDER_CACHE_DIR = "render-cache"
+RENDER_CACHE_BYTES = 64 * 1024 * 1024
+
+class RenderCache:
+	# Content-addressed store of rendered previews. A render is keyed on the
+	# source file contents, the resample rate and the enabled effect chain with
+	# every param_indices value, so the same settings map to the same file.
+	def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_BYTES):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		os.makedirs(self.cache_dir, exist_ok=True)
+
+		# source path -> (mtime, size, content hash)
+		self.source_hashes = {}
+
+		# key -> size in bytes, least recently used first. Renders are stored
+		# from background writer threads, so the index is locked.
+		self.lock = threading.RLock()
+		self.entries = OrderedDict()
+		paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+		for path in sorted(paths, key=os.path.getmtime):
+			name = os.path.basename(path)
+			if name.endswith(".partial.wav"):
+				os.remove(path)
+			elif name.endswith(".wav"):
+				self.entries[name[:-len(".wav")]] = os.path.getsize(path)
+		self.evict()
+
+		log.info("Successfully initialized the RenderCache")
+
+	def __str__(self):
+		return f"<RenderCache object>"
+
+	def getSourceHash(self, audio_file):
+		# Hash the file once per mtime. When the file changes, every render of
+		# its old contents is dropped.
+		stat = os.stat(audio_file)
+		cached = self.source_hashes.get(audio_file)
+		if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+			return cached[2]
+
+		digest = hashlib.sha1()
+		with open(audio_file, "rb") as f:
+			for chunk in iter(lambda: f.read(1 << 20), b""):
+				digest.update(chunk)
+		source_hash = digest.hexdigest()
+
+		if cached is not None and cached[2] != source_hash:
+			self.removeSource(cached[2])
+		self.source_hashes[audio_file] = (stat.st_mtime_ns, stat.st_size, source_hash)
+		return source_hash
+
+	def getKey(self, audio_file, samplerate, effects_array, tempo=None):
+		chain = [str(samplerate)]
+		for effect in effects_array:
+			if effect.getEnable():
+				chain.append(effect.getName() + ":" + ",".join(str(i) for i in effect.param_indices))
+		# Synced effects take their delay time / rate from the tempo, not
+		# their param_indices
+		if tempo is not None and tempo.synced:
+			chain.append("tempo:" + str(tempo.getBpm()) + ":" + tempo.getDivision() + ":" + ",".join(sorted(tempo.synced)))
+		chain_hash = hashlib.sha1("|".join(chain).encode()).hexdigest()
+		return self.getSourceHash(audio_file) + "-" + chain_hash
+
+	def getPath(self, key):
+		return os.path.join(self.cache_dir, key + ".wav")
+
+	def getPartialPath(self, key):
+		return os.path.join(self.cache_dir, key + ".partial.wav")
+
+	def lookup(self, key):
+		# Path of a finished render, or None on a miss
+		with self.lock:
+			if key not in self.entries:
+				return None
+			path = self.getPath(key)
+			if not os.path.exists(path):
+				del self.entries[key]
+				return None
+			self.entries.move_to_end(key)
+			os.utime(path)
+			return path
+
+	def store(self, key):
+		# Publish a render written to getPartialPath(key)
+		with self.lock:
+			path = self.getPath(key)
+			os.replace(self.getPartialPath(key), path)
+			self.entries[key] = os.path.getsize(path)
+			self.entries.move_to_end(key)
+			self.evict()
+			return path
+
+	def evict(self):
+		# Drop least recently used renders until under budget, always keeping
+		# the newest one
+		with self.lock:
+			total = sum(self.entries.values())
+			while total > self.max_bytes and len(self.entries) > 1:
+				key, size = self.entries.popitem(last=False)
+				self.removeFile(key)
+				total = total - size
+
+	def removeSource(self, source_hash):
+		with self.lock:
+			for key in [key for key in self.entries if key.startswith(source_hash + "-")]:
+				del self.entries[key]
+				self.removeFile(key)
+
+	def removeFile(self, key):
+		try:
+			os.remove(self.getPath(key))
+		except FileNotFoundError:
+			pass
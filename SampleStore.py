@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+from pedalboard.io import AudioFile
+
+from WavFile import isMappable, openWav, readWavHeader, WAV_BLOCK_FRAMES
+
+log = logging.getLogger(__name__)
+
+# Where decoded, resampled copies of the source files are kept
+SAMPLE_STORE_DIR = "sample-cache"
+
+class SampleStore:
+	# Decodes and resamples each source file once. The float32 result is saved
+	# as a sidecar .npy and memory-mapped back, so later previews (and restarts)
+	# get a read-only view of the samples without decoding anything.
+	def __init__(self, cache_dir=SAMPLE_STORE_DIR):
+		self.cache_dir = cache_dir
+		os.makedirs(self.cache_dir, exist_ok=True)
+
+		# (source path, samplerate) -> (source mtime, memory-mapped samples)
+		self.samples = {}
+		# source path -> (source mtime, the file's own samplerate)
+		self.source_rates = {}
+		self.resampled = 0
+
+		log.info("Successfully initialized the SampleStore")
+
+	def __str__(self):
+		return f"<SampleStore object>"
+
+	def getSidecarPath(self, audio_file, samplerate):
+		# The name is kept for reading the cache directory; the hash of the
+		# full path keeps same-named files in different folders apart
+		name = os.path.basename(audio_file)
+		path_hash = hashlib.sha1(os.path.abspath(audio_file).encode()).hexdigest()[:12]
+		return os.path.join(self.cache_dir, f"{name}.{path_hash}.{int(samplerate)}.npy")
+
+	def getSamples(self, audio_file, samplerate):
+		# (channels, frames) float32 array at samplerate, memory-mapped from disk
+		source_mtime = os.stat(audio_file).st_mtime_ns
+		loaded = self.samples.get((audio_file, samplerate))
+		if loaded is not None and loaded[0] == source_mtime:
+			return loaded[1]
+
+		sidecar_path = self.getSidecarPath(audio_file, samplerate)
+		if not os.path.exists(sidecar_path) or os.stat(sidecar_path).st_mtime_ns < source_mtime:
+			self.decode(audio_file, samplerate, sidecar_path)
+
+		samples = np.load(sidecar_path, mmap_mode="r")
+		self.samples[(audio_file, samplerate)] = (source_mtime, samples)
+		return samples
+
+	def getSourceRate(self, audio_file):
+		# Native samplerate of a source file, read from its header once
+		source_mtime = os.stat(audio_file).st_mtime_ns
+		known = self.source_rates.get(audio_file)
+		if known is not None and known[0] == source_mtime:
+			return known[1]
+		with AudioFile(audio_file) as f:
+			samplerate = float(f.samplerate)
+		self.source_rates[audio_file] = (source_mtime, samplerate)
+		return samplerate
+
+	def decode(self, audio_file, samplerate, sidecar_path):
+		# Write under a temporary name so a crash never leaves a truncated sidecar
+		partial_path = sidecar_path[:-len(".npy")] + ".partial.npy"
+		if isMappable(audio_file) and readWavHeader(audio_file)[0] == samplerate:
+			self.convert(audio_file, partial_path)
+		else:
+			# Files already at samplerate are read as they are
+			with AudioFile(audio_file) as f:
+				if f.samplerate == samplerate:
+					audio = f.read(f.frames)
+				else:
+					with f.resampled_to(samplerate) as r:
+						audio = r.read(r.frames)
+					self.resampled = self.resampled + 1
+			np.save(partial_path, audio.astype(np.float32, copy=False))
+		os.replace(partial_path, sidecar_path)
+
+	def convert(self, audio_file, partial_path):
+		# PCM WAV at the right rate: converted a block at a time from the
+		# mapped file straight into the mapped sidecar, never held in memory
+		with openWav(audio_file) as wav:
+			samples = np.lib.format.open_memmap(partial_path, mode="w+", dtype=np.float32,
+				shape=(wav.num_channels, wav.frames))
+			for start in range(0, wav.frames, WAV_BLOCK_FRAMES):
+				wav.read(start, WAV_BLOCK_FRAMES, out=samples[:, start:start + WAV_BLOCK_FRAMES])
+			samples.flush()
+			del samples
+
+	def preload(self, audio_files, samplerate):
+		for audio_file in audio_files:
+			self.getSamples(audio_file, samplerate)
@@ -0,0 +1,45 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+class StartupTrace:
+	# Wall-clock cost of each startup phase (imports, inits, warm-up), from
+	# whichever thread ran it, measured from when the trace was created
+	def __init__(self):
+		self.start = time.perf_counter()
+		self.phases = []
+		self.marks = {}
+		self.lock = threading.Lock()
+
+	def __str__(self):
+		return f"<StartupTrace object>"
+
+	@contextmanager
+	def phase(self, name):
+		began = time.perf_counter()
+		try:
+			yield
+		finally:
+			ended = time.perf_counter()
+			with self.lock:
+				self.phases.append((name, threading.current_thread().name, began - self.start, ended - began))
+
+	def mark(self, name):
+		# A milestone, e.g. when the greeting was on screen
+		self.marks[name] = time.perf_counter() - self.start
+
+	def getPhases(self):
+		with self.lock:
+			return [{"phase": name, "thread": thread, "start_ms": 1000.0 * began, "ms": 1000.0 * seconds}
+				for name, thread, began, seconds in self.phases]
+
+	def report(self):
+		lines = ["Startup trace:"]
+		for phase in sorted(self.getPhases(), key=lambda phase: phase["start_ms"]):
+			lines.append(f"  {phase['start_ms']:8.1f} ms  {phase['ms']:8.1f} ms  {phase['phase']:<28} [{phase['thread']}]")
+		for name, seconds in self.marks.items():
+			lines.append(f"  {name}: {1000.0 * seconds:.1f} ms")
+		log.info("\n".join(lines))
@@ -1,13 +1,19 @@
+import logging
+
 from AudioManager import AudioManager
 from LCDManager import LCDManager
 from IOManager import IOManager
 from Effect import Effect
+from Tempo import TEMPO_PARAMS
+
+log = logging.getLogger(__name__)
 
 class StateManager:
-	def __init__(self, audio_manager, lcd_manager):
+	def __init__(self, audio_manager, lcd_manager, preset_manager=None):
 		# initialize objects
 		self.audio_manager = audio_manager
 		self.lcd_manager = lcd_manager
+		self.preset_manager = preset_manager
 		
 		# hello state
 		self.state = "hello"
@@ -16,8 +22,14 @@ class StateManager:
 		self.menu_num = 0
 		self.in_menu = False
 		self.menu_array = [effect.getName() for effect in audio_manager.getEffectsArray()]
+		if preset_manager is not None:
+			self.menu_array.append("Presets")
+		self.menu_array.append("Tempo")
+		self.menu_array.append("Undo")
+		self.menu_array.append("Redo")
 		self.menu_array.append("Try sine wave")
 		self.menu_array.append("Try music")
+		self.menu_array.append("Looper")
 		self.menu_array.append("IO Devices")
 		
 		# if self.menu_array has an odd number of items, hahaha, it doesn't :)
@@ -28,11 +40,43 @@ class StateManager:
 		self.modify_array = []
 		self.modify_num = 0
 		
-		print("Successfully initialized the StateManager")
+		# effect name -> ((enabled, param indices), rows) of its modify screen,
+		# rebuilt only when that effect's settings no longer match
+		self.screens = {}
+		
+		# Set by the Controller to take LCD writes, board updates and previews
+		# off the button path; without one they run inline
+		self.scheduler = None
+		
+		log.info("Successfully initialized the StateManager")
 		
 	def __str__(self):
 		return f"<StateManager object>"
 	
+	def showLines(self, lines_array, line_num):
+		if self.scheduler is None:
+			self.lcd_manager.writeLCDLine(lines_array, line_num, self.audio_manager)
+		else:
+			self.scheduler.scheduleDisplay(lines_array, line_num)
+	
+	def updateBoard(self):
+		if self.scheduler is None:
+			self.audio_manager.updateBoard()
+		else:
+			self.scheduler.scheduleBoardUpdate()
+	
+	def playPreview(self, audio_file):
+		if self.scheduler is None:
+			self.audio_manager.applyEffects(audio_file)
+		else:
+			self.scheduler.schedulePreview(audio_file)
+	
+	def switchPreset(self, preset_name):
+		if self.scheduler is None:
+			self.preset_manager.switchPreset(preset_name)
+		else:
+			self.scheduler.schedulePresetSwitch(preset_name)
+	
 	def setState(self, new_state):
 		self.state = new_state
 		
@@ -50,14 +94,13 @@ class StateManager:
 				else:
 					self.menu_num = 0
 					self.in_menu = True
-				print('Menu number: ' + str(self.menu_num))
 					
-				self.lcd_manager.writeLCDLine(self.menu_array, self.menu_num, self.audio_manager)
+				self.showLines(self.menu_array, self.menu_num)
 			case "modify":
 				self.modify_num = self.modify_num + 1
 				if self.modify_num >= len(self.modify_array):
 					self.modify_num = 0
-				self.lcd_manager.writeLCDLine(self.modify_array, self.modify_num, self.audio_manager)
+				self.showLines(self.modify_array, self.modify_num)
 				
 	def selectItemState(self):
 		match self.current_state:
@@ -66,52 +109,148 @@ class StateManager:
 				if self.audio_manager.isEffect(effect):
 					self.changeState("modify", effect) # Change the state
 				elif effect == "Try sine wave":
-					self.audio_manager.applyEffects("sine.wav")
+					self.playPreview("sine.wav")
 				elif effect == "Try music":
-					self.audio_manager.applyEffects("emily.wav")
+					self.playPreview("emily.wav")
+				elif effect == "Looper":
+					self.changeState("modify", "looper")
 				elif effect == "IO Devices":
 					self.changeState("modify", "io")
+				elif effect == "Presets":
+					self.changeState("modify", "presets")
+				elif effect == "Tempo":
+					self.changeState("modify", "tempo")
+				elif effect == "Undo":
+					if self.audio_manager.undoEdits():
+						self.updateBoard()
+				elif effect == "Redo":
+					if self.audio_manager.redoEdits():
+						self.updateBoard()
 				else:
-					print("In else! Yay!")
 					#play effect
+					pass
+			case "modify" if self.menu_array[self.menu_num] == "Presets":
+				match self.modify_array[self.modify_num]:
+					case "save new":
+						preset_name = self.preset_manager.savePreset()
+						log.info("saved %s", preset_name)
+						self.setModify("presets")
+					case "back":
+						self.changeState("menu", "quit")
+					case "Presets" | "":
+						pass
+					case _:
+						preset_name = self.preset_manager.getPresetNames()[self.modify_num - 1]
+						self.switchPreset(preset_name)
+						# setModify redraws from the top; stay on the chosen row
+						modify_num = self.modify_num
+						self.setModify("presets")
+						self.modify_num = modify_num
+						self.showLines(self.modify_array, self.modify_num)
+			case "modify" if self.menu_array[self.menu_num] == "Tempo":
+				# Rows: header, tap, division, one sync row per effect, back
+				match self.modify_num:
+					case 0:
+						pass
+					case 1:
+						# Taps are timed from the press itself, not from when
+						# it was handled
+						tapped_at = None
+						if self.scheduler is not None:
+							tapped_at = self.scheduler.current_press
+						self.audio_manager.tapTempo(tapped_at)
+					case 2:
+						self.audio_manager.nextTempoDivision()
+					case num if num - 3 < len(self.tempo_effects):
+						effect_name = self.tempo_effects[num - 3]
+						tempo = self.audio_manager.tempo
+						self.audio_manager.setTempoSync(effect_name, not tempo.isSynced(effect_name))
+				if self.modify_array[self.modify_num] == "back":
+					self.changeState("menu", "quit")
+				elif self.modify_array[self.modify_num] != "":
+					modify_num = self.modify_num
+					self.setModify("tempo")
+					self.modify_num = modify_num
+					self.showLines(self.modify_array, self.modify_num)
+			case "modify" if self.menu_array[self.menu_num] == "Looper":
+				# Rows: header, record/play/overdub, source, stop, clear, back
+				match self.modify_num:
+					case 1:
+						self.audio_manager.pressLooper()
+					case 2:
+						looper = self.audio_manager.looper
+						looper.setSource("output" if looper.getSource() == "input" else "input")
+					case 3:
+						self.audio_manager.stopLooper()
+					case 4:
+						self.audio_manager.clearLooper()
+				if self.modify_array[self.modify_num] == "back":
+					self.changeState("menu", "quit")
+				elif self.modify_num > 0:
+					modify_num = self.modify_num
+					self.setModify("looper")
+					self.modify_num = modify_num
+					self.showLines(self.modify_array, self.modify_num)
 			case "modify":
 				audio_en_str = self.lcd_manager.neatLine("Audio stream:", "enabled")
 				audio_dis_str = self.lcd_manager.neatLine("Audio stream:", "disabled")
+				profile_on_str = self.lcd_manager.neatLine("CPU profile:", "on")
+				profile_off_str = self.lcd_manager.neatLine("CPU profile:", "off")
 				match self.modify_array[self.modify_num]:
 					case "enabled":
 						self.audio_manager.enableDisableEffect(self.menu_num, "disable")
 						self.modify_array[self.modify_num] = "disabled"
-						self.lcd_manager.writeLCDLine(self.modify_array, self.modify_num, self.audio_manager)
-						self.audio_manager.updateBoard()
+						self.showLines(self.modify_array, self.modify_num)
+						self.updateBoard()
 					case "disabled":
 						self.audio_manager.enableDisableEffect(self.menu_num, "enable")
 						self.modify_array[self.modify_num] = "enabled"
-						self.lcd_manager.writeLCDLine(self.modify_array, self.modify_num, self.audio_manager)
-						self.audio_manager.updateBoard()
+						self.showLines(self.modify_array, self.modify_num)
+						self.updateBoard()
 					case value if value == audio_en_str:
-						audiostream_enabled = False
-						stopAudioStream()					
-						self.lcd_manager.writeLCDLine(self.modify_array, self.modify_num, self.audio_manager)
-						self.audio_manager.updateBoard()
+						self.audio_manager.stopAudioStream()
+						self.modify_array[self.modify_num] = audio_dis_str
+						self.showLines(self.modify_array, self.modify_num)
 					case value if value == audio_dis_str:
-						audiostream_enabled = True
-						startAudioStream()
-						self.lcd_manager.writeLCDLine(self.modify_array, self.modify_num, self.audio_manager)
-						self.audio_manager.updateBoard()
+						# Returns immediately; the stream runs on its own thread
+						self.audio_manager.startAudioStream()
+						self.modify_array[self.modify_num] = audio_en_str
+						self.showLines(self.modify_array, self.modify_num)
+					case value if value in (profile_on_str, profile_off_str) or value.startswith("CPU%"):
+						# Toggling profiling adds or removes the CPU% row;
+						# selecting the CPU% row refreshes its numbers
+						if value == profile_on_str:
+							self.audio_manager.setProfiling(False)
+						elif value == profile_off_str:
+							self.audio_manager.setProfiling(True)
+						modify_num = self.modify_num
+						self.setModify("io")
+						self.modify_num = min(modify_num, len(self.modify_array) - 1)
+						self.showLines(self.modify_array, self.modify_num)
+					case _ if self.menu_array[self.menu_num] == "IO Devices" and self.modify_num in (1, 2):
+						# The in/out rows step through the devices; a running
+						# stream moves with them
+						io_manager = self.audio_manager.io_manager
+						io_manager.nextIO("in" if self.modify_num == 1 else "out")
+						if self.audio_manager.audiostream_enabled:
+							self.audio_manager.startAudioStream()
+						modify_num = self.modify_num
+						self.setModify("io")
+						self.modify_num = modify_num
+						self.showLines(self.modify_array, self.modify_num)
 					case "quit" | "back":
 						self.changeState("menu", "quit")
 						
 				# yes, this is an if/then after a case, but it will work.
-				print('hi')
-				if self.audio_manager.isEffectParam(self.modify_array[self.modify_num], self.menu_num):
+				if self.audio_manager.isEffect(self.menu_array[self.menu_num]) and self.audio_manager.isEffectParam(self.modify_num - 2, self.menu_num):
 					self.audio_manager.nextEffectParam(self.menu_num, self.modify_num - 2)
 					effect = self.menu_array[self.menu_num]
-					self.setModify(effect)
-					self.lcd_manager.writeLCDLine(self.modify_array, self.modify_num, self.audio_manager)
-					self.audio_manager.updateBoard()
-					print('updated value')
+					self.updateModifyRow(effect, self.modify_num - 2)
+					self.showLines(self.modify_array, self.modify_num)
+					self.updateBoard()
+					log.debug("updated value")
 				else:
-					print('no sub found')
+					log.debug("no sub found")
 					
 	def changeState(self, new_state, info_str):
 		self.current_state = new_state
@@ -123,41 +262,96 @@ class StateManager:
 				self.setMenu()
 			case "modify":
 				self.in_menu = False
+				self.modify_num = 0
 				self.setModify(info_str)
 				
 	def setMenu(self):
 		# Reset menu number
 		self.menu_num = 0
 		
-		print('Menu number: ' + str(self.menu_num))
+		log.debug("Menu number: %s", self.menu_num)
 			
 		# Update LCD
-		self.lcd_manager.writeLCDLine(self.menu_array, 0, self.audio_manager)
+		self.showLines(self.menu_array, 0)
 
 	def setModify(self, effect_name):
 		if effect_name == "io":
+			io_manager = self.audio_manager.io_manager
 			self.modify_array = []
 			self.modify_array.append("Modify Audio I/O")
-			in_dev = input_devices[input_devices_i]		
+			in_dev = io_manager.getCurrentIO("in")
 			self.modify_array.append(self.lcd_manager.neatLine('in', in_dev))
-			out_dev = output_devices[output_devices_i]		
+			out_dev = io_manager.getCurrentIO("out")
 			self.modify_array.append(self.lcd_manager.neatLine('out', out_dev))
 			
 			# enable/disable audiostream
-			if audiostream_enabled:
+			if self.audio_manager.audiostream_enabled:
 				self.modify_array.append(self.lcd_manager.neatLine("Audio stream:", "enabled"))
 			else:
-				self.modify_array.append(self.lcd_manager.self.lcd_manager.neatLine("Audio stream:", "disabled"))
+				self.modify_array.append(self.lcd_manager.neatLine("Audio stream:", "disabled"))
+			
+			# per-plugin CPU profiling, with the heaviest plugins while it's on
+			if self.audio_manager.profiling:
+				self.modify_array.append(self.lcd_manager.neatLine("CPU profile:", "on"))
+				self.modify_array.append(self.lcd_manager.neatLine("CPU%", self.audio_manager.getCpuSummary()))
+			else:
+				self.modify_array.append(self.lcd_manager.neatLine("CPU profile:", "off"))
 			
 			# quit
 			self.modify_array.append("back")
-			if param_num % 2 == 0:
+			if len(self.modify_array) % 2 == 1:
 				self.modify_array.append("")
 				
+		elif effect_name == "presets":
+			# One row per preset, the current one marked
+			self.modify_array = []
+			self.modify_array.append("Presets")
+			current = self.preset_manager.getCurrent()
+			for preset_name in self.preset_manager.getPresetNames():
+				if preset_name == current:
+					self.modify_array.append(self.lcd_manager.neatLine(preset_name, "*"))
+				else:
+					self.modify_array.append(preset_name)
+			self.modify_array.append("save new")
+			self.modify_array.append("back")
+			if len(self.modify_array) % 2 == 1:
+				self.modify_array.append("")
+		
+		elif effect_name == "tempo":
+			tempo = self.audio_manager.tempo
+			self.tempo_effects = [name for name in TEMPO_PARAMS if self.audio_manager.isEffect(name)]
+			self.modify_array = []
+			self.modify_array.append("Tempo")
+			self.modify_array.append(self.lcd_manager.neatLine("tap", str(tempo.getBpm()) + " bpm"))
+			self.modify_array.append(self.lcd_manager.neatLine("division", tempo.getDivision()))
+			for name in self.tempo_effects:
+				self.modify_array.append(self.lcd_manager.neatLine(name + " sync", "on" if tempo.isSynced(name) else "off"))
+			self.modify_array.append("back")
+			if len(self.modify_array) % 2 == 1:
+				self.modify_array.append("")
+		
+		elif effect_name == "looper":
+			looper = self.audio_manager.looper
+			self.modify_array = []
+			self.modify_array.append("Looper")
+			self.modify_array.append(self.lcd_manager.neatLine("loop", looper.getState()))
+			self.modify_array.append(self.lcd_manager.neatLine("source", looper.getSource()))
+			self.modify_array.append("stop")
+			self.modify_array.append("clear")
+			self.modify_array.append("back")
+		
 		else:
 			# Find the effects object
 			effect_obj = self.audio_manager.getEffectObj(effect_name)
 			
+			# Reuse the screen if nothing on it has changed since it was built
+			key = self.getScreenKey(effect_obj)
+			screen = self.screens.get(effect_name)
+			if screen is not None and screen[0] == key:
+				self.modify_array = list(screen[1])
+				self.showLines(self.modify_array, 0)
+				return
+			
 			# Update the self.modify_array (will be displayed on LCD)
 			self.modify_array = []
 			self.modify_array.append("Modify " + effect_obj.getName())
@@ -170,13 +364,24 @@ class StateManager:
 			param_num = len(effect_obj.getParamNames())
 			
 			for i in range(param_num):
-				param_name = effect_obj.getParamNameAt(i)
+				param_label = effect_obj.getParamLabelAt(i)
 				param_val = effect_obj.getParamValueAt(i)
-				self.modify_array.append(self.lcd_manager.neatLine(param_name, param_val))
+				self.modify_array.append(self.lcd_manager.neatLine(param_label, param_val))
 			
 			self.modify_array.append("back")
 			if param_num % 2 == 0:
 				self.modify_array.append("")
+			self.screens[effect_name] = (key, tuple(self.modify_array))
 		
 		# Update LCD
-		self.lcd_manager.writeLCDLine(self.modify_array, 0, self.audio_manager)
+		self.showLines(self.modify_array, 0)
+	
+	def getScreenKey(self, effect_obj):
+		return (effect_obj.getEnable(), tuple(effect_obj.param_indices))
+	
+	def updateModifyRow(self, effect_name, param_i):
+		# One parameter of the effect on screen changed: redo its row only and
+		# keep the cached screen in step
+		effect_obj = self.audio_manager.getEffectObj(effect_name)
+		self.modify_array[param_i + 2] = self.lcd_manager.neatLine(effect_obj.getParamLabelAt(param_i), effect_obj.getParamValueAt(param_i))
+		self.screens[effect_name] = (self.getScreenKey(effect_obj), tuple(self.modify_array))
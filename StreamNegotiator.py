@@ -0,0 +1,131 @@
+import time
+
+import numpy as np
+
+from IOManager import STREAM_BUFFER_SIZES
+
+# Most of a block's time the chain may spend processing it. Above this the
+# negotiator moves to larger blocks, then to a lower rate.
+CPU_HEADROOM = 0.7
+
+# Block sizes previews may be rendered in, smallest first
+RENDER_BLOCK_SIZES = [8192, 16384, 32768]
+
+# Rates the chain may be run at when the device can't say
+PROCESSING_RATES = [22050.0, 32000.0, 44100.0, 48000.0]
+
+# Blocks timed per probe (after one untimed warm-up block)
+PROBE_BLOCKS = 4
+
+class StreamNegotiator:
+	# Picks the rate and block size audio is processed at. The rate is the
+	# source's own if the output device can play it, so nothing is resampled
+	# when the rates already match; otherwise the device's. The block size is
+	# the smallest one whose measured cost stays within CPU_HEADROOM of the
+	# block's real-time budget. If no block size is cheap enough, lower rates
+	# the device supports are tried the same way.
+	def __init__(self, io_manager, headroom=CPU_HEADROOM, probe_blocks=PROBE_BLOCKS):
+		self.io_manager = io_manager
+		self.headroom = headroom
+		self.probe_blocks = probe_blocks
+
+		# (chain, rate, block size, channels) -> measured load
+		self.loads = {}
+		self.probes = 0
+
+	def __str__(self):
+		return f"<StreamNegotiator object>"
+
+	def getChainKey(self, effects):
+		# The enabled effects and their param indices, which are what a board
+		# is built from; plugin reprs miss the NumPy processors' settings
+		return tuple((effect.getName(), tuple(effect.param_indices)) for effect in effects if effect.getEnable())
+
+	def measureLoad(self, board, chain_key, sample_rate, block_size, num_channels=2):
+		# Fraction of a block's duration the board takes to process it,
+		# median over a few blocks of noise. Cached per chain_key. Leaves the
+		# board reset, so never pass the board the live stream is running.
+		key = (chain_key, sample_rate, block_size, num_channels)
+		load = self.loads.get(key)
+		if load is not None:
+			return load
+
+		rng = np.random.default_rng(0)
+		probe = (0.1 * rng.standard_normal((num_channels, block_size))).astype(np.float32)
+		durations = []
+		board.reset()
+		board(probe, sample_rate, reset=False)
+		for block in range(self.probe_blocks):
+			start = time.perf_counter()
+			board(probe, sample_rate, reset=False)
+			durations.append(time.perf_counter() - start)
+		board.reset()
+
+		load = float(np.median(durations)) * sample_rate / block_size
+		self.loads[key] = load
+		self.probes = self.probes + 1
+		return load
+
+	def getDeviceRates(self, in_or_out):
+		caps = self.io_manager.getCapabilities(in_or_out)
+		if caps is None or not caps["sample_rates"]:
+			return None
+		return sorted(caps["sample_rates"])
+
+	def pickRenderRate(self, source_rate):
+		# The source's rate if the output device plays it (or can't say),
+		# else the device's closest rate at or above it, else its highest
+		device_rates = self.getDeviceRates("out")
+		if device_rates is None or source_rate in device_rates:
+			return float(source_rate)
+		return float(next((rate for rate in device_rates if rate >= source_rate), device_rates[-1]))
+
+	def getLowerRates(self, sample_rate, device_rates):
+		rates = PROCESSING_RATES if device_rates is None else device_rates
+		return [float(rate) for rate in sorted(rates, reverse=True) if rate < sample_rate]
+
+	def fit(self, board, chain_key, rates, block_sizes, num_channels):
+		# First (rate, block size, load) within headroom, trying every block
+		# size at one rate before the next rate. The last one tried otherwise.
+		for sample_rate in rates:
+			for block_size in block_sizes:
+				load = self.measureLoad(board, chain_key, sample_rate, block_size, num_channels)
+				if load <= self.headroom:
+					return sample_rate, block_size, load
+		return sample_rate, block_size, load
+
+	def negotiateRender(self, board, chain_key, source_rate, num_channels=2, block_size=None):
+		# Rate and block size for rendering a preview of a source_rate file
+		# on board, a preview board (probing resets it)
+		sample_rate = self.pickRenderRate(source_rate)
+		rates = [sample_rate] + self.getLowerRates(sample_rate, self.getDeviceRates("out"))
+		block_sizes = RENDER_BLOCK_SIZES
+		if block_size is not None:
+			block_sizes = [block_size] + [size for size in RENDER_BLOCK_SIZES if size > block_size]
+		sample_rate, block_size, load = self.fit(board, chain_key, rates, block_sizes, num_channels)
+		return {
+			"sample_rate": sample_rate,
+			"block_size": block_size,
+			"load": load,
+			"resample": sample_rate != source_rate,
+		}
+
+	def negotiateStream(self, board, chain_key, sample_rate=None, num_channels=1):
+		# The device registry's lowest-latency settings, with the buffer
+		# grown (and then the rate lowered) until the chain keeps up. Call
+		# before the stream starts; probing resets the board.
+		config = self.io_manager.pickStreamConfig(sample_rate)
+		device_rates = None
+		for in_or_out in ("in", "out"):
+			rates = self.getDeviceRates(in_or_out)
+			if rates is not None:
+				device_rates = rates if device_rates is None else [rate for rate in device_rates if rate in rates]
+		rates = [config["sample_rate"]] + self.getLowerRates(config["sample_rate"], device_rates)
+		block_sizes = [size for size in STREAM_BUFFER_SIZES if size >= config["buffer_size"]]
+		sample_rate, buffer_size, load = self.fit(board, chain_key, rates, block_sizes, num_channels)
+		return {
+			"sample_rate": sample_rate,
+			"buffer_size": buffer_size,
+			"latency_ms": 1000.0 * buffer_size / sample_rate,
+			"load": load,
+		}
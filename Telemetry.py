@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# How often the exporter rewrites its metrics file
+METRICS_INTERVAL_SECONDS = 5.0
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RENDER_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Log format for the pedal's own output
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+class Counter:
+	# Each metric is written from one thread at a time, so updates are plain
+	# attribute writes: no locks, and readers may see a value one update old
+	def __init__(self, name, help_text):
+		self.name = name
+		self.help_text = help_text
+		self.value = 0
+
+	def __str__(self):
+		return f"<Counter object>"
+
+	def inc(self, amount=1):
+		self.value = self.value + amount
+
+	def render(self):
+		return [f"{self.name} {self.value}"]
+
+class Gauge:
+	def __init__(self, name, help_text):
+		self.name = name
+		self.help_text = help_text
+		self.value = 0.0
+
+	def __str__(self):
+		return f"<Gauge object>"
+
+	def set(self, value):
+		self.value = value
+
+	def render(self):
+		return [f"{self.name} {self.value}"]
+
+class Histogram:
+	# Fixed buckets, counted per bucket and summed up only when rendered. Like
+	# the counters, observe() is unlocked: two threads observing at once can
+	# lose one of the observations.
+	def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+		self.name = name
+		self.help_text = help_text
+		self.buckets = list(buckets)
+		self.counts = [0] * (len(self.buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def __str__(self):
+		return f"<Histogram object>"
+
+	def observe(self, value):
+		i = bisect_left(self.buckets, value)
+		self.counts[i] = self.counts[i] + 1
+		self.sum = self.sum + value
+		self.count = self.count + 1
+
+	def render(self):
+		counts = list(self.counts)
+		lines = []
+		total = 0
+		for bound, count in zip(self.buckets + ["+Inf"], counts):
+			total = total + count
+			lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+		lines.append(f"{self.name}_sum {self.sum}")
+		lines.append(f"{self.name}_count {total}")
+		return lines
+
+# Prometheus type name of each metric class
+METRIC_TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+class Metrics:
+	# The engine's counters, gauges and histograms by name. Modules look
+	# their metrics up once, when they're created, and keep them.
+	def __init__(self, prefix="soul_"):
+		self.prefix = prefix
+		self.metrics = {}
+		self.lock = threading.Lock()
+
+	def __str__(self):
+		return f"<Metrics object>"
+
+	def getMetric(self, metric_class, name, help_text, *args):
+		with self.lock:
+			metric = self.metrics.get(self.prefix + name)
+			if metric is None:
+				metric = self.metrics[self.prefix + name] = metric_class(self.prefix + name, help_text, *args)
+			return metric
+
+	def counter(self, name, help_text):
+		return self.getMetric(Counter, name, help_text)
+
+	def gauge(self, name, help_text):
+		return self.getMetric(Gauge, name, help_text)
+
+	def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+		return self.getMetric(Histogram, name, help_text, buckets)
+
+	def render(self):
+		# Everything in the Prometheus text exposition format
+		with self.lock:
+			metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+		lines = []
+		for metric in metrics:
+			lines.append(f"# HELP {metric.name} {metric.help_text}")
+			lines.append(f"# TYPE {metric.name} {METRIC_TYPES[type(metric)]}")
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+# The engine's metrics, shared by every module like the logging tree
+metrics = Metrics()
+
+class MetricsExporter:
+	# Renders the metrics off the hot path on background threads, each only if
+	# asked for: into metrics_file every interval, replaced atomically (the
+	# Prometheus text format, for node_exporter's textfile collector), and on
+	# a local HTTP endpoint (http://127.0.0.1:port/metrics)
+	def __init__(self, registry=metrics, metrics_file=None, interval=METRICS_INTERVAL_SECONDS, port=None):
+		self.registry = registry
+		self.metrics_file = metrics_file
+		self.interval = interval
+		self.port = port
+		self.running = False
+		self.thread = None
+		self.server = None
+		self.server_thread = None
+		self.writes = 0
+
+	def __str__(self):
+		return f"<MetricsExporter object>"
+
+	def start(self):
+		if self.running:
+			return
+		self.running = True
+		if self.metrics_file is not None:
+			self.thread = threading.Thread(target=self.run, name="MetricsExporter", daemon=True)
+			self.thread.start()
+		if self.port is not None:
+			# Only imported when asked for: http.server adds ~50 ms to startup
+			from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+			registry = self.registry
+
+			class MetricsHandler(BaseHTTPRequestHandler):
+				def do_GET(self):
+					if self.path != "/metrics":
+						self.send_error(404)
+						return
+					body = registry.render().encode()
+					self.send_response(200)
+					self.send_header("Content-Type", "text/plain; version=0.0.4")
+					self.send_header("Content-Length", str(len(body)))
+					self.end_headers()
+					self.wfile.write(body)
+
+				def log_message(self, format, *args):
+					logging.getLogger(__name__).debug(format, *args)
+
+			self.server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+			self.port = self.server.server_address[1]
+			self.server_thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+			self.server_thread.start()
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		if self.server is not None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server_thread.join()
+			self.server = None
+
+	def run(self):
+		while self.running:
+			self.write()
+			deadline = time.monotonic() + self.interval
+			while self.running and time.monotonic() < deadline:
+				time.sleep(min(0.1, self.interval))
+		self.write()
+
+	def write(self):
+		partial_file = self.metrics_file + ".partial"
+		os.makedirs(os.path.dirname(self.metrics_file) or ".", exist_ok=True)
+		with open(partial_file, "w") as f:
+			f.write(self.registry.render())
+		os.replace(partial_file, self.metrics_file)
+		self.writes = self.writes + 1
+
+def setupLogging(level="INFO"):
+	# Level-gated output for every module. Messages below the level are
+	# dropped by the logger's level check before any formatting.
+	logging.basicConfig(level=getattr(logging, str(level).upper()), format=LOG_FORMAT)
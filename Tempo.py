@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+
+# Tempo range, in whole BPM
+BPM_MIN = 40
+BPM_MAX = 240
+DEFAULT_BPM = 120
+
+# Note divisions a synced parameter can follow, as a length in beats
+NOTE_DIVISIONS = {
+	"1/1": 4.0,
+	"1/2": 2.0,
+	"1/4": 1.0,
+	"1/8.": 0.75,
+	"1/8": 0.5,
+	"1/8t": 1.0 / 3.0,
+	"1/16": 0.25,
+}
+DEFAULT_DIVISION = "1/8"
+
+# Parameters that follow the tempo: a delay time is one division long, an
+# LFO makes one cycle per division
+TEMPO_PARAMS = {
+	"Delay": ("delay_seconds", "seconds"),
+	"Chorus": ("rate_hz", "hz"),
+}
+
+# Taps the tempo is averaged over, and the gap that starts a new count
+TAP_COUNT = 4
+TAP_TIMEOUT_SECONDS = 2.0
+
+class TempoSync:
+	# Tempo for the time-based effects. Delay times and LFO rates for every
+	# whole BPM and note division are computed once up front, so a tempo
+	# change is two table lookups per synced parameter. The tempo comes from
+	# tapping: the median gap of the last few taps.
+	def __init__(self, bpm=DEFAULT_BPM, division=DEFAULT_DIVISION):
+		bpms = np.arange(BPM_MIN, BPM_MAX + 1, dtype=np.float64)
+		beats = np.array(list(NOTE_DIVISIONS.values()))
+		self.divisions = list(NOTE_DIVISIONS)
+		# [bpm - BPM_MIN, division index]
+		self.seconds_table = np.outer(60.0 / bpms, beats)
+		self.hz_table = 1.0 / self.seconds_table
+
+		self.bpm = bpm
+		self.division = division
+		self.synced = set()
+		self.taps = []
+
+	def __str__(self):
+		return f"<TempoSync object>"
+
+	def getBpm(self):
+		return self.bpm
+
+	def setBpm(self, bpm):
+		self.bpm = int(min(max(round(bpm), BPM_MIN), BPM_MAX))
+		return self.bpm
+
+	def getDivision(self):
+		return self.division
+
+	def nextDivision(self):
+		self.division = self.divisions[(self.divisions.index(self.division) + 1) % len(self.divisions)]
+		return self.division
+
+	def tap(self, tapped_at=None):
+		# Register a tap; returns the new BPM once there are two taps in a row
+		if tapped_at is None:
+			tapped_at = time.perf_counter()
+		if self.taps and tapped_at - self.taps[-1] > TAP_TIMEOUT_SECONDS:
+			self.taps = []
+		self.taps = (self.taps + [tapped_at])[-TAP_COUNT:]
+		if len(self.taps) < 2:
+			return None
+		return self.setBpm(60.0 / float(np.median(np.diff(self.taps))))
+
+	def isSynced(self, effect_name):
+		return effect_name in self.synced
+
+	def setSynced(self, effect_name, synced):
+		if synced:
+			self.synced.add(effect_name)
+		else:
+			self.synced.discard(effect_name)
+
+	def getSyncedParam(self, effect_name):
+		# Name of the parameter the tempo sets on this effect, if synced
+		if effect_name not in self.synced:
+			return None
+		return TEMPO_PARAMS[effect_name][0]
+
+	def getValue(self, effect_name):
+		# The synced parameter's value at the current tempo and division
+		table = self.seconds_table if TEMPO_PARAMS[effect_name][1] == "seconds" else self.hz_table
+		return float(table[self.bpm - BPM_MIN, self.divisions.index(self.division)])
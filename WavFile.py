@@ -0,0 +1,183 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample formats that can be mapped as they are, by (format tag, bits)
+WAV_DTYPES = {
+	(WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+	(WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+	(WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+}
+
+# Full scale of each stored type. As in pedalboard's AudioFile, integers are
+# read as value / full scale, and written by rounding x to 32 bits and
+# keeping the top bits, so files match the ones AudioFile writes.
+WAV_SCALES = {
+	np.dtype("<i2"): 32767.0,
+	np.dtype("<i4"): 2147483647.0,
+	np.dtype("<f4"): 1.0,
+}
+
+# Frames converted per step when reading or writing a whole file
+WAV_BLOCK_FRAMES = 65536
+
+# Frames processed between handing finished pages back to the kernel
+WAV_RELEASE_FRAMES = 1 << 18
+
+def isMappable(audio_file):
+	# True for an uncompressed WAV whose samples can be used in place
+	if not audio_file.lower().endswith(".wav"):
+		return False
+	try:
+		readWavHeader(audio_file)
+	except ValueError:
+		return False
+	return True
+
+def readWavHeader(audio_file):
+	# (samplerate, channels, dtype, data offset, frames) from the RIFF chunks
+	with open(audio_file, "rb") as f:
+		riff = f.read(12)
+		if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+			raise ValueError(audio_file + " is not a WAV file")
+		fmt = None
+		while True:
+			chunk = f.read(8)
+			if len(chunk) < 8:
+				raise ValueError(audio_file + " has no data chunk")
+			chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+			if chunk_id == b"fmt ":
+				fmt = f.read(chunk_size)
+				format_tag, channels, samplerate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+				if format_tag == WAVE_FORMAT_EXTENSIBLE:
+					format_tag = struct.unpack("<H", fmt[24:26])[0]
+				dtype = WAV_DTYPES.get((format_tag, bits))
+				if dtype is None:
+					raise ValueError(audio_file + " has a sample format that can't be mapped")
+			elif chunk_id == b"data":
+				if fmt is None:
+					raise ValueError(audio_file + " has data before its format")
+				frames = chunk_size // (channels * dtype.itemsize)
+				return float(samplerate), channels, dtype, f.tell(), frames
+			else:
+				f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def writeWavHeader(f, samplerate, channels, dtype, frames):
+	format_tag = WAVE_FORMAT_IEEE_FLOAT if dtype.kind == "f" else WAVE_FORMAT_PCM
+	data_bytes = frames * channels * dtype.itemsize
+	f.write(struct.pack("<4sI4s", b"RIFF", 36 + data_bytes, b"WAVE"))
+	f.write(struct.pack("<4sIHHIIHH", b"fmt ", 16, format_tag, channels, int(samplerate),
+		int(samplerate) * channels * dtype.itemsize, channels * dtype.itemsize, 8 * dtype.itemsize))
+	f.write(struct.pack("<4sI", b"data", data_bytes))
+
+class MappedWav:
+	# The sample data of a WAV file as a (frames, channels) NumPy view over a
+	# memory map, no decoding. Converting blocks to and from float32 goes
+	# through preallocated buffers, and release() hands pages that are done
+	# with back to the kernel, so resident memory stays flat however long the
+	# file is.
+	def __init__(self, audio_file, writable=False):
+		self.audio_file = audio_file
+		self.samplerate, self.num_channels, self.dtype, self.offset, self.frames = readWavHeader(audio_file)
+		self.scale = WAV_SCALES[self.dtype]
+		self.file = open(audio_file, "r+b" if writable else "rb")
+		length = self.offset + self.frames * self.num_channels * self.dtype.itemsize
+		self.mmap = mmap.mmap(self.file.fileno(), length, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+		self.data = np.frombuffer(self.mmap, dtype=self.dtype, count=self.frames * self.num_channels,
+			offset=self.offset).reshape(self.frames, self.num_channels)
+		self.block = None
+		self.wide = None
+
+	def __str__(self):
+		return f"<MappedWav object>"
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def getBlock(self, frames):
+		# (channels, frames) float32 scratch, grown only if a bigger block is asked for
+		if self.block is None or self.block.shape[1] < frames:
+			self.block = np.empty((self.num_channels, frames), dtype=np.float32)
+		return self.block[:, :frames]
+
+	def read(self, start, frames, out=None):
+		# Frames from start as (channels, frames) float32, converted into out
+		# (or a reused buffer). Fewer at the end of the file.
+		end = min(start + frames, self.frames)
+		if out is None:
+			out = self.getBlock(end - start)
+		out = out[:, :end - start]
+		np.multiply(self.data[start:end].T, np.float32(1.0 / self.scale), out=out, dtype=np.float32, casting="unsafe")
+		return out
+
+	def write(self, start, audio):
+		# Store (channels, frames) float32 audio at start, converted in place
+		# in the mapped file
+		end = start + audio.shape[1]
+		view = self.data[start:end].T
+		if self.dtype.kind == "f":
+			np.copyto(view, audio)
+			return
+		if self.wide is None or self.wide.shape[1] < audio.shape[1]:
+			self.wide = np.empty((self.num_channels, audio.shape[1]))
+		wide = self.wide[:, :audio.shape[1]]
+		np.clip(audio, -1.0, 1.0, out=wide)
+		np.multiply(wide, WAV_SCALES[np.dtype("<i4")], out=wide)
+		np.rint(wide, out=wide)
+		if self.dtype.itemsize < 4:
+			# Keep the top bits: a power-of-two scale is exact, and floor
+			# is much cheaper than floor_divide
+			np.multiply(wide, 1.0 / (1 << (32 - 8 * self.dtype.itemsize)), out=wide)
+			np.floor(wide, out=wide)
+		np.copyto(view, wide, casting="unsafe")
+
+	def release(self, start, end):
+		# Unmap the pages holding frames [start, end). The mapping is shared,
+		# so written pages stay in the page cache and reach the file anyway.
+		frame_bytes = self.num_channels * self.dtype.itemsize
+		first = (self.offset + start * frame_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+		last = (self.offset + end * frame_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+		if last <= first:
+			return
+		if self.mmap.closed:
+			return
+		if hasattr(mmap, "MADV_DONTNEED"):
+			self.mmap.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+	def close(self):
+		if self.mmap.closed:
+			return
+		self.data = None
+		if self.file.mode != "rb":
+			self.mmap.flush()
+		try:
+			self.mmap.close()
+		except BufferError:
+			# A caller still holds a view; the map closes when it goes
+			pass
+		self.file.close()
+
+def openWav(audio_file):
+	return MappedWav(audio_file)
+
+def createWav(audio_file, samplerate, num_channels, frames, dtype=np.int16):
+	# A WAV of the given length, allocated up front and mapped for writing
+	dtype = np.dtype(dtype).newbyteorder("<")
+	with open(audio_file, "wb") as f:
+		writeWavHeader(f, samplerate, num_channels, dtype, frames)
+		length = f.tell() + frames * num_channels * dtype.itemsize
+		f.truncate(length)
+		if hasattr(os, "posix_fallocate"):
+			# Reserve the blocks now rather than on each first write
+			os.posix_fallocate(f.fileno(), 0, length)
+	return MappedWav(audio_file, writable=True)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Render a folder of takes through a SOUL effect chain, one file per worker process.
+#   python3 batchRender.py preset.json takes/ [-o takes/processed] [-j 4]
+#
+# The preset is JSON mapping each effect name to its settings, the same shape
+# as AudioManager.getPreset():
+#   {"Chorus": {"enabled": true, "param_indices": [1, 1, 5, 1, 2]}, ...}
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pedalboard.io import AudioFile
+
+from AudioManager import buildBoard, effectsFromPreset, STREAM_BLOCK_SIZE
+from WavFile import isMappable, openWav, createWav, WAV_RELEASE_FRAMES
+
+audio_extensions = (".wav", ".flac", ".mp3", ".ogg", ".aiff", ".aif")
+
+# One board per worker process, built once by initWorker
+worker_board = None
+
+
+def loadPreset(preset_file):
+	with open(preset_file) as f:
+		return json.load(f)
+
+
+def initWorker(preset):
+	global worker_board
+	worker_board = buildBoard(effectsFromPreset(preset))
+
+
+def renderFile(in_file, out_file, block_size):
+	# Stream one file through the worker's board, block by block at the
+	# file's own sample rate. Returns (audio seconds, wall seconds).
+	start = time.perf_counter()
+	worker_board.reset()
+	if isMappable(in_file):
+		frames, samplerate = renderMapped(in_file, out_file, block_size)
+	else:
+		frames, samplerate = renderDecoded(in_file, out_file, block_size)
+	return frames / samplerate, time.perf_counter() - start
+
+
+def renderMapped(in_file, out_file, block_size):
+	# PCM WAV in, WAV out, both memory-mapped: blocks are converted straight
+	# out of the input and into the preallocated output, and finished pages
+	# are released, so memory stays flat for files larger than RAM
+	with openWav(in_file) as f:
+		with createWav(out_file, f.samplerate, f.num_channels, f.frames) as o:
+			released = 0
+			for position in range(0, f.frames, block_size):
+				o.write(position, worker_board(f.read(position, block_size), f.samplerate, reset=False))
+				if position - released >= WAV_RELEASE_FRAMES:
+					f.release(released, position)
+					o.release(released, position)
+					released = position
+		return f.frames, f.samplerate
+
+
+def renderDecoded(in_file, out_file, block_size):
+	# Any other format, decoded and encoded by AudioFile
+	with AudioFile(in_file) as f:
+		with AudioFile(out_file, 'w', f.samplerate, f.num_channels) as o:
+			while f.tell() < f.frames:
+				o.write(worker_board(f.read(block_size), f.samplerate, reset=False))
+		return f.frames, f.samplerate
+
+
+def findAudioFiles(in_dir):
+	names = sorted(os.listdir(in_dir))
+	return [os.path.join(in_dir, name) for name in names if name.lower().endswith(audio_extensions)]
+
+
+def outputName(in_file, level):
+	# take.flac -> take.wav; level 1 keeps the extension (take-flac.wav),
+	# level 2 the parent folder as well (takes-take-flac.wav)
+	stem, extension = os.path.splitext(os.path.basename(in_file))
+	name = stem
+	if level >= 1 and extension:
+		name = name + "-" + extension[1:]
+	if level >= 2:
+		name = os.path.basename(os.path.dirname(os.path.abspath(in_file))) + "-" + name
+	return name + ".wav"
+
+
+def outputNames(in_files):
+	# One output name per input, kept short unless two inputs would write the
+	# same file (compared without case, for case-insensitive filesystems)
+	levels = [0] * len(in_files)
+	for level in (1, 2):
+		names = [outputName(in_file, l).lower() for in_file, l in zip(in_files, levels)]
+		levels = [level if names.count(name) > 1 else l for name, l in zip(names, levels)]
+	names = []
+	for in_file, level in zip(in_files, levels):
+		name = outputName(in_file, level)
+		# Still taken (the same file twice, or same-named folders): number it
+		num = 1
+		while name.lower() in (n.lower() for n in names):
+			num = num + 1
+			name = os.path.splitext(outputName(in_file, level))[0] + "-" + str(num) + ".wav"
+		names.append(name)
+	return names
+
+
+def batchRender(preset, in_files, out_dir, workers=None, block_size=STREAM_BLOCK_SIZE):
+	os.makedirs(out_dir, exist_ok=True)
+	out_files = [os.path.join(out_dir, name) for name in outputNames(in_files)]
+
+	start = time.perf_counter()
+	with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(preset,)) as pool:
+		results = list(pool.map(renderFile, in_files, out_files, [block_size] * len(in_files)))
+	wall_seconds = time.perf_counter() - start
+
+	audio_seconds = sum(result[0] for result in results)
+	for in_file, (file_seconds, render_seconds) in zip(in_files, results):
+		print(f"  {os.path.basename(in_file):<40} {file_seconds:8.1f} s audio in {render_seconds:6.2f} s")
+	print(f"{len(in_files)} files, {audio_seconds:.1f} s of audio in {wall_seconds:.2f} s: "
+		f"{audio_seconds / wall_seconds:.1f} audio-seconds per wall-second")
+	return audio_seconds, wall_seconds
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Render a folder of audio files through a SOUL preset")
+	parser.add_argument("preset", help="preset JSON file")
+	parser.add_argument("in_dir", help="folder of audio files")
+	parser.add_argument("-o", "--out-dir", help="where to write the results (default: <in_dir>/processed)")
+	parser.add_argument("-j", "--workers", type=int, help="worker processes (default: one per core)")
+	parser.add_argument("--block-size", type=int, default=STREAM_BLOCK_SIZE, help="frames per processing block")
+	args = parser.parse_args()
+
+	out_dir = args.out_dir or os.path.join(args.in_dir, "processed")
+	in_files = findAudioFiles(args.in_dir)
+	if not in_files:
+		parser.error("no audio files in " + args.in_dir)
+	batchRender(loadPreset(args.preset), in_files, out_dir, args.workers, args.block_size)
@@ -0,0 +1,1155 @@
+#!/usr/bin/env python3
+# Benchmarks for the SOUL audio engine. Runs headless (no LCD or buttons needed).
+#   python3 benchmark.py                          # everything
+#   python3 benchmark.py effects --json out.json  # chosen benchmarks, results saved as JSON
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+import random
+
+import numpy as np
+import pedalboard
+from pedalboard import Pedalboard, Gain
+from pedalboard.io import AudioFile
+
+import batchRender
+from AudioManager import AudioManager, PLUGIN_TYPES, SAMPLERATE, STREAM_BLOCK_SIZE
+from ChainMixer import ChainMixer
+from Controller import Controller
+from Hardware import HeadlessHardware, NullAudio
+from LCDManager import LCDManager, LCD_BYTE_SECONDS, LCD_CLEAR_SECONDS
+from Looper import Looper
+from MatlabReference import MatlabEcho, MatlabFlanger, MatlabFreeverb
+from NumpyEffects import Flanger, Echo, Phaser, Freeverb
+from PresetManager import PresetManager
+from RenderCache import RenderCache
+from SampleStore import SampleStore
+from StateManager import StateManager
+from StreamNegotiator import StreamNegotiator
+from Telemetry import Metrics, MetricsExporter, metrics
+from WavFile import createWav, openWav
+
+effects_list = ["Chorus", "Delay", "Reverb", "Compressor"]
+
+
+def quiet():
+	# Keeps anything printed while managers are set up out of the results
+	return contextlib.redirect_stdout(io.StringIO())
+
+
+def enabledManager():
+	with quiet():
+		audio_manager = AudioManager(effects_list, hardware=HeadlessHardware())
+		for effect in audio_manager.getEffectsArray():
+			effect.setEnable(True)
+		audio_manager.updateBoard()
+	return audio_manager
+
+
+def legacyRebuild(audio_manager):
+	# The original updateBoard: a fresh board and plugins with exec'd params
+	effects_board = Pedalboard([Gain(gain_db=0)])
+	effect_num = 1
+	for effect in audio_manager.getEffectsArray():
+		if effect.getEnable():
+			effects_board.append(PLUGIN_TYPES[effect.getName()]())
+			for param_i in range(len(effect.getParamNames())):
+				param_name = effect.getParamNameAt(param_i)
+				param_val = effect.getParamValueAt(param_i)
+				exec("effects_board[effect_num]." + param_name + " = " + str(param_val))
+			effect_num = effect_num + 1
+	return effects_board
+
+
+def clickParam(effects, defaults, i):
+	# Update i walks every parameter of every effect, one click each. Each
+	# value flips between its default and the next table entry, since some
+	# tables hold values the plugins reject (e.g. Compressor ratio < 1).
+	effect_i = i % len(effects)
+	effect = effects[effect_i]
+	param_i = (i // len(effects)) % len(effect.getParamNames())
+	default_idx = defaults[effect_i][param_i]
+	if effect.param_indices[param_i] == default_idx:
+		effect.param_indices[param_i] = (default_idx + 1) % len(effect.param_values[param_i])
+	else:
+		effect.param_indices[param_i] = default_idx
+
+
+def timeUpdates(audio_manager, update, iterations):
+	effects = audio_manager.getEffectsArray()
+	defaults = [list(effect.param_indices) for effect in effects]
+	start = time.perf_counter()
+	for i in range(iterations):
+		clickParam(effects, defaults, i)
+		update(audio_manager)
+	return (time.perf_counter() - start) / iterations
+
+
+def timeToggles(audio_manager, update, iterations):
+	effects = audio_manager.getEffectsArray()
+	start = time.perf_counter()
+	for i in range(iterations):
+		effect = effects[i % len(effects)]
+		effect.setEnable(not effect.getEnable())
+		update(audio_manager)
+	return (time.perf_counter() - start) / iterations
+
+
+def benchmarkUpdateBoard(iterations=2000):
+	audio_manager = enabledManager()
+	with quiet():
+		results = {
+			"param rebuild": timeUpdates(audio_manager, legacyRebuild, iterations),
+			"param incremental": timeUpdates(audio_manager, AudioManager.updateBoard, iterations),
+			"toggle rebuild": timeToggles(audio_manager, legacyRebuild, iterations),
+			"toggle incremental": timeToggles(audio_manager, AudioManager.updateBoard, iterations),
+		}
+
+	print("updateBoard latency (" + str(iterations) + " updates)")
+	for name, seconds in results.items():
+		print(f"  {name:<20} {seconds * 1e6:10.1f} us/update")
+	return results
+
+
+def benchmarkAutomation(rates=(0, 100, 1000, 10000, 100000), seconds=1.0):
+	# Parameter updates through updateBoard while the live stream runs on the
+	# null devices in real time: each one becomes a glide on the audio thread.
+	# Updates are paced at each rate (or as fast as they go, if slower).
+	audio_manager = enabledManager()
+	effects = audio_manager.getEffectsArray()
+	defaults = [list(effect.param_indices) for effect in effects]
+	with quiet():
+		audio_manager.startAudioStream()
+	stream = audio_manager.live_stream
+	time.sleep(0.3)
+
+	results = []
+	i = 0
+	for rate in rates:
+		stats = stream.stats
+		blocks_before = stats.blocks
+		underruns_before = stats.underruns
+		updates = 0
+		start = time.perf_counter()
+		end = start + seconds
+		while True:
+			now = time.perf_counter()
+			if now >= end:
+				break
+			if rate == 0 or now < start + updates / rate:
+				time.sleep(0.001 if rate == 0 else min(0.001, start + updates / rate - now))
+				continue
+			clickParam(effects, defaults, i)
+			audio_manager.updateBoard()
+			i = i + 1
+			updates = updates + 1
+		elapsed = time.perf_counter() - start
+
+		blocks = stats.blocks - blocks_before
+		window = len(stats.durations)
+		recent = stats.durations[[(blocks_before + b) % window for b in range(min(blocks, window))]]
+		results.append({
+			"rate": rate,
+			"updates_per_second": updates / elapsed,
+			"blocks": blocks,
+			"underruns": stats.underruns - underruns_before,
+			"callback_p99_ms": 1000.0 * float(np.percentile(recent, 99)) if blocks else 0.0,
+			"callback_max_ms": 1000.0 * float(recent.max()) if blocks else 0.0,
+		})
+
+	with quiet():
+		audio_manager.stopAudioStream()
+
+	# Underruns are the null output device's own count (a write after it ran
+	# dry); each rate is judged against the run with no updates at all
+	baseline = results[0]
+	for result in results:
+		result["extra_underruns"] = result["underruns"] - baseline["underruns"]
+		result["p99_over_idle_ms"] = result["callback_p99_ms"] - baseline["callback_p99_ms"]
+
+	block_ms = 1000.0 * stream.buffer_size / stream.sample_rate
+	print(f"live param automation ({stream.buffer_size}-frame blocks, {block_ms:.1f} ms)")
+	for result in results:
+		print(f"  asked {result['rate']:>7}/s  got {result['updates_per_second']:9.0f}/s  "
+			f"callback p99 {result['callback_p99_ms']:6.3f} ms ({result['p99_over_idle_ms']:+.3f})  "
+			f"max {result['callback_max_ms']:6.3f} ms  underruns {result['underruns']} ({result['extra_underruns']:+d})")
+	sustained = [result["updates_per_second"] for result in results[1:] if result["extra_underruns"] <= 0]
+	if sustained:
+		print(f"  sustained without extra underruns: {max(sustained):.0f} updates/s")
+	else:
+		print("  no update rate ran without extra underruns")
+	return {"block_ms": block_ms, "rates": results,
+		"sustained_updates_per_second": max(sustained) if sustained else None}
+
+
+def benchmarkTempo(iterations=2000, block_size=512):
+	# Tempo changes on synced Delay and Chorus: cost of a change against the
+	# old rebuild, and whether the delay line survives one. An impulse goes in,
+	# the tempo changes while its echoes are still sounding, then silence.
+	audio_manager = enabledManager()
+	with quiet():
+		for effect_name in ("Delay", "Chorus"):
+			audio_manager.setTempoSync(effect_name, True)
+	board = audio_manager.effects_board
+	results = {}
+
+	start = time.perf_counter()
+	for i in range(iterations):
+		audio_manager.setTempo(90 + i % 60)
+	results["tempo change"] = (time.perf_counter() - start) / iterations
+	start = time.perf_counter()
+	for i in range(iterations // 10):
+		legacyRebuild(audio_manager)
+	results["rebuild"] = (time.perf_counter() - start) / (iterations // 10)
+	results["same board"] = board is audio_manager.effects_board
+
+	audio_manager.setTempo(120)
+	audio_manager.audiostream_enabled = True
+	impulse = np.zeros((1, block_size * 40), dtype=np.float32)
+	impulse[0, 0] = 1.0
+	out = np.zeros((2, block_size), dtype=np.float32)
+	tail = []
+	board.reset()
+	for block in range(impulse.shape[1] // block_size):
+		if block == 10:
+			audio_manager.setTempo(140)
+		frames = audio_manager.param_control.process(board, impulse[:, block * block_size:(block + 1) * block_size], SAMPLERATE, out)
+		if block >= 10:
+			tail.append(float(np.abs(out[:, :frames]).max()))
+	audio_manager.audiostream_enabled = False
+	audio_manager.param_control.settle()
+	results["tail after change"] = max(tail)
+	results["delay_seconds"] = audio_manager.plugin_map["Delay"].delay_seconds
+
+	print("tempo sync (Delay, Chorus)")
+	print(f"  {'tempo change':<20} {results['tempo change'] * 1e6:10.1f} us")
+	print(f"  {'rebuild':<20} {results['rebuild'] * 1e6:10.1f} us")
+	print(f"  same board {results['same board']}, echo level after change {results['tail after change']:.3f}, delay {results['delay_seconds']:.4f} s at 140 bpm")
+	return results
+
+
+def benchmarkPresets(iterations=2000):
+	# Flip between two presets that differ in every param and in which
+	# effects are on
+	audio_manager = enabledManager()
+	preset_a = audio_manager.getPreset()
+	preset_b = {}
+	for effect_name, state in preset_a.items():
+		preset_b[effect_name] = {"enabled": effect_name != "Reverb", "param_indices": [i + 1 for i in state["param_indices"]]}
+	presets = [preset_a, preset_b]
+
+	def setPresetRebuild(preset):
+		for effect_name, state in preset.items():
+			audio_manager.getEffectObj(effect_name).setState(state)
+		audio_manager.effects_board = legacyRebuild(audio_manager)
+
+	results = {}
+	with tempfile.TemporaryDirectory() as presets_dir, quiet():
+		preset_manager = PresetManager(audio_manager, presets_dir)
+		for name, preset in zip(["a", "b"], presets):
+			audio_manager.setPreset(preset)
+			preset_manager.savePreset(name)
+
+		for label, switch, targets in [
+				("rebuild", setPresetRebuild, presets),
+				("incremental", audio_manager.setPreset, presets),
+				("prebuilt", preset_manager.switchPreset, ["a", "b"])]:
+			start = time.perf_counter()
+			for i in range(iterations):
+				switch(targets[i % 2])
+			results[label] = (time.perf_counter() - start) / iterations
+
+	print("preset switch latency (" + str(iterations) + " switches)")
+	for name, seconds in results.items():
+		print(f"  {name:<20} {seconds * 1e6:10.1f} us/switch")
+	return results
+
+
+def benchmarkRender(audio_file="emily.wav", block_size=STREAM_BLOCK_SIZE):
+	# The whole file through the board at once against a preview, which
+	# renders block by block into a bounded take and saves it to the render
+	# cache as it goes: wall time, peak Python heap across threads (numpy
+	# buffers included) and the largest sample difference
+	audio_manager = enabledManager()
+	results = {}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		with quiet():
+			audio_manager.render_cache = RenderCache(tmp_dir)
+			audio_manager.preloadSamples([audio_file])
+			# Negotiates the render settings, so only the preview itself is traced
+			audio_manager.applyEffects(audio_file, block_size=block_size, save=False)
+		tracemalloc.start()
+		start = time.perf_counter()
+		take = audio_manager.applyEffects(audio_file, block_size=block_size, save=True)
+		while audio_manager.saving:
+			time.sleep(0.001)
+		seconds = time.perf_counter() - start
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		results["preview"] = {"seconds": seconds, "peak_bytes": peak}
+		audio_manager.playback.close()
+
+		samplerate = audio_manager.render_config["sample_rate"]
+		cache_key = audio_manager.render_cache.getKey(audio_file, samplerate, audio_manager.effects_array, audio_manager.tempo)
+		with openWav(audio_manager.render_cache.lookup(cache_key)) as f:
+			preview = f.read(0, f.frames).copy()
+
+	samples = audio_manager.sample_store.getSamples(audio_file, samplerate)
+	tracemalloc.start()
+	start = time.perf_counter()
+	one_shot = audio_manager.buildPreviewBoard()(samples, samplerate)
+	seconds = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	results["one-shot"] = {"seconds": seconds, "peak_bytes": peak}
+
+	max_diff = float(np.max(np.abs(one_shot - preview)))
+	print(f"applyEffects render of {audio_file} (block size {audio_manager.render_config['block_size']}, "
+		f"take ring {take.ring.nbytes / 1e6:.2f} MB of {one_shot.nbytes / 1e6:.2f} MB)")
+	for name, result in results.items():
+		print(f"  {name:<20} {result['seconds']:8.3f} s  peak {result['peak_bytes'] / 1e6:8.2f} MB")
+	print(f"  max sample difference {max_diff}")
+	results["max_sample_difference"] = max_diff
+	assert max_diff <= 2.0 / 32767, "the saved preview doesn't match the one-shot render"
+	assert results["preview"]["peak_bytes"] < one_shot.nbytes, "the preview holds the whole render in memory"
+	return results
+
+
+def decodeSamples(audio_file, samplerate):
+	# What every preview used to do before the SampleStore
+	with AudioFile(audio_file).resampled_to(samplerate) as f:
+		return f.read(f.frames)
+
+
+def residentBytes():
+	# Current resident set size (Linux); 0 where /proc isn't available
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError):
+		return 0
+
+
+def peakResident(run, interval=0.005):
+	# run() and the largest rise in resident memory seen while it ran
+	baseline = residentBytes()
+	peak = [baseline]
+	done = threading.Event()
+
+	def sample():
+		while not done.is_set():
+			peak[0] = max(peak[0], residentBytes())
+			time.sleep(interval)
+
+	sampler = threading.Thread(target=sample, daemon=True)
+	sampler.start()
+	start = time.perf_counter()
+	run()
+	seconds = time.perf_counter() - start
+	done.set()
+	sampler.join()
+	return seconds, max(peak[0], residentBytes()) - baseline
+
+
+def benchmarkWav(minutes=10.0, block_size=STREAM_BLOCK_SIZE):
+	# A long stereo PCM take through the batch renderer's board, decoded and
+	# encoded by AudioFile vs memory-mapped in and out: wall time, rise in
+	# resident memory, and whether the outputs match
+	audio_manager = enabledManager()
+	batchRender.initWorker(audio_manager.getPreset())
+	frames = int(SAMPLERATE * 60 * minutes)
+	results = {}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		in_file = os.path.join(tmp_dir, "take.wav")
+		with createWav(in_file, SAMPLERATE, 2, frames) as f:
+			rng = np.random.default_rng(4)
+			for start in range(0, frames, 1 << 20):
+				block_frames = min(1 << 20, frames - start)
+				f.write(start, (0.2 * rng.standard_normal((2, block_frames))).astype(np.float32))
+				f.release(0, start + block_frames)
+
+		outputs = {}
+		for name, render in [("AudioFile", batchRender.renderDecoded), ("mapped", batchRender.renderMapped)]:
+			outputs[name] = os.path.join(tmp_dir, name + ".wav")
+			batchRender.worker_board.reset()
+			seconds, rise = peakResident(lambda: render(in_file, outputs[name], block_size))
+			results[name] = {"seconds": seconds, "rss_rise_bytes": rise}
+
+		with openWav(outputs["AudioFile"]) as a, openWav(outputs["mapped"]) as b:
+			results["identical"] = bool(np.array_equal(a.data, b.data))
+
+	print(f"long take render ({minutes:g} min stereo int16, {frames * 4 / 1e6:.0f} MB)")
+	for name in ("AudioFile", "mapped"):
+		print(f"  {name:<12} {results[name]['seconds']:8.2f} s  rss rise {results[name]['rss_rise_bytes'] / 1e6:8.1f} MB")
+	print(f"  outputs identical: {results['identical']}")
+	return results
+
+
+def benchmarkBatch(num_files=8, seconds=20.0, max_workers=4):
+	# batchRender over the same folder of takes at 1..max_workers worker
+	# processes: audio-seconds rendered per wall-second at each. Past the
+	# number of cores the extra workers can only share them.
+	audio_manager = enabledManager()
+	preset = audio_manager.getPreset()
+	frames = int(SAMPLERATE * seconds)
+	results = {"cores": os.cpu_count(), "workers": {}}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		rng = np.random.default_rng(5)
+		in_files = []
+		for i in range(num_files):
+			in_file = os.path.join(tmp_dir, f"take{i}.wav")
+			with createWav(in_file, SAMPLERATE, 2, frames) as f:
+				f.write(0, (0.2 * rng.standard_normal((2, frames))).astype(np.float32))
+			in_files.append(in_file)
+
+		for workers in range(1, max_workers + 1):
+			with quiet():
+				audio_seconds, wall_seconds = batchRender.batchRender(preset, in_files,
+					os.path.join(tmp_dir, f"out{workers}"), workers)
+			results["workers"][workers] = audio_seconds / wall_seconds
+
+	single = results["workers"][1]
+	print(f"batch render ({num_files} x {seconds:g} s stereo takes, {results['cores']} cores)")
+	for workers, rate in results["workers"].items():
+		print(f"  {workers} workers  {rate:8.1f} audio-s per wall-s  {rate / single:5.2f}x one worker")
+	return results
+
+
+def benchmarkSampleStore(audio_files=("sine.wav", "emily.wav"), iterations=10):
+	# Cost of getting a source file's samples ready for one preview
+	results = {}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		with quiet():
+			sample_store = SampleStore(tmp_dir)
+		for audio_file in audio_files:
+			start = time.perf_counter()
+			for i in range(iterations):
+				decodeSamples(audio_file, SAMPLERATE)
+			decode = (time.perf_counter() - start) / iterations
+
+			# First use writes the sidecar; a restart only maps it back in
+			start = time.perf_counter()
+			sample_store.getSamples(audio_file, SAMPLERATE)
+			first_use = time.perf_counter() - start
+
+			start = time.perf_counter()
+			for i in range(iterations):
+				with quiet():
+					restarted_store = SampleStore(tmp_dir)
+				restarted_store.getSamples(audio_file, SAMPLERATE)
+			restart = (time.perf_counter() - start) / iterations
+
+			start = time.perf_counter()
+			for i in range(iterations):
+				sample_store.getSamples(audio_file, SAMPLERATE)
+			warm = (time.perf_counter() - start) / iterations
+
+			results[audio_file] = {"decode": decode, "first use": first_use, "after restart": restart, "warm": warm}
+
+	print("source samples per preview")
+	for audio_file, timings in results.items():
+		for name, seconds in timings.items():
+			print(f"  {audio_file:<10} {name:<14} {seconds * 1e3:10.3f} ms")
+		saved = timings["decode"] - timings["warm"]
+		print(f"  {audio_file:<10} {'saved':<14} {saved * 1e3:10.3f} ms/preview")
+	return results
+
+
+def benchmarkNegotiation(audio_files=("sine.wav", "emily.wav"), headrooms=(0.7, 0.05, 0.01, 0.002)):
+	# What the StreamNegotiator picks for the full chain: the preview rate per
+	# source file (and what decoding at the old fixed rate cost), then the
+	# live stream settings as the allowed CPU headroom shrinks
+	audio_manager = enabledManager()
+	board = audio_manager.effects_board
+	chain_key = audio_manager.negotiator.getChainKey(audio_manager.effects_array)
+	results = {"render": {}, "stream": {}}
+
+	print("rate and block negotiation")
+	for audio_file in audio_files:
+		source_rate = audio_manager.sample_store.getSourceRate(audio_file)
+		start = time.perf_counter()
+		config = audio_manager.negotiator.negotiateRender(board, chain_key, source_rate)
+		cold = time.perf_counter() - start
+		start = time.perf_counter()
+		audio_manager.negotiator.negotiateRender(board, chain_key, source_rate)
+		cached = time.perf_counter() - start
+
+		start = time.perf_counter()
+		decodeSamples(audio_file, SAMPLERATE)
+		fixed_decode = time.perf_counter() - start
+		start = time.perf_counter()
+		with AudioFile(audio_file) as f:
+			f.read(f.frames)
+		native_decode = time.perf_counter() - start
+
+		config.update({"source_rate": source_rate, "negotiate_cold_seconds": cold, "negotiate_cached_seconds": cached,
+			"decode_fixed_rate_seconds": fixed_decode, "decode_native_seconds": native_decode})
+		results["render"][audio_file] = config
+		print(f"  {audio_file:<12} source {source_rate:7.0f} Hz -> {config['sample_rate']:7.0f} Hz  block {config['block_size']:6}"
+			f"  load {config['load']:.4f}  resample {config['resample']}")
+		print(f"  {'':<12} negotiate {cold * 1e3:7.2f} ms cold {cached * 1e6:7.1f} us cached"
+			f"  decode {fixed_decode * 1e3:7.2f} ms at {SAMPLERATE:.0f} Hz, {native_decode * 1e3:7.2f} ms native")
+
+	for headroom in headrooms:
+		negotiator = StreamNegotiator(audio_manager.io_manager, headroom=headroom)
+		config = negotiator.negotiateStream(board, (chain_key,), SAMPLERATE)
+		results["stream"][str(headroom)] = config
+		print(f"  live, headroom {headroom:<6} {config['sample_rate']:7.0f} Hz  buffer {config['buffer_size']:5}"
+			f"  latency {config['latency_ms']:6.2f} ms  load {config['load']:.4f}")
+	return results
+
+
+def generateSignal(samplerate, length, frequency=440):
+	# Same test tone as generateSine.py, kept as float32 in memory
+	t = np.linspace(0, length, int(samplerate * length))
+	y = np.sin(frequency * 2 * np.pi * t)
+	y = y / np.max(np.abs(y))
+	return y.astype(np.float32).reshape(1, -1)
+
+
+def effectConfigurations(audio_manager):
+	# Every value in every parameter table of every effect, one effect enabled
+	# at a time with the rest of its parameters at their defaults, followed by
+	# the full default chain
+	effects = audio_manager.getEffectsArray()
+	for effect in effects:
+		defaults = list(effect.param_indices)
+		for param_i in range(len(effect.getParamNames())):
+			for value_i in range(len(effect.param_values[param_i])):
+				effect.param_indices[:] = defaults
+				effect.param_indices[param_i] = value_i
+				yield [effect]
+		effect.param_indices[:] = defaults
+	yield effects
+
+
+def timeBlocks(board, signal, samplerate, block_size):
+	board.reset()
+	frames = signal.shape[1]
+	durations = np.zeros((frames + block_size - 1) // block_size)
+	for i, start in enumerate(range(0, frames, block_size)):
+		block_start = time.perf_counter()
+		board(signal[:, start:start + block_size], samplerate, reset=False)
+		durations[i] = time.perf_counter() - block_start
+
+	total = float(durations.sum())
+	block_seconds = block_size / samplerate
+	return {
+		# Processing time over audio time: below 1.0 keeps up with real time
+		"rtf": total * samplerate / frames,
+		"block_mean_ms": 1000.0 * float(durations.mean()),
+		"block_p99_ms": 1000.0 * float(np.percentile(durations, 99)),
+		"block_max_ms": 1000.0 * float(durations.max()),
+		"late_blocks": int(np.count_nonzero(durations > block_seconds)),
+	}
+
+
+def benchmarkEffects(block_sizes=(64, 256, 1024, 4096), length=2.0):
+	# CPU cost of each effect configuration, built through updateBoard and fed
+	# the generateSine.py tone
+	audio_manager = enabledManager()
+	signal = generateSignal(SAMPLERATE, length)
+	configs = []
+
+	with quiet():
+		for effect in audio_manager.getEffectsArray():
+			effect.setEnable(False)
+		audio_manager.updateBoard()
+
+		for enabled in effectConfigurations(audio_manager):
+			for effect in audio_manager.getEffectsArray():
+				effect.setEnable(effect in enabled)
+			config = {
+				"effects": [effect.getName() for effect in enabled],
+				"params": {effect.getName(): {name: effect.getParamValueAt(i) for i, name in enumerate(effect.getParamNames())} for effect in enabled},
+			}
+			audio_manager.updateBoard()
+			board = audio_manager.effects_board
+			config["blocks"] = {str(block_size): timeBlocks(board, signal, SAMPLERATE, block_size) for block_size in block_sizes}
+
+			tracemalloc.start()
+			board(signal, SAMPLERATE)
+			config["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+			configs.append(config)
+
+	print("effect configurations (" + str(length) + " s tone, block sizes " + ", ".join(str(b) for b in block_sizes) + ")")
+	for config in configs:
+		label = " + ".join(config["effects"])
+		if len(config["effects"]) == 1:
+			label = label + " " + " ".join(str(v) for v in config["params"][label].values())
+		rtfs = " ".join(f"{config['blocks'][str(b)]['rtf']:7.4f}" for b in block_sizes)
+		print(f"  {label:<44} rtf {rtfs}  peak {config['peak_bytes'] / 1e6:6.2f} MB")
+	return {"samplerate": SAMPLERATE, "length": length, "block_sizes": list(block_sizes), "configs": configs}
+
+
+def benchmarkTelemetry(iterations=100000):
+	# Cost of the metrics on the hot paths (a counter increment, a histogram
+	# observation), of a debug message with logging at INFO against the
+	# prints Effect.nextParamValue used to make, and of exporting: rendering
+	# the text, writing the file and fetching it over HTTP
+	registry = Metrics()
+	counter = registry.counter("benchmark_total", "Benchmark counter")
+	histogram = registry.histogram("benchmark_seconds", "Benchmark histogram")
+	log = logging.getLogger("benchmark")
+	log.setLevel(logging.INFO)
+	values = np.random.default_rng(6).exponential(0.005, iterations).tolist()
+	results = {}
+
+	def printParam():
+		print('parameter: ')
+		print("decay")
+		print('parameter: ')
+		print([0.1, 0.3, 0.5])
+		print('parameter index: ')
+		print(2)
+
+	def timeOps(name, op, count):
+		start = time.perf_counter()
+		op(count)
+		results[name + "_ns"] = 1e9 * (time.perf_counter() - start) / count
+
+	def incs(count):
+		for i in range(count):
+			counter.inc()
+
+	def observes(count):
+		for value in values[:count]:
+			histogram.observe(value)
+
+	def debugs(count):
+		for i in range(count):
+			log.debug("parameter: %s %s index %s", "decay", [0.1, 0.3, 0.5], 2)
+
+	def prints(count):
+		with quiet():
+			for i in range(count):
+				printParam()
+
+	timeOps("counter inc", incs, iterations)
+	timeOps("histogram observe", observes, iterations)
+	timeOps("debug log disabled", debugs, iterations)
+	timeOps("old param prints", prints, iterations // 10)
+
+	# The AudioManager's metrics as well as the two above
+	enabledManager()
+	registry.metrics.update(metrics.metrics)
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		exporter = MetricsExporter(registry, os.path.join(tmp_dir, "soul.prom"), port=0)
+		exporter.start()
+		timeOps("render", lambda count: [registry.render() for i in range(count)], 1000)
+		timeOps("file write", lambda count: [exporter.write() for i in range(count)], 200)
+		url = "http://127.0.0.1:" + str(exporter.port) + "/metrics"
+		timeOps("http fetch", lambda count: [urllib.request.urlopen(url).read() for i in range(count)], 50)
+		body = urllib.request.urlopen(url).read().decode()
+		exporter.stop()
+	results["metrics"] = len(registry.metrics)
+	results["served_histogram"] = 'soul_benchmark_seconds_bucket{le="+Inf"} ' + str(iterations) in body
+
+	print(f"telemetry ({results['metrics']} metrics)")
+	for name in ("counter inc", "histogram observe", "debug log disabled", "old param prints", "render", "file write", "http fetch"):
+		value = results[name + "_ns"]
+		print(f"  {name:<20} {value / 1000.0:10.3f} us" if value >= 1e4 else f"  {name:<20} {value:10.1f} ns")
+	print(f"  endpoint serves the histogram: {results['served_histogram']}")
+	return results
+
+
+def benchmarkProfiler(block_size=256, length=4.0):
+	# Cost of per-plugin profiling on the live path (block by block through
+	# getProcessingBoard), with it off and on, against calling the board
+	# directly; and the per-plugin CPU% it reports
+	audio_manager = enabledManager()
+	signal = generateSignal(SAMPLERATE, length)
+	board = audio_manager.effects_board
+	runs = {
+		"board": lambda: board,
+		"profiling off": audio_manager.getProcessingBoard,
+		"profiling on": audio_manager.getProcessingBoard,
+	}
+	results = {}
+	outputs = {}
+	for name, getBoard in runs.items():
+		audio_manager.setProfiling(name == "profiling on")
+		board.reset()
+		blocks = []
+		start = time.perf_counter()
+		for block_start in range(0, signal.shape[1], block_size):
+			blocks.append(getBoard()(signal[:, block_start:block_start + block_size], SAMPLERATE, reset=False))
+		seconds = time.perf_counter() - start
+		outputs[name] = np.concatenate(blocks, axis=1)
+		results[name] = {"rtf": seconds / length}
+	results["plugins"] = audio_manager.getPluginStats()
+	results["max_sample_difference"] = float(np.abs(outputs["profiling on"] - outputs["board"]).max())
+	with quiet():
+		results["lcd"] = LCDManager(3, 2, 37, 35, 33, 31, 29, 23, hardware=HeadlessHardware()).neatLine("CPU%", audio_manager.profiler.getCpuSummary())
+	audio_manager.setProfiling(False)
+
+	print("per-plugin profiler (block size " + str(block_size) + ")")
+	for name in runs:
+		print(f"  {name:<16} rtf {results[name]['rtf']:.4f}")
+	for name, stats in results["plugins"].items():
+		print(f"  {name:<16} cpu p50 {stats['cpu_p50']:6.2f}%  p95 {stats['cpu_p95']:6.2f}%  p99 {stats['cpu_p99']:6.2f}%")
+	print(f"  LCD [{results['lcd']}]  max sample difference {results['max_sample_difference']}")
+	return results
+
+
+def benchmarkNumpyEffects(block_sizes=(64, 256, 1024, 4096), length=2.0, seed=3):
+	# The NumPy processors at their default settings on stereo noise. Also
+	# checks each is block-size independent: processed in blocks it must match
+	# processing the whole signal at once.
+	rng = np.random.default_rng(seed)
+	signal = (0.3 * rng.standard_normal((2, int(SAMPLERATE * length)))).astype(np.float32)
+	results = {}
+	print("NumPy effects (stereo, " + str(SAMPLERATE) + " Hz)")
+	print(f"  {'block size':<14} " + " ".join(f"{b:>7}" for b in block_sizes) + "   block error")
+	for processor_type in [Flanger, Echo, Phaser, Freeverb]:
+		processor = processor_type()
+		whole = processor(signal, SAMPLERATE)
+		blocks = {}
+		error = 0.0
+		for block_size in block_sizes:
+			blocks[str(block_size)] = timeBlocks(processor, signal, SAMPLERATE, block_size)
+			processor.reset()
+			chunked = np.concatenate([processor(signal[:, start:start + block_size], SAMPLERATE, reset=False)
+				for start in range(0, signal.shape[1], block_size)], axis=1)
+			error = max(error, float(np.abs(chunked - whole).max()))
+		name = processor_type.__name__
+		results[name] = {"blocks": blocks, "block_error": error}
+		rtfs = " ".join(f"{blocks[str(b)]['rtf']:7.4f}" for b in block_sizes)
+		print(f"  {name:<10} rtf {rtfs}   {error:.2e}")
+	return {"samplerate": SAMPLERATE, "length": length, "block_sizes": list(block_sizes), "processors": results}
+
+
+def benchmarkReference(length=0.5, block_size=256, reference_block_size=1024, seed=4, tolerance=1e-5):
+	# The NumPy processors against the sample-by-sample ports of the MATLAB
+	# designs, each in its own block size, on stereo noise. Includes a
+	# Flanger deeper than its base delay, which sweeps under one sample.
+	# Fails if any output differs from the reference by more than tolerance.
+	rng = np.random.default_rng(seed)
+	signal = (0.3 * rng.standard_normal((2, int(SAMPLERATE * length)))).astype(np.float32)
+	cases = {
+		"Echo": (Echo(delay_seconds=0.05), MatlabEcho(delay_seconds=0.05)),
+		"Flanger": (Flanger(), MatlabFlanger()),
+		"Flanger, deep": (Flanger(depth=60.0, rate_hz=5.0), MatlabFlanger(depth=60.0, rate_hz=5.0)),
+		"Freeverb": (Freeverb(), MatlabFreeverb()),
+	}
+	results = {}
+	print("NumPy effects against the MATLAB designs (stereo, " + str(SAMPLERATE) + " Hz)")
+	for name, (processor, reference) in cases.items():
+		expected = np.concatenate([reference.step(signal[:, start:start + reference_block_size].astype(np.float64), SAMPLERATE)
+			for start in range(0, signal.shape[1], reference_block_size)], axis=1)
+		out = np.concatenate([processor(signal[:, start:start + block_size], SAMPLERATE, reset=False)
+			for start in range(0, signal.shape[1], block_size)], axis=1)
+		error = float(np.abs(out - expected).max())
+		results[name] = error
+		print(f"  {name:<14} max difference {error:.2e}")
+		assert error < tolerance, name + " differs from the MATLAB design"
+	return {"samplerate": SAMPLERATE, "length": length, "max_difference": results}
+
+
+def benchmarkChains(chain_counts=(1, 2, 4, 8), block_size=512, length=2.0):
+	# Several instrument chains (each the full effect set, on its own input
+	# channel) mixed into the bus, inline on one thread vs on one worker per
+	# core. Real-time factor of the whole mix, and the speed-up.
+	audio_manager = enabledManager()
+	preset = audio_manager.getPreset()
+	cores = os.cpu_count() or 1
+	rng = np.random.default_rng(5)
+	results = {"cores": cores}
+	print(f"parallel chains (block size {block_size}, {cores} cores)")
+	for count in chain_counts:
+		signal = (0.2 * rng.standard_normal((count, int(SAMPLERATE * length)))).astype(np.float32)
+		with quiet():
+			chains = [audio_manager.addChain("chain " + str(i), preset, [i]) for i in range(count)]
+		result = {}
+		for label, workers in [("inline", 1), ("workers", cores)]:
+			with quiet():
+				mixer = ChainMixer(workers=workers)
+			mixer.setChains(chains)
+			mixer.reset()
+			start = time.perf_counter()
+			for block_start in range(0, signal.shape[1], block_size):
+				mixer(signal[:, block_start:block_start + block_size], SAMPLERATE, reset=False)
+			result[label] = (time.perf_counter() - start) / length
+			stats = mixer.getStats()
+			mixer.close()
+		result["chain_load_p50"] = {name: chain["load_p50"] for name, chain in stats["chains"].items()}
+		result["speedup"] = result["inline"] / result["workers"]
+		results[str(count)] = result
+		for chain in chains:
+			audio_manager.removeChain(chain.name)
+		print(f"  {count} chains  rtf inline {result['inline']:.4f}  workers {result['workers']:.4f}  speed-up {result['speedup']:.2f}x")
+	return results
+
+
+def headlessPedal(lcd_byte_seconds=0):
+	# main.py's managers and buttons on HeadlessHardware, sitting at the menu
+	hardware = HeadlessHardware(lcd_byte_seconds=lcd_byte_seconds)
+	with quiet():
+		audio_manager = AudioManager(effects_list, hardware=hardware)
+		lcd_manager = LCDManager(3, 2, 37, 35, 33, 31, 29, 23, hardware=hardware)
+		state_manager = StateManager(audio_manager, lcd_manager)
+		next_button = hardware.openButton(3)
+		select_button = hardware.openButton(2)
+		state_manager.changeState("hello", "hi :)")
+		state_manager.changeState("menu", "")
+	return hardware, audio_manager, lcd_manager, state_manager, next_button, select_button
+
+
+def benchmarkEvents(events=5000, seed=1):
+	# The full main.py state machine on HeadlessHardware, driven by a seeded
+	# random script of next/select presses as fast as it will go
+	hardware, audio_manager, lcd_manager, state_manager, next_button, select_button = headlessPedal()
+	next_button.when_pressed = state_manager.nextItemState
+	select_button.when_pressed = state_manager.selectItemState
+
+	script = random.Random(seed).choices([next_button, select_button], weights=[3, 1], k=events)
+	start_frames = lcd_manager.getFrames()
+	start_bytes = lcd_manager.getBusBytes()
+	start_bus_time = lcd_manager.getBusTime()
+	latencies = np.zeros(events)
+	start = time.perf_counter()
+	with quiet():
+		for i, button in enumerate(script):
+			press_start = time.perf_counter()
+			button.press()
+			latencies[i] = time.perf_counter() - press_start
+		audio_manager.stopAudioStream()
+	seconds = time.perf_counter() - start
+
+	# The old full redraw: clear, two cursor moves + 16 characters per row,
+	# and the final cursor move
+	frames = lcd_manager.getFrames() - start_frames
+	lcd_bytes = lcd_manager.getBusBytes() - start_bytes
+	full_redraw_bytes = frames * (2 * (1 + 16) + 1)
+	full_redraw_time = full_redraw_bytes * LCD_BYTE_SECONDS + frames * LCD_CLEAR_SECONDS
+
+	results = {
+		"events": events,
+		"events_per_second": events / seconds,
+		"press_p50_ms": 1000.0 * float(np.percentile(latencies, 50)),
+		"press_p99_ms": 1000.0 * float(np.percentile(latencies, 99)),
+		"press_max_ms": 1000.0 * float(latencies.max()),
+		"lcd_bytes_per_press": lcd_bytes / events,
+		"lcd_ms_per_press": 1000.0 * (lcd_manager.getBusTime() - start_bus_time) / events,
+		"full_redraw_bytes_per_press": full_redraw_bytes / events,
+		"full_redraw_ms_per_press": 1000.0 * full_redraw_time / events,
+	}
+	print("headless state machine (" + str(events) + " scripted presses)")
+	print(f"  {results['events_per_second']:10.0f} events/s  p50 {results['press_p50_ms']:.3f} ms  p99 {results['press_p99_ms']:.3f} ms  max {results['press_max_ms']:.1f} ms")
+	print(f"  LCD bus per press: {results['lcd_bytes_per_press']:.1f} bytes, ~{results['lcd_ms_per_press']:.2f} ms (full redraw: {results['full_redraw_bytes_per_press']:.1f} bytes, ~{results['full_redraw_ms_per_press']:.2f} ms)")
+	print("  display:")
+	for line in hardware.display.getLines():
+		print("    |" + line + "|")
+	return results
+
+
+def benchmarkController(presses=400, interval=0.005, lcd_byte_seconds=200e-6, seed=2):
+	# Press-to-display latency under rapid input (one press every interval
+	# seconds) on a display as slow as the Pi's LCD bus: callbacks handling
+	# everything inline, as main.py used to, vs the asyncio Controller
+	script = random.Random(seed).choices(["next", "select"], weights=[3, 1], k=presses)
+	results = {}
+
+	# Inline: each press waits for the previous one's LCD writes and board work
+	hardware, audio_manager, lcd_manager, state_manager, next_button, select_button = headlessPedal(lcd_byte_seconds)
+	latencies = np.zeros(presses)
+	with quiet():
+		start = time.perf_counter()
+		for i, event in enumerate(script):
+			due = start + i * interval
+			delay = due - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+			if event == "next":
+				state_manager.nextItemState()
+			else:
+				state_manager.selectItemState()
+			latencies[i] = time.perf_counter() - due
+	results["inline"] = {
+		"latency_p50_ms": 1000.0 * float(np.percentile(latencies, 50)),
+		"latency_p95_ms": 1000.0 * float(np.percentile(latencies, 95)),
+		"latency_p99_ms": 1000.0 * float(np.percentile(latencies, 99)),
+		"latency_max_ms": 1000.0 * float(latencies.max()),
+	}
+
+	# Controller: presses are queued, frames coalesced, board work off-thread
+	hardware, audio_manager, lcd_manager, state_manager, next_button, select_button = headlessPedal(lcd_byte_seconds)
+	with quiet():
+		controller = Controller(state_manager, debounce=0)
+
+	async def feed():
+		controller.start()
+		controller.attach(next_button, select_button)
+		buttons = {"next": next_button, "select": select_button}
+		start = time.perf_counter()
+		for i, event in enumerate(script):
+			delay = start + i * interval - time.perf_counter()
+			if delay > 0:
+				await asyncio.sleep(delay)
+			buttons[event].press()
+		await controller.idle()
+
+	with quiet():
+		asyncio.run(feed())
+	controller.close()
+	results["controller"] = controller.getStats()
+
+	print(f"press-to-display latency ({presses} presses every {interval * 1000:.0f} ms, {lcd_byte_seconds * 1e6:.0f} us/LCD byte)")
+	for name, stats in results.items():
+		print(f"  {name:<12} p50 {stats['latency_p50_ms']:8.2f} ms  p95 {stats['latency_p95_ms']:8.2f} ms  p99 {stats['latency_p99_ms']:8.2f} ms  max {stats['latency_max_ms']:8.2f} ms")
+	return results
+
+
+def benchmarkScreens(selects=200, lcd_byte_seconds=200e-6, undo_steps=64):
+	# Select-to-render on an effect's param rows: the old path rebuilt and
+	# drew the whole modify screen, then drew it again at the chosen row; now
+	# only the changed row is redone. Also entering an effect's screen with
+	# the cache cold and warm, and undoing a run of edits in one batch
+	# against one board update per edit.
+	hardware, audio_manager, lcd_manager, state_manager, next_button, select_button = headlessPedal(lcd_byte_seconds)
+	effect_num = 0
+	effect = state_manager.menu_array[effect_num]
+	rows = len(audio_manager.getEffectObj(effect).getParamNames())
+	results = {}
+
+	def legacySelect():
+		audio_manager.nextEffectParam(state_manager.menu_num, state_manager.modify_num - 2)
+		state_manager.screens.clear()
+		state_manager.setModify(effect)
+		state_manager.showLines(state_manager.modify_array, state_manager.modify_num)
+		state_manager.updateBoard()
+
+	with quiet():
+		state_manager.menu_num = effect_num
+		state_manager.changeState("modify", effect)
+		for name, select in (("select rebuild", legacySelect), ("select cached", state_manager.selectItemState)):
+			latencies = np.zeros(selects)
+			for i in range(selects):
+				state_manager.modify_num = 2 + i % rows
+				start = time.perf_counter()
+				select()
+				latencies[i] = time.perf_counter() - start
+			results[name] = latencies
+
+		for name in ("enter cold", "enter warm"):
+			latencies = np.zeros(selects)
+			for i in range(selects):
+				if name == "enter cold":
+					state_manager.screens.clear()
+				start = time.perf_counter()
+				state_manager.setModify(effect)
+				latencies[i] = time.perf_counter() - start
+			results[name] = latencies
+
+		audio_manager.edit_log.clear()
+		for i in range(undo_steps):
+			audio_manager.nextEffectParam(effect_num, i % rows)
+		start = time.perf_counter()
+		for i in range(undo_steps):
+			audio_manager.undoEdits(1)
+			audio_manager.updateBoard()
+		results["undo one by one"] = np.array([time.perf_counter() - start])
+		audio_manager.redoEdits(undo_steps)
+		audio_manager.updateBoard()
+		start = time.perf_counter()
+		audio_manager.undoEdits(undo_steps)
+		audio_manager.updateBoard()
+		results["undo batch"] = np.array([time.perf_counter() - start])
+
+	print(f"select-to-render on {effect} ({selects} selects, {lcd_byte_seconds * 1e6:.0f} us/LCD byte), undo of {undo_steps} edits")
+	for name, latencies in results.items():
+		print(f"  {name:<16} p50 {1000.0 * float(np.percentile(latencies, 50)):8.3f} ms  p95 {1000.0 * float(np.percentile(latencies, 95)):8.3f} ms")
+	return {name: {"p50_ms": 1000.0 * float(np.percentile(latencies, 50)), "p95_ms": 1000.0 * float(np.percentile(latencies, 95))} for name, latencies in results.items()}
+
+
+def runLooperSession(audio_manager, looper, signal, block_size, blocks, record_blocks, press_blocks, clear_blocks, latencies=None):
+	# The live stream's block loop with the looper in it, pressed on a
+	# schedule: after each clear, one long recording, then overdub and play
+	# in turns
+	board = audio_manager.effects_board
+	param_control = audio_manager.param_control
+	out = np.zeros((2, block_size), dtype=np.float32)
+	positions = signal.shape[1] // block_size
+	for i in range(blocks):
+		cycle = i % clear_blocks
+		if cycle == 0:
+			looper.clear()
+			looper.press()
+		elif cycle == record_blocks or (cycle > record_blocks and (cycle - record_blocks) % press_blocks == 0):
+			looper.press()
+		position = (i % positions) * block_size
+		audio_in = signal[:, position:position + block_size]
+		start = time.perf_counter()
+		board_in = looper.processInput(audio_in)
+		frames = param_control.process(board, board_in, SAMPLERATE, out)
+		looper.processOutput(out, frames)
+		if latencies is not None:
+			latencies[i] = time.perf_counter() - start
+
+
+def benchmarkLooper(minutes=20.0, block_size=256, ring_seconds=10.0, record_seconds=15.0, press_seconds=3.0, clear_seconds=300.0,
+		max_traced_peak=64e3):
+	# Long looper sessions on the live stream's block loop, through the full
+	# effect chain, looping the input and the output: block time with the
+	# looper in, resident memory and Python allocations while it runs, and
+	# whether the background saves match the loop. Recordings run past the
+	# ring so the loop wraps, and overdubs are shorter than the loop so they
+	# cross its end. Fails if a saved loop doesn't match or the block loop's
+	# traced peak passes max_traced_peak bytes.
+	audio_manager = enabledManager()
+	signal = (0.02 * np.random.default_rng(5).standard_normal((1, int(SAMPLERATE)))).astype(np.float32)
+	blocks = int(minutes * 60 * SAMPLERATE) // block_size
+	schedule = [int(seconds * SAMPLERATE) // block_size for seconds in (record_seconds, press_seconds, clear_seconds)]
+	results = {}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		for source in ("input", "output"):
+			with quiet():
+				looper = Looper(ring_seconds, SAMPLERATE, loop_dir=os.path.join(tmp_dir, source), flush_seconds=0.05)
+			looper.prepare(SAMPLERATE, block_size, 1)
+			looper.setSource(source)
+			latencies = np.zeros(blocks)
+			looper.startSaver()
+			seconds, rise = peakResident(lambda: runLooperSession(audio_manager, looper, signal, block_size, blocks, *schedule, latencies))
+			# close() ends and saves the pass in flight
+			looper.close()
+
+			# Allocations on the block loop over one record/overdub cycle,
+			# with the saver stopped so only the block loop is traced
+			tracemalloc.start()
+			runLooperSession(audio_manager, looper, signal, block_size, schedule[0] + 4 * schedule[1], *schedule)
+			peak = tracemalloc.get_traced_memory()[1]
+			tracemalloc.stop()
+			looper.stop()
+			looper.processInput(signal[:, :block_size])
+			looper.flush()
+			expected = looper.ring[:looper.num_channels, (looper.start + np.arange(looper.length)) % looper.capacity]
+			with openWav(looper.loop_file) as f:
+				saved = f.read(0, f.frames).copy()
+			results[source] = {
+				"seconds": seconds,
+				"realtime_factor": blocks * block_size / SAMPLERATE / seconds,
+				"block_p50_us": 1e6 * float(np.percentile(latencies, 50)),
+				"block_p99_us": 1e6 * float(np.percentile(latencies, 99)),
+				"block_max_us": 1e6 * float(latencies.max()),
+				"rss_rise_bytes": rise,
+				"traced_peak_bytes": peak,
+				"passes": looper.passes,
+				"flushes": looper.flushes,
+				# Within int16 rounding
+				"saved_matches": saved.shape == expected.shape and bool(np.abs(saved - expected).max() <= 2.0 / 32767),
+			}
+
+	print(f"looper sessions ({minutes:g} min each, {block_size}-frame blocks, {ring_seconds:g} s ring)")
+	for source, stats in results.items():
+		print(f"  {source:<7} {stats['realtime_factor']:7.0f}x realtime  block p50 {stats['block_p50_us']:7.1f} us  p99 {stats['block_p99_us']:7.1f} us  max {stats['block_max_us']:8.1f} us")
+		print(f"          rss rise {stats['rss_rise_bytes'] / 1e6:6.1f} MB  traced peak {stats['traced_peak_bytes'] / 1e3:6.1f} kB  {stats['passes']} passes, {stats['flushes']} saved, saved loop matches: {stats['saved_matches']}")
+	for source, stats in results.items():
+		assert stats["saved_matches"], "the saved " + source + " loop doesn't match the ring"
+		assert stats["traced_peak_bytes"] <= max_traced_peak, "the " + source + " looper allocates on the block loop"
+	return results
+
+
+def benchmarkPlayback(audio_file="emily.wav", iterations=5):
+	# Time to first sound for a preview. The old path had to render the whole
+	# file and write it out before pygame could load it; now the first block
+	# plays from memory while the rest renders.
+	results = {}
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		audio_manager = enabledManager()
+		samples = audio_manager.sample_store.getSamples(audio_file, SAMPLERATE)
+		start = time.perf_counter()
+		for i in range(iterations):
+			with AudioFile(os.path.join(tmp_dir, "preview.wav"), "w", SAMPLERATE, samples.shape[0]) as f:
+				f.write(audio_manager.buildPreviewBoard()(samples, SAMPLERATE))
+		results["render then play"] = (time.perf_counter() - start) / iterations
+
+	for save in (False, True):
+		name = "first sound, save" if save else "first sound"
+		timings = np.zeros(iterations)
+		for i in range(iterations):
+			# A new chain each time so nothing comes from the render cache
+			audio_manager.effects_array[1].param_indices[1] = i % 10
+			audio_manager.updateBoard()
+			take = audio_manager.applyEffects(audio_file, save=save)
+			while take.first_sound_at is None:
+				time.sleep(0.0005)
+			timings[i] = take.first_sound_at - take.requested_at
+		results[name] = float(np.median(timings))
+
+	take = audio_manager.applyEffects(audio_file)
+	while take.first_sound_at is None:
+		time.sleep(0.0005)
+	results["first sound, cached"] = take.first_sound_at - take.requested_at
+	# Saves keep rendering after their playback is cut off
+	while audio_manager.saving:
+		time.sleep(0.001)
+	audio_manager.playback.close()
+
+	print("preview time to first sound (" + audio_file + ")")
+	for name, seconds in results.items():
+		print(f"  {name:<20} {seconds * 1e3:10.2f} ms")
+	return results
+
+
+benchmarks = {
+	"update": benchmarkUpdateBoard,
+	"presets": benchmarkPresets,
+	"tempo": benchmarkTempo,
+	"automation": benchmarkAutomation,
+	"render": benchmarkRender,
+	"samples": benchmarkSampleStore,
+	"wav": benchmarkWav,
+	"batch": benchmarkBatch,
+	"negotiation": benchmarkNegotiation,
+	"effects": benchmarkEffects,
+	"numpy": benchmarkNumpyEffects,
+	"reference": benchmarkReference,
+	"profiler": benchmarkProfiler,
+	"telemetry": benchmarkTelemetry,
+	"chains": benchmarkChains,
+	"looper": benchmarkLooper,
+	"events": benchmarkEvents,
+	"controller": benchmarkController,
+	"screens": benchmarkScreens,
+	"playback": benchmarkPlayback,
+}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark the SOUL audio engine")
+	parser.add_argument("names", nargs="*", help="benchmarks to run: " + ", ".join(benchmarks) + " (default: all)")
+	parser.add_argument("--json", help="write the results to this file")
+	args = parser.parse_args()
+	for name in args.names:
+		if name not in benchmarks:
+			parser.error("unknown benchmark: " + name)
+
+	results = {
+		"meta": {
+			"time": time.time(),
+			"python": platform.python_version(),
+			"machine": platform.machine(),
+			"platform": platform.platform(),
+			"pedalboard": pedalboard.__version__,
+		},
+	}
+	for name in args.names or list(benchmarks):
+		results[name] = benchmarks[name]()
+
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(results, f, indent=2)
+		print("Wrote " + args.json)
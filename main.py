@@ -1,10 +1,17 @@
+import asyncio
+import sys
+import threading
 import time
-from gpiozero import Button
 
-from AudioManager import AudioManager
-from LCDManager import LCDManager
-from StateManager import StateManager
-from Effect import Effect
+from StartupTrace import StartupTrace
+
+# Only what the greeting and buttons need is imported up front; the audio
+# engine (pedalboard, numpy, devices, presets) warms up on a background thread
+trace = StartupTrace()
+with trace.phase("import hardware + LCD"):
+	from Hardware import PiHardware, HeadlessHardware
+	from LCDManager import LCDManager
+	from Telemetry import MetricsExporter, setupLogging
 
 # Initialize ===========================================================
 next_button_pin = 3
@@ -16,48 +23,136 @@ data_5_pin = 31
 data_6_pin = 29
 data_7_pin = 23
 
-effects_list = ["Chorus", "Delay", "Reverb", "Compressor"]
-
-# Manager objects
-audio_manager = AudioManager(effects_list)
-lcd_manager = LCDManager(next_button_pin, select_button_pin, rs_pin, enable_pin, 
-				data_4_pin, data_5_pin, data_6_pin, data_7_pin)
-state_manager = StateManager(audio_manager, lcd_manager)
-
-# Buttons
-next_button = Button(3); # next-button connected to GPIO2
-select_button = Button(2); # select-button connected to GPIO3
-button_pressing = 0
-
-# Functions ============================================================
-def nextItem():
-	global button_pressing
-	button_pressing = button_pressing + 1
-	if button_pressing == 1:
-		state_manager.nextItemState()
-		button_pressing = 0
-			
-def selectItem():
-	global button_pressing
-	button_pressing = button_pressing + 1
-	if button_pressing == 1:
-		state_manager.selectItemState()
-		time.sleep(1)
-		button_pressing = 0
+effects_list = ["Chorus", "Delay", "Reverb", "Compressor", "Flanger", "Echo", "Phasor", "Freeverb"]
+demo_files = ["sine.wav", "emily.wav"]
 
-# Program ==============================================================
-state_manager.changeState("hello", "hi :)")
-time.sleep(2)
-state_manager.changeState("menu", "")
+# --headless runs on fake LCD/buttons/audio devices (no Pi needed)
+headless = "--headless" in sys.argv
+if headless:
+	hardware = HeadlessHardware()
+else:
+	hardware = PiHardware()
 
-# Set the button press functions
-next_button.when_pressed = nextItem
-select_button.when_pressed = selectItem
+# --debug shows the debug messages as well
+setupLogging("DEBUG" if "--debug" in sys.argv else "INFO")
 
-while True:
-	time.sleep(2)
+USAGE = "usage: main.py [--headless] [--debug] [--metrics-file PATH] [--metrics-port N]"
 
-# Proper GPIO cleanup to release pins after usage
-lcd_manager.cleanGPIO()
+def optionValue(option, convert):
+	# The value given after option, or None if the option isn't there
+	if option not in sys.argv:
+		return None
+	i = sys.argv.index(option) + 1
+	try:
+		if i >= len(sys.argv) or sys.argv[i].startswith("--"):
+			raise ValueError("missing value")
+		return convert(sys.argv[i])
+	except ValueError:
+		sys.exit(USAGE + "\n" + option + " needs a value")
+
+# Metrics are only exported when asked for: --metrics-file PATH rewrites
+# them to PATH every few seconds, --metrics-port N serves them at
+# http://127.0.0.1:N/metrics
+metrics_file = optionValue("--metrics-file", str)
+metrics_port = optionValue("--metrics-port", int)
+exporter = MetricsExporter(metrics_file=metrics_file, port=metrics_port)
+
+# Greeting first
+with trace.phase("LCD init"):
+	lcd_manager = LCDManager(next_button_pin, select_button_pin, rs_pin, enable_pin, 
+					data_4_pin, data_5_pin, data_6_pin, data_7_pin, hardware=hardware)
+with trace.phase("greeting"):
+	lcd_manager.setHello()
+trace.mark("greeting shown")
+
+# Buttons. Presses made while the engine warms up are kept and replayed, in
+# order and ahead of any made after the controller takes the buttons over.
+with trace.phase("buttons"):
+	next_button = hardware.openButton(next_button_pin); # next-button connected to GPIO2
+	select_button = hardware.openButton(select_button_pin); # select-button connected to GPIO3
+early_presses = []
+early_lock = threading.Lock()
+press_controller = None
 
+def earlyPress(event):
+	pressed_at = time.perf_counter()
+	with early_lock:
+		if press_controller is None:
+			early_presses.append((event, pressed_at))
+			return
+	# Raced the takeover: the replay has been posted already
+	press_controller.post(event, pressed_at)
 
+next_button.when_pressed = lambda: earlyPress("next")
+select_button.when_pressed = lambda: earlyPress("select")
+
+def warmUp():
+	# Runs on a worker thread while the greeting is up
+	with trace.phase("import audio engine"):
+		from AudioManager import AudioManager
+		from Controller import Controller
+		from PresetManager import PresetManager
+		from StateManager import StateManager
+	with trace.phase("AudioManager init"):
+		audio_manager = AudioManager(effects_list, hardware=hardware)
+	with trace.phase("preload samples"):
+		audio_manager.preloadSamples(demo_files)
+	with trace.phase("presets"):
+		preset_manager = PresetManager(audio_manager)
+	with trace.phase("device scan"):
+		audio_manager.io_manager.waitForDevices()
+	state_manager = StateManager(audio_manager, lcd_manager, preset_manager)
+	
+	# Scripted presses from stdin arrive faster than any bounce
+	if headless:
+		controller = Controller(state_manager, debounce=0)
+	else:
+		controller = Controller(state_manager)
+	return state_manager, controller
+
+# Program ==============================================================
+async def run():
+	global press_controller
+	loop = asyncio.get_running_loop()
+	warm_up = loop.run_in_executor(None, warmUp)
+	# The greeting stays up for at least 2 s, as it always has
+	await asyncio.sleep(2)
+	state_manager, controller = await warm_up
+	state_manager.changeState("menu", "")
+	trace.mark("menu shown")
+	trace.report()
+	exporter.start()
+	
+	# Button presses go through the controller's queue from here on. The
+	# early ones are posted and the buttons handed over under one lock, so
+	# none is lost or overtaken.
+	controller.start()
+	with early_lock:
+		for event, pressed_at in early_presses:
+			controller.post(event, pressed_at)
+		early_presses.clear()
+		press_controller = controller
+		controller.attach(next_button, select_button)
+	
+	if headless:
+		# Drive the buttons from stdin: one "n" (next) or "s" (select) per line
+		loop = asyncio.get_running_loop()
+		while True:
+			command = await loop.run_in_executor(None, sys.stdin.readline)
+			if not command:
+				break
+			match command.strip():
+				case "n":
+					next_button.press()
+				case "s":
+					select_button.press()
+			await controller.idle()
+			print(hardware.display)
+	else:
+		await asyncio.Event().wait()
+
+asyncio.run(run())
+
+# Proper GPIO cleanup to release pins after usage
+exporter.stop()
+lcd_manager.cleanGPIO()